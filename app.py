@@ -101,7 +101,8 @@ def get_examples(validator_type):
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Request, render_template, request, jsonify, send_file, url_for, g, got_request_exception
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.utils import secure_filename
 import os
 import json
@@ -110,18 +111,117 @@ import mimetypes
 from datetime import datetime
 import io
 import uuid
-from pda_engine import PDA
+import shutil
+import time
+from pda_batch import iter_batch, runs_in_process, file_cache_input, BatchStatistics, DEFAULT_WORKERS, DEFAULT_FILE_TIMEOUT
+from pda_bulk import validate_filenames, kernel_name
+from pda_jobs import JobManager, JobQueueFull, DEFAULT_JOB_WORKERS, DEFAULT_JOB_QUEUE, DEFAULT_JOB_TTL
+from pda_cache import get_cache, digest
+from pda_engine import PDA, check_filename_fast_path
+from pda_files import read_file_content, validate_content, stream_validate_file
+from pda_incremental import EditSession, INCREMENTAL_TRACE_LEVELS
+from pda_metrics import get_metrics
+from pda_profiling import RequestProfiler, ProfileError, PROFILE_HEADER, DEFAULT_PROFILE_DIR, DEFAULT_MAX_PROFILES, DEFAULT_TOP_FUNCTIONS
+from pda_uploads import Upload, UploadStore, StreamingXMLCheck, HEAD_BYTES, SPOOL_MAX_BYTES, DEFAULT_MEMORY_BYTES as UPLOAD_MEMORY_BYTES
+from pda_rules import get_rules, install_reload_signal
+from pda_state import SharedState, SharedTraceStore, SharedSessionStore, DEFAULT_STATE_TRACE_STEPS
+from pda_trace import TraceBase, TraceStore, TRACE_LEVELS, DEFAULT_TRACE_TTL, DEFAULT_MAX_TRACES
 import traceback
 
+
+class PDAJSONProvider(DefaultJSONProvider):
+    """JSON provider that expands compact PDA traces into step lists"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, TraceBase):
+            return o.to_list()
+        return DefaultJSONProvider.default(o)
+
+
+class PDARequest(Request):
+    """Request that spools /upload file parts into Upload objects as they are parsed"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint != 'upload_file':
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return new_upload(filename or '')
+
+
 app = Flask(__name__)
+app.json = PDAJSONProvider(app)
+app.request_class = PDARequest
 
 # Konfigurasi upload file
 app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB max file size
 app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()
-app.config['ALLOWED_EXTENSIONS'] = {
-    'txt', 'pdf', 'doc', 'docx', 'xls', 'xlsx', 
-    'jpg', 'jpeg', 'png', 'gif', 'xml', 'html', 'htm', 'json'
-}
+app.config['STREAM_BLOCK_SIZE'] = 64 * 1024  # Block size for streamed validation
+app.config['BATCH_WORKERS'] = int(os.environ.get('PDA_BATCH_WORKERS', DEFAULT_WORKERS))  # Process pool size
+app.config['BATCH_FILE_TIMEOUT'] = float(os.environ.get('PDA_BATCH_TIMEOUT', DEFAULT_FILE_TIMEOUT))  # Seconds per file
+app.config['JOB_WORKERS'] = int(os.environ.get('PDA_JOB_WORKERS', DEFAULT_JOB_WORKERS))  # Concurrent batch jobs
+app.config['JOB_QUEUE_LIMIT'] = int(os.environ.get('PDA_JOB_QUEUE', DEFAULT_JOB_QUEUE))  # Max pending batch jobs
+app.config['JOB_TTL'] = int(os.environ.get('PDA_JOB_TTL', DEFAULT_JOB_TTL))  # Seconds finished jobs are kept
+app.config['TRACE_PAGE_SIZE'] = int(os.environ.get('PDA_TRACE_PAGE_SIZE', 500))  # History steps per response page
+app.config['TRACE_MAX_PAGE_SIZE'] = 5000  # Largest page a client may ask for
+app.config['UPLOAD_SPOOL_BYTES'] = int(os.environ.get('PDA_UPLOAD_SPOOL_BYTES', SPOOL_MAX_BYTES))  # Uploads kept in memory up to this size
+app.config['UPLOAD_MEMORY_BYTES'] = int(os.environ.get('PDA_UPLOAD_MEMORY_BYTES', UPLOAD_MEMORY_BYTES))  # Memory for all spooled uploads
+app.config['TRACE_TTL'] = int(os.environ.get('PDA_TRACE_TTL', DEFAULT_TRACE_TTL))  # Seconds an idle trace is kept
+app.config['PROFILE_DIR'] = os.environ.get('PDA_PROFILE_DIR', DEFAULT_PROFILE_DIR)  # Where request profiles are written
+app.config['PROFILE_TOKEN'] = os.environ.get('PDA_PROFILE_TOKEN')  # X-PDA-Profile value that profiles a request
+app.config['PROFILE_SAMPLE_EVERY'] = int(os.environ.get('PDA_PROFILE_SAMPLE_EVERY', 0))  # Profile 1 in N requests, 0 = off
+app.config['PROFILE_MAX'] = int(os.environ.get('PDA_PROFILE_MAX', DEFAULT_MAX_PROFILES))  # Profiles kept before the oldest are removed
+app.config['EDIT_SESSION_TTL'] = int(os.environ.get('PDA_EDIT_SESSION_TTL', 600))  # Seconds an idle edit session is kept
+app.config['EDIT_SESSION_MAX'] = int(os.environ.get('PDA_EDIT_SESSION_MAX', 64))  # Edit sessions kept, each holds its text
+app.config['STATE_PATH'] = os.environ.get('PDA_STATE_PATH') or None  # SQLite file sharing traces, sessions and jobs between workers
+app.config['STATE_TRACE_STEPS'] = int(os.environ.get('PDA_STATE_TRACE_STEPS', DEFAULT_STATE_TRACE_STEPS))  # Trace steps kept in STATE_PATH
+
+# Uploaded files, in memory or spilled to UPLOAD_FOLDER
+uploads = UploadStore(max_memory=app.config['UPLOAD_MEMORY_BYTES'])
+
+# Traces, edit sessions and job progress live in this process unless
+# PDA_STATE_PATH names a file shared with the other workers
+state = SharedState(app.config['STATE_PATH']) if app.config['STATE_PATH'] else None
+
+# Long traces kept for /trace paging
+if state is not None:
+    traces = SharedTraceStore(state, ttl=app.config['TRACE_TTL'], max_traces=DEFAULT_MAX_TRACES,
+                              max_steps=app.config['STATE_TRACE_STEPS'])
+else:
+    traces = TraceStore(ttl=app.config['TRACE_TTL'])
+
+# Texts validated incrementally, with their checkpoints, by session token
+if state is not None:
+    edit_sessions = SharedSessionStore(state, ttl=app.config['EDIT_SESSION_TTL'], max_sessions=app.config['EDIT_SESSION_MAX'])
+else:
+    edit_sessions = TraceStore(ttl=app.config['EDIT_SESSION_TTL'], max_traces=app.config['EDIT_SESSION_MAX'])
+
+# Background batch jobs
+jobs = JobManager(
+    max_workers=app.config['JOB_WORKERS'],
+    max_queued=app.config['JOB_QUEUE_LIMIT'],
+    ttl=app.config['JOB_TTL'],
+    state=state
+)
+
+# Request and validation metrics for /metrics, shared between workers via PDA_METRICS_DIR
+metrics = get_metrics()
+
+# Opt-in cProfile capture, see /profiles
+profiler = RequestProfiler(
+    directory=app.config['PROFILE_DIR'],
+    token=app.config['PROFILE_TOKEN'],
+    sample_every=app.config['PROFILE_SAMPLE_EVERY'],
+    max_profiles=app.config['PROFILE_MAX']
+)
+
+# Untraced filename checks use a compiled pattern; tests/test_filename_fast_path.py
+# keeps it in line with the PDA, PDA_CHECK_FILENAME_FAST_PATH=1 also checks at startup
+filename_mismatches = check_filename_fast_path() if os.environ.get('PDA_CHECK_FILENAME_FAST_PATH') else []
+if filename_mismatches:
+    app.logger.error(
+        f"Filename fast path disagrees with the PDA on {len(filename_mismatches)} names "
+        f"(first: {filename_mismatches[0][0]!r}), using the PDA for every filename"
+    )
 
 # Validator examples
 VALIDATOR_EXAMPLES = {
@@ -166,32 +266,27 @@ VALIDATOR_INFO = {
     'filename': {
         'name': 'Validasi Nama File',
         'description': 'Validasi format nama file: huruf, angka, underscore, ekstensi pdf/docx/xlsx',
-        'icon': 'fa-file',
-        'supported_files': ['.pdf', '.docx', '.xlsx', '.txt', '.jpg', '.png', '.xml', '.html']
+        'icon': 'fa-file'
     },
     'content': {
         'name': 'Validasi Isi File',
-        'description': 'Validasi konten berdasarkan header/format file (PDF: %PDF, DOCX: PK, TXT: huruf/angka)',
-        'icon': 'fa-file-alt',
-        'supported_files': ['.pdf', '.docx', '.txt', '.xml', '.html']
+        'description': 'Validasi konten berdasarkan signature byte awal/akhir file (PDF: %PDF, DOCX: PK, PNG, JPEG, GIF, XML, BOM, TXT: huruf/angka); file DOCX/XLSX/PPTX diperiksa lewat central directory ZIP, file PDF lewat startxref dan tabel xref',
+        'icon': 'fa-file-alt'
     },
     'filetype': {
         'name': 'Validasi Tipe File',
         'description': 'Validasi ekstensi file berdasarkan kategori (PDF, DOC/DOCX, Gambar, Spreadsheet)',
-        'icon': 'fa-file-code',
-        'supported_files': ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.jpg', '.jpeg', '.png', '.gif', '.txt', '.xml', '.html']
+        'icon': 'fa-file-code'
     },
     'xml': {
         'name': 'Validasi XML/HTML',
         'description': 'Validasi struktur tag XML/HTML yang cocok (tag pembuka dan penutup)',
-        'icon': 'fa-code',
-        'supported_files': ['.xml', '.html', '.htm', '.txt']
+        'icon': 'fa-code'
     },
     'multilevel': {
         'name': 'Validasi Multi-Level',
         'description': 'Validasi nama file, format, dan struktur dokumen sekaligus',
-        'icon': 'fa-layer-group',
-        'supported_files': ['.xml', '.html', '.txt', '.pdf', '.docx']
+        'icon': 'fa-layer-group'
     }
 }
 
@@ -199,7 +294,14 @@ VALIDATOR_INFO = {
 # Helper functions
 def allowed_file(filename):
     """Check if file extension is allowed"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in get_rules().allowed_extensions
+
+
+def get_validator_info(validator_type):
+    """Validator info merged with its supported files from the rule registry"""
+    info = dict(VALIDATOR_INFO[validator_type])
+    info['supported_files'] = list(get_rules().supported_files.get(validator_type, ()))
+    return info
 
 
 def get_file_info(filepath):
@@ -220,70 +322,260 @@ def get_file_info(filepath):
     }
 
 
-def read_file_content(filepath, max_chars=5000):
-    """Read file content with safety limits"""
-    try:
-        # Check if it's a binary file
-        with open(filepath, 'rb') as f:
-            first_bytes = f.read(1024)
-        
-        # Try to decode as text if it seems like text
-        try:
-            # Check common text encodings
-            for encoding in ['utf-8', 'latin-1', 'ascii']:
-                try:
-                    with open(filepath, 'r', encoding=encoding, errors='ignore') as f:
-                        content = f.read(max_chars)
-                    return content, 'text'
-                except:
-                    continue
+def new_upload(filename):
+    """Empty Upload with a unique name in the upload folder"""
+    filename = secure_filename(filename)
+    unique_id = str(uuid.uuid4())[:8]
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    unique_filename = f"{timestamp}_{unique_id}_{filename}"
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
+    
+    # XML is checked while the body is still being received
+    consumers = []
+    if filename.lower().endswith('.xml'):
+        consumers.append(StreamingXMLCheck(*get_trace_options({}, default='windowed')))
+    return Upload(unique_id, filepath, spool_max=app.config['UPLOAD_SPOOL_BYTES'], consumers=consumers)
+
+
+def get_upload_info(upload):
+    """File information for an upload, without touching the disk"""
+    filename = os.path.basename(upload.path)
+    timestamp = datetime.fromtimestamp(upload.created).isoformat()
+    
+    return {
+        'name': filename,
+        'size': upload.size,
+        'modified': timestamp,
+        'created': timestamp,
+        'extension': os.path.splitext(filename)[1].lower(),
+        'mime_type': mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        'stored': 'memory' if upload.in_memory else 'disk'
+    }
+
+
+def read_upload_content(upload):
+    """read_file_content for an upload, served from its head when it was spilled"""
+    if upload.in_memory:
+        return read_file_content(upload.source())
+    content, content_type = read_file_content(upload.head)
+    if content_type == 'text' and len(content) < 5000 and upload.size > HEAD_BYTES:
+        # Undecodable bytes left the head short of the preview length
+        return read_file_content(upload.path)
+    return content, content_type
+
+
+def get_file_source(file_info):
+    """(source, content digest) for an uploaded file, or None if it is gone.
+    
+    The source is the file's bytes while the upload is held in memory and
+    its path otherwise.
+    """
+    filepath = file_info.get('path', '')
+    upload = uploads.get_by_path(filepath)
+    if upload is not None:
+        return upload.source(), upload.digest
+    if os.path.exists(filepath):
+        return filepath, None
+    return None
+
+
+def cache_streamed_xml(upload, content):
+    """Cache the XML check run while an upload was received, keyed as /process-upload looks it up"""
+    for check in upload.consumers:
+        if isinstance(check, StreamingXMLCheck):
+            is_valid, history = check.finish()
+            result = pda_result(check.pda, is_valid, history)
+            result['input_text'] = content[:500]
             
-            # If not text, check for specific binary signatures
-            if first_bytes.startswith(b'%PDF'):
-                return 'PDF_FILE_SIGNATURE_DETECTED', 'binary'
-            elif first_bytes.startswith(b'PK'):
-                return 'ZIP_FILE_SIGNATURE_DETECTED (DOCX/XLSX)', 'binary'
-            elif first_bytes.startswith(b'\xff\xd8\xff'):
-                return 'JPEG_FILE_SIGNATURE_DETECTED', 'binary'
-            elif first_bytes.startswith(b'\x89PNG\r\n\x1a\n'):
-                return 'PNG_FILE_SIGNATURE_DETECTED', 'binary'
+            cache = get_cache()
+            cache_key = cache.make_key(
+                'upload-xml',
+                file_cache_input('xml', upload.path, '', content_digest=upload.digest),
+                trace_variant(check.trace_level, check.trace_window)
+            )
+            cache_result(cache, cache_key, result)
+
+
+def batch_files(files_info):
+    """Batch file entries for iter_batch.
+    
+    Uploads held in memory are passed as a view of their bytes when the
+    batch runs in this process. When it goes to the worker pool they are
+    spilled to their path first, so file contents are never pickled.
+    """
+    in_process = runs_in_process(len(files_info), app.config['BATCH_WORKERS'])
+    entries = []
+    for file_info in files_info:
+        upload = uploads.get_by_path(file_info.get('path', ''))
+        if upload is not None and upload.in_memory:
+            if in_process:
+                file_info = dict(file_info, data=upload.source())
             else:
-                return 'BINARY_FILE_CONTENT', 'binary'
-        except Exception as e:
-            return f"Error reading file: {str(e)}", 'error'
-    except Exception as e:
-        return f"Error opening file: {str(e)}", 'error'
+                uploads.spill(upload)
+        entries.append(file_info)
+    return entries
+
+
+def get_trace_options(data, default='full'):
+    """Read trace level and window from request data"""
+    level = data.get('trace', default)
+    if level not in TRACE_LEVELS:
+        raise ValueError(f"Invalid trace level: {level} (use {', '.join(TRACE_LEVELS)})")
+    
+    window = None
+    if level == 'windowed':
+        window = (int(data.get('trace_head', 100)), int(data.get('trace_tail', 100)))
+    return level, window
+
+
+def trace_variant(trace_level, trace_window):
+    """Cache key variant for a trace level, since cached results include the history"""
+    if trace_level == 'windowed':
+        return f'{trace_level}-{trace_window[0]}-{trace_window[1]}'
+    return trace_level
+
+
+def batch_options(trace_level, trace_window):
+    """iter_batch keyword arguments from the request trace options and app config"""
+    return {
+        'trace_level': trace_level,
+        'trace_window': trace_window,
+        'workers': app.config['BATCH_WORKERS'],
+        'timeout': app.config['BATCH_FILE_TIMEOUT'],
+        'block_size': app.config['STREAM_BLOCK_SIZE']
+    }
+
+
+def cache_result(cache, cache_key, result):
+    """Store a result, encoding its trace through the app's JSON provider"""
+    # A step never encodes to fewer than 32 bytes, so skip traces that cannot fit
+    if len(result['history']) * 32 > cache.max_entry_bytes:
+        return
+    cache.put(cache_key, result, encoded=app.json.dumps(result))
+
+
+def page_history(result, page_size):
+    """Replace a long history with its first page and a handle for the rest"""
+    history = result['history']
+    total = len(history)
+    if total <= page_size:
+        return result
+    return dict(
+        result,
+        history=history[:page_size],
+        trace_id=traces.put(history),
+        history_total=total,
+        history_complete=False,
+        next_offset=page_size
+    )
+
+
+def get_page_size(data):
+    """History page size requested by the client, within the configured bounds"""
+    page_size = data.get('page_size', app.config['TRACE_PAGE_SIZE'])
+    try:
+        page_size = int(page_size)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid page_size: {page_size!r} (use an integer)')
+    return max(1, min(page_size, app.config['TRACE_MAX_PAGE_SIZE']))
+
+
+def pda_result(pda, is_valid, history):
+    """Response fields describing a finished PDA run"""
+    return {
+        'valid': is_valid,
+        'history': history,
+        'final_stack': list(pda.stack),
+        'final_state': pda.current_state,
+        'stack_size': len(pda.stack),
+        'steps': pda.steps,
+        'trace': history.summary()
+    }
+
+
+def request_route():
+    """The matched URL rule, used as the route label of request metrics"""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def record_validation(validator_type, result, size=None):
+    """Count a validation result in the metrics"""
+    trace = result.get('trace')
+    metrics.observe_validation(
+        validator_type,
+        result.get('valid', False),
+        steps=result.get('steps'),
+        max_depth=trace.get('max_depth') if isinstance(trace, dict) else None,
+        size=size
+    )
+
+
+def record_exception(e, route=None):
+    """Count an exception a view caught and turned into an error response"""
+    metrics.observe_exception(route or request_route(), e)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get('request_start')
+    if start is not None:
+        metrics.observe_request(
+            request_route(), request.method, g.get('validator_type', ''),
+            response.status_code, time.perf_counter() - start
+        )
+    return response
+
+
+@app.before_request
+def start_profile():
+    # Reading profiles with the token header must not evict the ones being read
+    if request.endpoint in ('list_profiles', 'show_profile'):
+        return
+    profile = profiler.start(request.headers)
+    if profile is not None:
+        g.profile = profile
+
+
+@app.after_request
+def stop_profile(response):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        name = profiler.stop(profile, request.endpoint or 'unmatched')
+        if name:
+            response.headers[PROFILE_HEADER] = name
+    return response
+
+
+@app.teardown_request
+def discard_profile(exception=None):
+    # Requests that never reached after_request still release the profiler
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profiler.stop(profile, request.endpoint or 'unmatched')
+
+
+def record_unhandled_exception(sender, exception, **extra):
+    record_exception(exception)
+
+
+got_request_exception.connect(record_unhandled_exception, app)
 
 
 def validate_filename_pattern(filename):
-    """Validate filename pattern"""
-    import re
-    pattern = r'^[a-zA-Z0-9_]+(\.[a-zA-Z0-9_]+)*\.[a-zA-Z]{3,4}$'
-    return bool(re.match(pattern, filename))
+    """Validate filename pattern, with the same verdict as the filename PDA"""
+    is_valid, _ = PDA(trace='off').process_filename(filename)
+    return is_valid
 
 
 def get_file_icon(filename):
     """Get appropriate icon for file type"""
     ext = filename.split('.')[-1].lower() if '.' in filename else ''
-    
-    icon_map = {
-        'pdf': 'fas fa-file-pdf',
-        'doc': 'fas fa-file-word',
-        'docx': 'fas fa-file-word',
-        'xls': 'fas fa-file-excel',
-        'xlsx': 'fas fa-file-excel',
-        'jpg': 'fas fa-file-image',
-        'jpeg': 'fas fa-file-image',
-        'png': 'fas fa-file-image',
-        'gif': 'fas fa-file-image',
-        'txt': 'fas fa-file-alt',
-        'xml': 'fas fa-file-code',
-        'html': 'fas fa-file-code',
-        'htm': 'fas fa-file-code',
-        'json': 'fas fa-file-code'
-    }
-    
-    return icon_map.get(ext, 'fas fa-file')
+    return get_rules().icon_for(ext)
 
 
 @app.route('/')
@@ -307,47 +599,144 @@ def validate():
         
         validator_type = data.get('type', 'filename')
         input_text = data.get('text', '')
+        g.validator_type = validator_type
         
-        # Create PDA and validate
-        pda = PDA()
-        
-        if validator_type == 'filename':
-            is_valid, history = pda.process_filename(input_text)
-        elif validator_type == 'content':
-            is_valid, history = pda.process_content(input_text)
-        elif validator_type == 'filetype':
-            is_valid, history = pda.process_filetype(input_text)
-        elif validator_type == 'xml':
-            is_valid, history = pda.process_xml(input_text)
-        elif validator_type == 'multilevel':
-            is_valid, history = pda.process_multilevel(input_text)
-        else:
+        if validator_type not in VALIDATOR_INFO:
             return jsonify({
                 'error': 'Invalid validator type',
                 'valid': False
             }), 400
         
+        try:
+            trace_level, trace_window = get_trace_options(data, default='summary' if data.get('incremental') else 'full')
+            page_size = get_page_size(data)
+        except ValueError as e:
+            return jsonify({
+                'error': str(e),
+                'valid': False
+            }), 400
+        
+        if data.get('incremental'):
+            return validate_incremental(data, validator_type, input_text, trace_level)
+        
+        # Repeated inputs are answered from the result cache
+        cache = get_cache()
+        cache_key = cache.make_key(validator_type, digest(input_text), trace_variant(trace_level, trace_window))
+        result = cache.get(cache_key)
+        cached = result is not None
+        
+        if not cached:
+            # Create PDA and validate
+            pda = PDA(trace=trace_level, window=trace_window)
+            
+            if validator_type == 'filename':
+                is_valid, history = pda.process_filename(input_text)
+            elif validator_type == 'content':
+                is_valid, history = pda.process_content(input_text)
+            elif validator_type == 'filetype':
+                is_valid, history = pda.process_filetype(input_text)
+            elif validator_type == 'xml':
+                is_valid, history = pda.process_xml(input_text)
+            elif validator_type == 'multilevel':
+                is_valid, history = pda.process_multilevel(input_text)
+            
+            result = pda_result(pda, is_valid, history)
+            cache_result(cache, cache_key, result)
+        record_validation(validator_type, result, len(input_text))
+        
         # Get transition table
-        transition_table = pda.get_transition_table(validator_type)
+        transition_table = PDA().get_transition_table(validator_type)
         
-        return jsonify({
-            'valid': is_valid,
-            'history': history,
-            'final_stack': pda.stack,
-            'final_state': pda.current_state,
-            'stack_size': len(pda.stack),
-            'steps': len(history),
-            'transition_table': transition_table
-        })
+        # Long traces are sent a page at a time, see /trace/<trace_id>
+        result = page_history(result, page_size)
+        
+        return jsonify(dict(result, transition_table=transition_table, cached=cached))
         
     except Exception as e:
         app.logger.error(f"Validation error: {str(e)}")
+        record_exception(e)
         return jsonify({
             'error': f'Validation error: {str(e)}',
             'valid': False
         }), 500
 
 
+def validate_incremental(data, validator_type, input_text, trace_level):
+    """Validate an edited text from the checkpoints of the session's previous run"""
+    if validator_type != 'xml':
+        return jsonify({
+            'error': 'Incremental validation is only available for xml',
+            'valid': False
+        }), 400
+    if trace_level not in INCREMENTAL_TRACE_LEVELS:
+        return jsonify({
+            'error': f"Incremental validation needs trace {' or '.join(INCREMENTAL_TRACE_LEVELS)}",
+            'valid': False
+        }), 400
+    try:
+        edit_offset = int(data.get('edit_offset', 0))
+    except (TypeError, ValueError):
+        return jsonify({
+            'error': 'edit_offset must be an integer',
+            'valid': False
+        }), 400
+    
+    # Unknown or expired tokens start a new session
+    token = data.get('session')
+    session = edit_sessions.get(token) if token else None
+    if session is None or session.trace_level != trace_level:
+        session = EditSession(trace_level)
+        token = edit_sessions.put(session)
+    
+    with session.lock:
+        pda, is_valid, stats = session.validate(input_text, edit_offset)
+        edit_sessions.update(token, session)
+    result = pda_result(pda, is_valid, pda.history)
+    record_validation(validator_type, result, len(input_text))
+    
+    transition_table = PDA().get_transition_table(validator_type)
+    return jsonify(dict(result, transition_table=transition_table, cached=False, session=token, incremental=stats))
+
+
+@app.route('/trace/<trace_id>')
+def get_trace_page(trace_id):
+    """One page of a long validation history"""
+    history = traces.get(trace_id)
+    if history is None:
+        return jsonify({
+            'error': 'Trace not found or expired',
+            'success': False
+        }), 404
+    
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = int(request.args.get('limit', app.config['TRACE_PAGE_SIZE']))
+    except ValueError:
+        return jsonify({
+            'error': 'offset and limit must be integers',
+            'success': False
+        }), 400
+    limit = max(1, min(limit, app.config['TRACE_MAX_PAGE_SIZE']))
+    
+    total = len(history)
+    steps = [
+        {'step': number, **step}
+        for number, step in enumerate(history[offset:offset + limit], offset + 1)
+    ]
+    next_offset = offset + len(steps)
+    
+    return jsonify({
+        'success': True,
+        'trace_id': trace_id,
+        'offset': offset,
+        'total': total,
+        # Steps of the run not kept in this trace (see PDA_STATE_TRACE_STEPS)
+        'omitted': getattr(history, 'omitted', 0),
+        'steps': steps,
+        'next_offset': next_offset if next_offset < total else None
+    })
+
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """Handle file upload"""
@@ -361,6 +750,7 @@ def upload_file():
         
         files = request.files.getlist('files')
         validator_type = request.form.get('validator_type', 'filename')
+        g.validator_type = validator_type
         
         if not files or files[0].filename == '':
             return jsonify({
@@ -372,46 +762,50 @@ def upload_file():
         errors = []
         
         for file in files:
+            # File parts were spooled while the body was parsed, see PDARequest
+            upload = file.stream if isinstance(file.stream, Upload) else None
             if file and allowed_file(file.filename):
                 try:
                     # Secure filename
                     filename = secure_filename(file.filename)
                     
-                    # Create unique filename
-                    unique_id = str(uuid.uuid4())[:8]
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    unique_filename = f"{timestamp}_{unique_id}_{filename}"
-                    
-                    # Save file
-                    filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-                    file.save(filepath)
+                    if upload is None:
+                        upload = new_upload(file.filename)
+                        shutil.copyfileobj(file.stream, upload)
+                    upload.finish()
+                    uploads.add(upload)
+                    metrics.observe_upload(upload.size)
                     
                     # Get file info
-                    file_info = get_file_info(filepath)
-                    if file_info:
-                        # Read file content
-                        content, content_type = read_file_content(filepath)
-                        
-                        file_info.update({
-                            'id': unique_id,
-                            'path': filepath,
-                            'content': content,
-                            'content_type': content_type,
-                            'icon': get_file_icon(filename),
-                            'validator_type': validator_type,
-                            'upload_time': datetime.now().isoformat()
-                        })
-                        
-                        uploaded_files.append(file_info)
-                        
-                        # Log upload
-                        app.logger.info(f"File uploaded: {filename} ({file_info['size']} bytes)")
-                    else:
-                        errors.append(f"Could not get info for {filename}")
+                    file_info = get_upload_info(upload)
+                    
+                    # Read file content
+                    content, content_type = read_upload_content(upload)
+                    
+                    file_info.update({
+                        'id': upload.id,
+                        'path': upload.path,
+                        'content': content,
+                        'content_type': content_type,
+                        'icon': get_file_icon(filename),
+                        'validator_type': validator_type,
+                        'upload_time': datetime.now().isoformat()
+                    })
+                    
+                    if validator_type == 'xml' and content_type == 'text':
+                        cache_streamed_xml(upload, content)
+                    upload.consumers = []
+                    
+                    uploaded_files.append(file_info)
+                    
+                    # Log upload
+                    app.logger.info(f"File uploaded: {filename} ({file_info['size']} bytes, {file_info['stored']})")
                         
                 except Exception as e:
                     errors.append(f"Error processing {file.filename}: {str(e)}")
             else:
+                if upload is not None:
+                    upload.discard()
                 errors.append(f"File type not allowed: {file.filename}")
         
         return jsonify({
@@ -423,6 +817,7 @@ def upload_file():
         
     except Exception as e:
         app.logger.error(f"Upload error: {str(e)}")
+        record_exception(e)
         return jsonify({
             'error': f'Upload error: {str(e)}',
             'success': False
@@ -442,6 +837,17 @@ def process_uploaded_file():
         
         file_info = data.get('file_info', {})
         validator_type = data.get('validator_type', 'filename')
+        g.validator_type = validator_type
+        
+        # Whole files are streamed, so keep only a window of the trace by default
+        try:
+            trace_level, trace_window = get_trace_options(data, default='windowed')
+            page_size = get_page_size(data)
+        except ValueError as e:
+            return jsonify({
+                'error': str(e),
+                'valid': False
+            }), 400
         
         if not file_info or 'path' not in file_info:
             return jsonify({
@@ -451,93 +857,101 @@ def process_uploaded_file():
         
         filepath = file_info['path']
         
-        # Check if file exists
-        if not os.path.exists(filepath):
+        # Check if file exists (in memory or on disk)
+        file_source = get_file_source(file_info)
+        if file_source is None:
             return jsonify({
                 'error': 'File not found',
                 'valid': False
             }), 404
+        source, content_digest = file_source
         
-        # Process based on validator type
-        pda = PDA()
-        is_valid = False
-        history = []
-        input_text = ""
-        
-        if validator_type == 'filename':
-            # Use filename for validation
-            filename = os.path.basename(filepath)
-            input_text = filename
-            is_valid, history = pda.process_filename(filename)
+        if validator_type not in VALIDATOR_INFO:
+            return jsonify({
+                'error': 'Invalid validator type',
+                'valid': False
+            }), 400
+        
+        # Repeated uploads of the same input are answered from the result cache
+        cache = get_cache()
+        extension = file_info.get('extension', '').lstrip('.')
+        cache_key = cache.make_key(
+            f'upload-{validator_type}',
+            file_cache_input(validator_type, filepath, extension, source, content_digest),
+            trace_variant(trace_level, trace_window)
+        )
+        result = cache.get(cache_key)
+        cached = result is not None
+        
+        if not cached:
+            # Process based on validator type
+            pda = PDA(trace=trace_level, window=trace_window)
+            is_valid = False
+            history = pda.history
+            input_text = ""
+        
+            if validator_type == 'filename':
+                # Use filename for validation
+                filename = os.path.basename(filepath)
+                input_text = filename
+                is_valid, history = pda.process_filename(filename)
             
-        elif validator_type == 'content':
-            # Use file content for validation
-            content, content_type = read_file_content(filepath)
-            input_text = content[:100] + "..." if len(content) > 100 else content
+            elif validator_type == 'content':
+                # Use file content for validation
+                content, content_type = read_file_content(source)
+                input_text = content[:100] + "..." if len(content) > 100 else content
             
-            # Process content based on file type
-            if 'PDF' in content:
-                is_valid, history = pda.process_content('%PDF')
-            elif 'ZIP' in content:
-                is_valid, history = pda.process_content('PK')
-            elif content_type == 'text':
-                is_valid, history = pda.process_content(content[:50])
-            else:
-                is_valid, history = pda.process_content(content)
+                # Signatures on the raw bytes, OOXML packages by their central directory
+                is_valid, history = validate_content(pda, source)
                 
-        elif validator_type == 'filetype':
-            # Use file extension for validation
-            extension = file_info.get('extension', '').lstrip('.')
-            input_text = extension
-            is_valid, history = pda.process_filetype(extension)
+            elif validator_type == 'filetype':
+                # Use file extension for validation
+                input_text = extension
+                is_valid, history = pda.process_filetype(extension)
             
-        elif validator_type == 'xml':
-            # Read XML content
-            content, content_type = read_file_content(filepath)
-            if content_type == 'text':
-                input_text = content[:500]
-                is_valid, history = pda.process_xml(input_text)
-            else:
-                return jsonify({
-                    'error': 'File is not text-based XML',
-                    'valid': False
-                }), 400
+            elif validator_type == 'xml':
+                # Read XML content
+                content, content_type = read_file_content(source)
+                if content_type == 'text':
+                    input_text = content[:500]
+                    is_valid, history = stream_validate_file(pda, source, 'xml', app.config['STREAM_BLOCK_SIZE'])
+                else:
+                    return jsonify({
+                        'error': 'File is not text-based XML',
+                        'valid': False
+                    }), 400
                 
-        elif validator_type == 'multilevel':
-            # Read file content
-            content, content_type = read_file_content(filepath)
-            if content_type == 'text':
-                input_text = content[:500]
-                is_valid, history = pda.process_multilevel(input_text)
-            else:
-                # For binary files, use filename in XML format
-                filename = os.path.basename(filepath)
-                input_text = f"<file>{filename}</file>"
-                is_valid, history = pda.process_multilevel(input_text)
-        
-        else:
-            return jsonify({
-                'error': 'Invalid validator type',
-                'valid': False
-            }), 400
+            elif validator_type == 'multilevel':
+                # Read file content
+                content, content_type = read_file_content(source)
+                if content_type == 'text':
+                    input_text = content[:500]
+                    if '<' in content and '>' in content:
+                        is_valid, history = stream_validate_file(pda, source, 'multilevel', app.config['STREAM_BLOCK_SIZE'])
+                    else:
+                        is_valid, history = pda.process_multilevel(input_text)
+                else:
+                    # For binary files, use filename in XML format
+                    filename = os.path.basename(filepath)
+                    input_text = f"<file>{filename}</file>"
+                    is_valid, history = pda.process_multilevel(input_text)
+            
+            result = pda_result(pda, is_valid, history)
+            result['input_text'] = input_text
+            cache_result(cache, cache_key, result)
+        record_validation(validator_type, result, file_info.get('size'))
         
         # Get transition table
-        transition_table = pda.get_transition_table(validator_type)
+        transition_table = PDA().get_transition_table(validator_type)
         
-        return jsonify({
-            'valid': is_valid,
-            'history': history,
-            'final_stack': pda.stack,
-            'final_state': pda.current_state,
-            'stack_size': len(pda.stack),
-            'steps': len(history),
-            'transition_table': transition_table,
-            'input_text': input_text,
-            'file_info': file_info
-        })
+        # Long traces are sent a page at a time, see /trace/<trace_id>
+        result = page_history(result, page_size)
+        
+        return jsonify(dict(result, transition_table=transition_table, file_info=file_info, cached=cached))
         
     except Exception as e:
         app.logger.error(f"Process upload error: {str(e)}\n{traceback.format_exc()}")
+        record_exception(e)
         return jsonify({
             'error': f'Process error: {str(e)}',
             'valid': False
@@ -557,6 +971,16 @@ def batch_validate():
         
         files_info = data.get('files', [])
         validator_type = data.get('validator_type', 'filename')
+        g.validator_type = validator_type
+        
+        # Batch results only report counters, so skip per-step history by default
+        try:
+            trace_level, trace_window = get_trace_options(data, default='summary')
+        except ValueError as e:
+            return jsonify({
+                'error': str(e),
+                'valid': False
+            }), 400
         
         if not files_info:
             return jsonify({
@@ -564,104 +988,213 @@ def batch_validate():
                 'valid': False
             }), 400
         
-        results = []
+        options = batch_options(trace_level, trace_window)
         
-        for file_info in files_info:
-            try:
-                # Process each file
-                filepath = file_info.get('path', '')
-                
-                if not os.path.exists(filepath):
-                    results.append({
-                        'filename': file_info.get('name', 'unknown'),
-                        'valid': False,
-                        'error': 'File not found'
-                    })
-                    continue
-                
-                # Process based on validator type
-                pda = PDA()
-                is_valid = False
-                history = []
-                
-                if validator_type == 'filename':
-                    filename = os.path.basename(filepath)
-                    is_valid, history = pda.process_filename(filename)
-                    
-                elif validator_type == 'content':
-                    content, content_type = read_file_content(filepath)
-                    if 'PDF' in content:
-                        is_valid, history = pda.process_content('%PDF')
-                    elif 'ZIP' in content:
-                        is_valid, history = pda.process_content('PK')
-                    elif content_type == 'text':
-                        is_valid, history = pda.process_content(content[:50])
-                    else:
-                        is_valid, history = pda.process_content(content)
-                        
-                elif validator_type == 'filetype':
-                    extension = os.path.splitext(file_info.get('name', ''))[1].lstrip('.')
-                    is_valid, history = pda.process_filetype(extension)
-                    
-                elif validator_type == 'xml':
-                    content, content_type = read_file_content(filepath)
-                    if content_type == 'text':
-                        is_valid, history = pda.process_xml(content[:500])
-                    else:
-                        results.append({
-                            'filename': file_info.get('name', 'unknown'),
-                            'valid': False,
-                            'error': 'Not text-based XML'
-                        })
-                        continue
-                        
-                elif validator_type == 'multilevel':
-                    content, content_type = read_file_content(filepath)
-                    if content_type == 'text':
-                        is_valid, history = pda.process_multilevel(content[:500])
-                    else:
-                        filename = os.path.basename(filepath)
-                        is_valid, history = pda.process_multilevel(f"<file>{filename}</file>")
-                
-                results.append({
-                    'filename': file_info.get('name', 'unknown'),
-                    'valid': is_valid,
-                    'steps': len(history),
-                    'final_state': pda.current_state,
-                    'stack_size': len(pda.stack)
-                })
-                
-            except Exception as e:
-                results.append({
-                    'filename': file_info.get('name', 'unknown'),
-                    'valid': False,
-                    'error': str(e)
-                })
+        # NDJSON mode: one line per file as soon as it is ready, statistics last
+        if data.get('stream') or request.accept_mimetypes.best == 'application/x-ndjson':
+            return app.response_class(
+                stream_batch(batch_files(files_info), validator_type, options),
+                mimetype='application/x-ndjson',
+                headers={'X-Accel-Buffering': 'no'}
+            )
         
-        # Calculate statistics
-        total_files = len(results)
-        valid_files = sum(1 for r in results if r.get('valid', False))
-        invalid_files = total_files - valid_files
+        results = []
+        statistics = BatchStatistics()
+        for result in iter_batch(batch_files(files_info), validator_type, **options):
+            results.append(result)
+            statistics.add(result)
+            record_validation(validator_type, result)
         
         return jsonify({
             'success': True,
             'results': results,
-            'statistics': {
-                'total': total_files,
-                'valid': valid_files,
-                'invalid': invalid_files,
-                'valid_percentage': round((valid_files / total_files * 100) if total_files > 0 else 0, 2)
-            }
+            'statistics': statistics.as_dict()
         })
         
     except Exception as e:
         app.logger.error(f"Batch validate error: {str(e)}")
+        record_exception(e)
         return jsonify({
             'error': f'Batch validation error: {str(e)}',
             'success': False
         }), 500
 
 
+def stream_batch(files_info, validator_type, options):
+    """Generate NDJSON lines for a batch: each file result, then the statistics"""
+    statistics = BatchStatistics()
+    try:
+        for result in iter_batch(files_info, validator_type, **options):
+            statistics.add(result)
+            record_validation(validator_type, result)
+            yield app.json.dumps(result) + '\n'
+    except Exception as e:
+        app.logger.error(f"Batch stream error: {str(e)}")
+        # The response is streamed after the request context is gone
+        record_exception(e, route='/batch-validate')
+        yield app.json.dumps({
+            'error': f'Batch validation error: {str(e)}',
+            'success': False,
+            'statistics': statistics.as_dict()
+        }) + '\n'
+        return
+    yield app.json.dumps({
+        'success': True,
+        'statistics': statistics.as_dict()
+    }) + '\n'
+
+
+@app.route('/validate-filenames', methods=['POST'])
+def validate_filename_list():
+    """Validate a list of filenames in bulk, one per line or as JSON {"names": [...]}"""
+    try:
+        g.validator_type = 'filename'
+        if request.is_json:
+            data = request.get_json()
+            names = data.get('names') if isinstance(data, dict) else None
+            summary = bool(isinstance(data, dict) and data.get('summary'))
+            if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+                return jsonify({
+                    'error': 'names must be a list of strings',
+                    'success': False
+                }), 400
+        else:
+            names = request.get_data(as_text=True).split('\n')
+            if names and names[-1] == '':
+                names.pop()
+            names = [name[:-1] if name.endswith('\r') else name for name in names]
+            summary = request.args.get('summary', '').lower() in ('1', 'true', 'yes')
+        
+        if not names:
+            return jsonify({
+                'error': 'No filenames provided',
+                'success': False
+            }), 400
+        
+        valid, reasons = validate_filenames(names)
+        valid_count = sum(valid)
+        reason_counts = {}
+        for reason in reasons:
+            reason_counts[reason] = reason_counts.get(reason, 0) + 1
+        # One increment per result instead of one per name
+        metrics.validations.inc(valid_count, validator='filename', result='accept')
+        metrics.validations.inc(len(names) - valid_count, validator='filename', result='reject')
+        
+        response = {
+            'success': True,
+            'kernel': kernel_name(),
+            'total': len(names),
+            'valid': valid_count,
+            'invalid': len(names) - valid_count,
+            'reasons': reason_counts
+        }
+        if not summary:
+            response['results'] = [
+                {'filename': name, 'valid': is_valid, 'reason': reason}
+                for name, is_valid, reason in zip(names, valid, reasons)
+            ]
+        return jsonify(response)
+        
+    except Exception as e:
+        app.logger.error(f"Bulk filename validation error: {str(e)}")
+        record_exception(e)
+        return jsonify({
+            'error': f'Bulk filename validation error: {str(e)}',
+            'success': False
+        }), 500
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Start a batch validation in the background"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({
+                'error': 'No data provided',
+                'success': False
+            }), 400
+        
+        files_info = data.get('files', [])
+        validator_type = data.get('validator_type', 'filename')
+        g.validator_type = validator_type
+        
+        try:
+            trace_level, trace_window = get_trace_options(data, default='summary')
+        except ValueError as e:
+            return jsonify({
+                'error': str(e),
+                'success': False
+            }), 400
+        
+        if not files_info:
+            return jsonify({
+                'error': 'No files provided',
+                'success': False
+            }), 400
+        
+        try:
+            job = jobs.submit(batch_files(files_info), validator_type, **batch_options(trace_level, trace_window))
+        except JobQueueFull as e:
+            return jsonify({
+                'error': str(e),
+                'success': False
+            }), 503
+        
+        response = jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': url_for('job_status', job_id=job.id),
+            'results_url': url_for('job_results', job_id=job.id)
+        })
+        response.headers['Location'] = url_for('job_status', job_id=job.id)
+        return response, 202
+        
+    except Exception as e:
+        app.logger.error(f"Job submit error: {str(e)}")
+        record_exception(e)
+        return jsonify({
+            'error': f'Job submit error: {str(e)}',
+            'success': False
+        }), 500
+
+
+@app.route('/jobs')
+def list_jobs():
+    """Progress of every known batch job"""
+    return jsonify({
+        'success': True,
+        'jobs': [job.snapshot() for job in jobs.list()]
+    })
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Progress counters of a batch job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({
+            'error': 'Job not found',
+            'success': False
+        }), 404
+    return jsonify(dict(job.snapshot(), success=True))
+
+
+@app.route('/jobs/<job_id>/results')
+def job_results(job_id):
+    """Results of a finished batch job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({
+            'error': 'Job not found',
+            'success': False
+        }), 404
+    if not job.done:
+        return jsonify(dict(job.snapshot(), error='Job has not finished', success=False)), 409
+    return jsonify(dict(job.snapshot(include_results=True), success=job.status == 'completed'))
+
+
 @app.route('/download-results', methods=['POST'])
 def download_results():
     """Download validation results as JSON"""
@@ -696,6 +1229,7 @@ def download_results():
         
     except Exception as e:
         app.logger.error(f"Download results error: {str(e)}")
+        record_exception(e)
         return jsonify({
             'error': f'Download error: {str(e)}'
         }), 500
@@ -707,16 +1241,16 @@ def get_examples(validator_type):
     if validator_type in VALIDATOR_EXAMPLES:
         return jsonify({
             'examples': VALIDATOR_EXAMPLES[validator_type],
-            'validator_info': VALIDATOR_INFO.get(validator_type, {})
+            'validator_info': get_validator_info(validator_type) if validator_type in VALIDATOR_INFO else {}
         })
     return jsonify({'error': 'Validator not found'}), 404
 
 
 @app.route('/validator-info/<validator_type>')
-def get_validator_info(validator_type):
+def validator_info(validator_type):
     """Get detailed info for validator"""
     if validator_type in VALIDATOR_INFO:
-        return jsonify(VALIDATOR_INFO[validator_type])
+        return jsonify(get_validator_info(validator_type))
     return jsonify({'error': 'Validator not found'}), 404
 
 
@@ -724,7 +1258,7 @@ def get_validator_info(validator_type):
 def get_supported_extensions(validator_type):
     """Get supported file extensions for validator"""
     if validator_type in VALIDATOR_INFO:
-        extensions = VALIDATOR_INFO[validator_type].get('supported_files', [])
+        extensions = list(get_rules().supported_files.get(validator_type, ()))
         return jsonify({
             'extensions': extensions,
             'count': len(extensions)
@@ -739,7 +1273,93 @@ def health_check():
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'validators': list(VALIDATOR_INFO.keys()),
-        'upload_folder': app.config['UPLOAD_FOLDER']
+        'upload_folder': app.config['UPLOAD_FOLDER'],
+        'rules_version': get_rules().version,
+        'cache': get_cache().stats(),
+        'uploads': uploads.stats()
+    })
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Request and validation metrics in the Prometheus text format"""
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def profile_access_denied():
+    """Error response unless the request carries the profiling token.
+    
+    Profiles expose function names and timings, so without a token
+    configured the endpoints do not exist.
+    """
+    if profiler.token is None:
+        return jsonify({
+            'error': 'Not found',
+            'success': False
+        }), 404
+    if not profiler.authorized(request.headers):
+        return jsonify({
+            'error': f'{PROFILE_HEADER} header required',
+            'success': False
+        }), 403
+    return None
+
+
+@app.route('/profiles')
+def list_profiles():
+    """Request profiles captured by the profiling hook"""
+    denied = profile_access_denied()
+    if denied is not None:
+        return denied
+    
+    return jsonify({
+        'success': True,
+        'enabled': profiler.enabled,
+        'sample_every': profiler.sample_every,
+        'max_profiles': profiler.max_profiles,
+        'profiles': [
+            dict(entry, url=url_for('show_profile', name=entry['name']))
+            for entry in profiler.list()
+        ]
+    })
+
+
+@app.route('/profiles/<name>')
+def show_profile(name):
+    """Top functions of one profile by cumulative time, or the .pstats file with ?download=1"""
+    denied = profile_access_denied()
+    if denied is not None:
+        return denied
+    
+    path = profiler.path_of(name)
+    if path is None:
+        return jsonify({
+            'error': 'Profile not found',
+            'success': False
+        }), 404
+    if request.args.get('download'):
+        return send_file(path, as_attachment=True, download_name=name)
+    
+    try:
+        limit = int(request.args.get('limit', DEFAULT_TOP_FUNCTIONS))
+    except ValueError:
+        return jsonify({
+            'error': 'limit must be an integer',
+            'success': False
+        }), 400
+    
+    try:
+        total_time, functions = profiler.top_functions(name, max(1, limit))
+    except ProfileError as e:
+        return jsonify({
+            'error': str(e),
+            'success': False
+        }), 422
+    return jsonify({
+        'success': True,
+        'name': name,
+        'total_time': total_time,
+        'functions': functions
     })
 
 
@@ -755,7 +1375,13 @@ def cleanup_files():
         
         for file_path in file_paths:
             try:
-                if os.path.exists(file_path):
+                upload = uploads.get_by_path(file_path)
+                if upload is not None:
+                    # Also removes the file if the upload was spilled to disk
+                    uploads.discard(upload.id)
+                    deleted_count += 1
+                    app.logger.info(f"Deleted upload: {file_path}")
+                elif os.path.exists(file_path):
                     os.remove(file_path)
                     deleted_count += 1
                     app.logger.info(f"Deleted file: {file_path}")
@@ -770,6 +1396,7 @@ def cleanup_files():
         
     except Exception as e:
         app.logger.error(f"Cleanup error: {str(e)}")
+        record_exception(e)
         return jsonify({
             'error': f'Cleanup error: {str(e)}',
             'success': False
@@ -818,7 +1445,11 @@ if __name__ == '__main__':
     print(f"Upload folder: {app.config['UPLOAD_FOLDER']}")
     print(f"Max file size: {app.config['MAX_CONTENT_LENGTH'] / (1024*1024)} MB")
     print(f"Supported validators: {', '.join(VALIDATOR_INFO.keys())}")
+    print(f"Rules: {get_rules().source} (version {get_rules().version})")
     print("=" * 50)
+    
+    # Reload rules.json on SIGHUP without restarting
+    install_reload_signal()
     print("Starting server on http://127.0.0.1:5000")
     
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1 @@
+"""Benchmarks for the PDA engine and the HTTP endpoints, see benchmarks.run"""
@@ -0,0 +1,157 @@
+"""Throughput and latency of the HTTP endpoints on a local Waitress server"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import inputs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_TIMEOUT = 30.0
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    """wsgi.py started in a subprocess on a free port, with result caching off"""
+
+    def __init__(self, port=None):
+        self.port = port or _free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self._process = None
+
+    def __enter__(self):
+        env = dict(os.environ, PORT=str(self.port), PDA_CACHE_PATH='', PDA_CACHE_ENTRY_BYTES='0')
+        self._process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'wsgi.py')],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError(f'wsgi.py exited with status {self._process.returncode}')
+            try:
+                request(self.url, 'GET', '/health')
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError(f'wsgi.py did not answer on port {self.port} within {STARTUP_TIMEOUT}s')
+
+    def __exit__(self, *exc):
+        self._process.terminate()
+        try:
+            self._process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+
+
+def request(base, method, path, body=None, content_type='application/json'):
+    """(status, body bytes) of one request"""
+    req = urllib.request.Request(base + path, data=body, method=method)
+    if body is not None:
+        req.add_header('Content-Type', content_type)
+    try:
+        with urllib.request.urlopen(req, timeout=120) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def post_json(base, path, data):
+    return request(base, 'POST', path, json.dumps(data).encode('utf-8'))
+
+
+def multipart(files, fields):
+    """Body and content type of a multipart/form-data request"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8'))
+    for filename, data in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8') + data + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def load(send, total, concurrency):
+    """Run ``send()`` ``total`` times on ``concurrency`` threads; returns throughput and latency"""
+    def timed(_):
+        start = time.perf_counter()
+        status, _ = send()
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(timed, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in outcomes)
+    return {
+        'requests': total,
+        'errors': sum(1 for _, status in outcomes if status >= 400),
+        'throughput_rps': total / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000
+    }
+
+
+def _scenarios(base, quick):
+    scale = 10 if quick else 1
+    filename = inputs.long_filename(200)
+    deep = inputs.deep_xml(1000)
+    wide = inputs.wide_xml(5000)
+    upload_body, upload_type = multipart(inputs.sample_files(10), {'validator_type': 'content'})
+    batch = inputs.sample_files(200 // scale)
+
+    # The batch endpoint validates files already uploaded
+    body, content_type = multipart(batch, {'validator_type': 'content'})
+    status, response = request(base, 'POST', '/upload', body, content_type)
+    if status != 200:
+        raise RuntimeError(f'Upload for the batch scenario failed with status {status}')
+    uploaded = [{'name': f['name'], 'path': f['path']} for f in json.loads(response)['files']]
+
+    return [
+        ('validate/filename', lambda: post_json(base, '/validate', {'type': 'filename', 'text': filename}), 400 // scale, 4),
+        ('validate/xml-deep', lambda: post_json(base, '/validate', {'type': 'xml', 'text': deep, 'trace': 'summary'}), 200 // scale, 4),
+        ('validate/xml-wide-full-trace', lambda: post_json(base, '/validate', {'type': 'xml', 'text': wide}), 100 // scale, 4),
+        ('upload/10-files', lambda: request(base, 'POST', '/upload', upload_body, upload_type), 50 // scale, 2),
+        (f'batch-validate/{len(uploaded)}-files',
+         lambda: post_json(base, '/batch-validate', {'files': uploaded, 'validator_type': 'content'}), 10, 1),
+    ]
+
+
+def run(quick=False, log=print):
+    """Results of every HTTP benchmark, keyed by scenario name"""
+    results = {}
+    with Server() as server:
+        for name, send, total, concurrency in _scenarios(server.url, quick):
+            send()  # warm up
+            results[name] = load(send, total, concurrency)
+            r = results[name]
+            log(f'{name:32} {r["throughput_rps"]:8.1f} req/s  p50 {r["p50_ms"]:8.1f} ms  '
+                f'p95 {r["p95_ms"]:8.1f} ms  p99 {r["p99_ms"]:8.1f} ms  errors {r["errors"]}')
+    return results
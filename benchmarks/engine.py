@@ -0,0 +1,107 @@
+"""Timing and peak memory of the PDA.process_* methods"""
+
+import gc
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import inputs
+from pda_batch import validate_file
+from pda_bulk import validate_filenames
+from pda_engine import PDA
+
+# Shortest timed sample; faster calls are repeated within one sample
+MIN_SAMPLE_SECONDS = 0.05
+
+
+def _cases(quick):
+    scale = 10 if quick else 1
+    deep = inputs.deep_xml(10000 // scale)
+    wide = inputs.wide_xml(50000 // scale)
+    filenames = inputs.filename_xml(50000 // scale)
+    text = inputs.large_text(4 * 1024 * 1024 // scale)
+    filename = inputs.long_filename(10000 // scale)
+    pdf = inputs.minimal_pdf(pages=50, padding=4 * 1024 * 1024 // scale)
+    docx = inputs.minimal_docx(2000 // scale)
+    inventory = inputs.filename_inventory(100000 // scale)
+    return [
+        ('filename/long', lambda: PDA(trace='summary').process_filename(filename)),
+        ('filename/long-full-trace', lambda: PDA().process_filename(filename)),
+        ('filename/bulk', lambda: validate_filenames(inventory)),
+        ('xml/deep', lambda: PDA(trace='summary').process_xml(deep)),
+        ('xml/deep-full-trace', lambda: PDA().process_xml(deep)),
+        ('xml/wide', lambda: PDA(trace='summary').process_xml(wide)),
+        ('xml/large-text', lambda: PDA(trace='summary').process_xml(text)),
+        ('multilevel/wide', lambda: PDA(trace='summary').process_multilevel(filenames)),
+        ('content/large-text', lambda: PDA(trace='summary').process_content(text)),
+        ('content/pdf', lambda: PDA(trace='summary').process_pdf(pdf)),
+        ('content/docx', lambda: PDA(trace='summary').process_ooxml(docx)),
+        ('filetype/pdf', lambda: PDA(trace='summary').process_filetype('pdf')),
+    ]
+
+
+def measure(func, repeat=5, min_sample=MIN_SAMPLE_SECONDS):
+    """Per-call wall time over ``repeat`` samples and the peak traced memory of one call.
+
+    Like timeit, fast calls are looped so each sample lasts at least
+    ``min_sample`` seconds and timer resolution does not dominate.
+    """
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        if time.perf_counter() - start >= min_sample or calls >= 1 << 20:
+            break
+        calls *= 2
+
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        times.append((time.perf_counter() - start) / calls)
+
+    # Tracing slows every allocation, so memory is measured on a separate run
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'calls': calls,
+        'median_s': statistics.median(times),
+        'min_s': min(times),
+        'peak_bytes': peak
+    }
+
+
+def _batch_case(quick):
+    files = inputs.sample_files(20 if quick else 200)
+    directory = tempfile.TemporaryDirectory(prefix='pda-bench-')
+    entries = inputs.write_files(directory.name, files)
+
+    def run():
+        # Serial and uncached, so every file is validated here where tracemalloc sees it
+        for validator_type in ('content', 'xml'):
+            for entry in entries:
+                validate_file(entry, validator_type, use_cache=False)
+    return f'batch/{len(entries)}-files', run, directory
+
+
+def run(quick=False, repeat=5, log=print):
+    """Results of every engine benchmark, keyed by case name"""
+    results = {}
+    for name, func in _cases(quick):
+        results[name] = measure(func, repeat)
+        log(f'{name:32} {results[name]["median_s"] * 1000:10.2f} ms {results[name]["peak_bytes"] / 1024:10.0f} KiB')
+
+    name, func, directory = _batch_case(quick)
+    with directory:
+        results[name] = measure(func, max(1, repeat // 2))
+    log(f'{name:32} {results[name]["median_s"] * 1000:10.2f} ms {results[name]["peak_bytes"] / 1024:10.0f} KiB')
+    return results
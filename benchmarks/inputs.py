@@ -0,0 +1,137 @@
+"""Realistic and adversarial inputs for the benchmarks"""
+
+import io
+import os
+import random
+import string
+import zipfile
+
+SEED = 1234
+_WORDS = ('dokumen', 'laporan', 'invoice', 'kontrak', 'data', 'file', 'arsip', 'surat', 'tabel', 'gambar')
+
+
+def long_filename(length=10000):
+    """A valid filename with a ``length``-character stem"""
+    rng = random.Random(SEED)
+    return ''.join(rng.choice(string.ascii_letters + string.digits + '_') for _ in range(length)) + '.pdf'
+
+
+def filename_inventory(count=100000):
+    """``count`` filenames, mostly valid, with a share of bad characters and extensions"""
+    rng = random.Random(SEED)
+    extensions = ('pdf', 'docx', 'xlsx', 'txt', 'PDF', 'exe', 'tar.gz')
+    names = []
+    for i in range(count):
+        name = f'{rng.choice(_WORDS)}_{i}.{rng.choice(extensions)}'
+        if i % 10 == 0:
+            name = name.replace('_', rng.choice(' @#-'), 1)
+        names.append(name)
+    return names
+
+
+def deep_xml(depth=10000):
+    """Elements nested ``depth`` levels deep, so the stack grows to ``depth``"""
+    return ''.join(f'<n{i}>' for i in range(depth)) + 'isi' + ''.join(f'</n{i}>' for i in reversed(range(depth)))
+
+
+def wide_xml(count=50000):
+    """``count`` sibling elements under one root"""
+    items = ''.join(f'<item{i % 100}>nilai{i}</item{i % 100}>' for i in range(count))
+    return f'<root>{items}</root>'
+
+
+def filename_xml(count=50000):
+    """``count`` sibling elements under one root, each holding a valid filename"""
+    items = ''.join(f'<item{i % 100}>berkas_{i}.pdf</item{i % 100}>' for i in range(count))
+    return f'<root>{items}</root>'
+
+
+def large_text(size=4 * 1024 * 1024):
+    """About ``size`` bytes of words and digits on short lines"""
+    rng = random.Random(SEED)
+    lines = []
+    total = 0
+    while total < size:
+        line = ' '.join(rng.choice(_WORDS) + str(rng.randrange(1000)) for _ in range(12))
+        lines.append(line)
+        total += len(line) + 1
+    return '\n'.join(lines)
+
+
+def minimal_pdf(pages=1, padding=0):
+    """A small well-formed PDF with a classic xref table"""
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>']
+    kids = ' '.join(f'{3 + i} 0 R' for i in range(pages)).encode('ascii')
+    objects.append(b'<< /Type /Pages /Kids [' + kids + b'] /Count %d >>' % pages)
+    for _ in range(pages):
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >>')
+    objects.append(b'<< /Length %d >>\nstream\n' % padding + b'0' * padding + b'\nendstream')
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        out += b'%010d 00000 n \n' % offset
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def minimal_docx(paragraphs=100):
+    """A small DOCX package with the parts the content validator reads"""
+    body = ''.join(f'<w:p><w:r><w:t>Paragraf {i}</w:t></w:r></w:p>' for i in range(paragraphs))
+    parts = {
+        '[Content_Types].xml': (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            '</Types>'
+        ),
+        '_rels/.rels': (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="word/document.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+            '</Relationships>'
+        ),
+        'word/document.xml': f'<w:document><w:body>{body}</w:body></w:document>'
+    }
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as package:
+        for name, data in parts.items():
+            package.writestr(name, data)
+    return buffer.getvalue()
+
+
+def sample_files(count=200):
+    """(filename, bytes) pairs mixing XML, text, PDF and DOCX files"""
+    rng = random.Random(SEED)
+    files = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            files.append((f'data_{i}.xml', wide_xml(rng.randrange(50, 500)).encode('utf-8')))
+        elif kind == 1:
+            files.append((f'catatan_{i}.txt', large_text(rng.randrange(1024, 16 * 1024)).encode('utf-8')))
+        elif kind == 2:
+            files.append((f'laporan_{i}.pdf', minimal_pdf(pages=rng.randrange(1, 20), padding=rng.randrange(0, 64 * 1024))))
+        else:
+            files.append((f'kontrak_{i}.docx', minimal_docx(rng.randrange(10, 200))))
+    return files
+
+
+def write_files(directory, files):
+    """Write (filename, bytes) pairs under ``directory`` and return batch file entries"""
+    entries = []
+    for name, data in files:
+        path = os.path.join(directory, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        entries.append({'name': name, 'path': path})
+    return entries
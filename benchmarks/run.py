@@ -0,0 +1,130 @@
+"""Run the benchmarks and compare them with the stored baseline.
+
+    python -m benchmarks.run                  engine and HTTP benchmarks
+    python -m benchmarks.run --only engine    PDA.process_* timings only
+    python -m benchmarks.run --quick          smaller inputs, for a fast check
+    python -m benchmarks.run --save           store the results as the new baseline
+
+Minimum times, latencies and peak memory regress when they grow by more
+than --tolerance over the baseline, throughput when it shrinks by more.
+The exit status is 1 if anything regressed. Baselines are only comparable
+on the machine (and with the --quick setting) they were recorded with.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+DEFAULT_TOLERANCE = 0.25
+# Reported for context, not compared: the minimum is the steadier time
+_INFORMATIONAL = ('requests', 'calls', 'median_s')
+
+
+def _higher_is_better(metric):
+    return metric.endswith('_rps')
+
+
+def compare(results, baseline, tolerance):
+    """(rows, regressions) comparing every metric present in both runs"""
+    rows = []
+    regressions = []
+    for suite, cases in results.items():
+        if suite == 'meta':
+            continue
+        for case, metrics in cases.items():
+            base_metrics = baseline.get(suite, {}).get(case)
+            if base_metrics is None:
+                continue
+            for metric, value in metrics.items():
+                base = base_metrics.get(metric)
+                if base is None or metric in _INFORMATIONAL:
+                    continue
+                if base == 0:
+                    worse = value > 0 and not _higher_is_better(metric)
+                    change = float('inf') if value else 0.0
+                else:
+                    change = (value - base) / base
+                    worse = -change > tolerance if _higher_is_better(metric) else change > tolerance
+                row = (f'{suite}/{case}', metric, base, value, change, worse)
+                rows.append(row)
+                if worse:
+                    regressions.append(row)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='PDA engine and HTTP benchmarks')
+    parser.add_argument('--only', choices=('engine', 'http'), help='run one suite')
+    parser.add_argument('--quick', action='store_true', help='smaller inputs and fewer requests')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per engine case')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline file to compare with')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='allowed relative slowdown')
+    parser.add_argument('--save', action='store_true', help='write the results to the baseline file')
+    parser.add_argument('--output', help='also write the results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    # Imported here so ROOT is on the path when run as a script
+    from benchmarks import endpoints, engine
+
+    results = {'meta': {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'quick': args.quick
+    }}
+    if args.only in (None, 'engine'):
+        print('== engine ==')
+        results['engine'] = engine.run(quick=args.quick, repeat=args.repeat)
+    if args.only in (None, 'http'):
+        print('== http ==')
+        results['http'] = endpoints.run(quick=args.quick)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                saved = json.load(f)
+        else:
+            saved = {}
+        # A partial run replaces only the suites it ran
+        saved.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(saved, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Baseline written to {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}, run with --save to create one')
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('meta', {}).get('quick') != args.quick:
+        print('Warning: baseline and this run differ in --quick, numbers are not comparable')
+
+    rows, regressions = compare(results, baseline, args.tolerance)
+    print(f'== compared with {args.baseline} ({baseline.get("meta", {}).get("date", "unknown date")}) ==')
+    for name, metric, base, value, change, worse in rows:
+        marker = '  REGRESSION' if worse else ''
+        print(f'{name:40} {metric:12} {base:14.3f} -> {value:14.3f} ({change:+.1%}){marker}')
+    if regressions:
+        print(f'{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}')
+        return 1
+    print('No regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,317 @@
+"""Batch validation of uploaded files, serially or on a process pool"""
+
+import itertools
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from pda_cache import get_cache, digest
+from pda_engine import PDA
+from pda_files import read_file_content, validate_content, stream_validate_file, file_digest, STREAM_BLOCK_SIZE
+from pda_rules import get_rules, reload_rules
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_FILE_TIMEOUT = 30.0
+# Below this many files the pool round trip costs more than it saves
+PARALLEL_MIN_FILES = 8
+# Files submitted to the pool ahead of the one being waited on, per worker
+IN_FLIGHT_PER_WORKER = 4
+
+
+class BatchStatistics:
+    """Running totals for a batch, updated as each file result arrives"""
+
+    def __init__(self):
+        self.total = 0
+        self.valid = 0
+
+    def add(self, result):
+        self.total += 1
+        if result.get('valid', False):
+            self.valid += 1
+
+    @property
+    def invalid(self):
+        return self.total - self.valid
+
+    def as_dict(self):
+        """The statistics block returned with batch results"""
+        return {
+            'total': self.total,
+            'valid': self.valid,
+            'invalid': self.invalid,
+            'valid_percentage': round((self.valid / self.total * 100) if self.total > 0 else 0, 2)
+        }
+
+
+def file_cache_input(validator_type, filepath, extension, source=None, content_digest=None):
+    """Digest of what a validator reads from an uploaded file, for cache keys.
+
+    ``source`` is the file's bytes when it is held in memory and
+    ``content_digest`` a hash of them already computed on upload.
+    """
+    if validator_type == 'filename':
+        return digest(os.path.basename(filepath))
+    if validator_type == 'filetype':
+        return digest(extension)
+    if content_digest is None:
+        content_digest = file_digest(filepath if source is None else source)
+    if validator_type == 'multilevel':
+        # Binary files are validated through their name
+        return digest(content_digest + '/' + os.path.basename(filepath))
+    return content_digest
+
+
+def validate_file(file_info, validator_type, trace_level='summary', trace_window=None,
+                  block_size=STREAM_BLOCK_SIZE, use_cache=True):
+    """Validate one file of a batch and return its result entry"""
+    filename = file_info.get('name', 'unknown')
+    try:
+        # Process each file
+        filepath = file_info.get('path', '')
+        # Uploads held in memory arrive with their bytes
+        source = file_info.get('data')
+
+        if source is None and not os.path.exists(filepath):
+            return {
+                'filename': filename,
+                'valid': False,
+                'error': 'File not found'
+            }
+
+        extension = os.path.splitext(filename)[1].lstrip('.')
+        cache = get_cache() if use_cache else None
+        if cache is not None:
+            # Batch entries carry no trace, but their step count is 0 when tracing is off
+            cache_key = cache.make_key(
+                f'batch-{validator_type}',
+                file_cache_input(validator_type, filepath, extension, source),
+                'off' if trace_level == 'off' else 'counted'
+            )
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return dict(cached, filename=filename)
+
+        # Process based on validator type
+        if source is None:
+            source = filepath
+        pda = PDA(trace=trace_level, window=trace_window)
+        is_valid = False
+
+        if validator_type == 'filename':
+            is_valid, history = pda.process_filename(os.path.basename(filepath))
+
+        elif validator_type == 'content':
+            is_valid, history = validate_content(pda, source)
+
+        elif validator_type == 'filetype':
+            is_valid, history = pda.process_filetype(extension)
+
+        elif validator_type == 'xml':
+            content, content_type = read_file_content(source)
+            if content_type != 'text':
+                return {
+                    'filename': filename,
+                    'valid': False,
+                    'error': 'Not text-based XML'
+                }
+            is_valid, history = stream_validate_file(pda, source, 'xml', block_size)
+
+        elif validator_type == 'multilevel':
+            content, content_type = read_file_content(source)
+            if content_type == 'text' and '<' in content and '>' in content:
+                is_valid, history = stream_validate_file(pda, source, 'multilevel', block_size)
+            elif content_type == 'text':
+                is_valid, history = pda.process_multilevel(content[:500])
+            else:
+                is_valid, history = pda.process_multilevel(f"<file>{os.path.basename(filepath)}</file>")
+
+        result = {
+            'valid': is_valid,
+            'steps': pda.steps,
+            'final_state': pda.current_state,
+            'stack_size': len(pda.stack)
+        }
+        if cache is not None:
+            cache.put(cache_key, result)
+        return dict(result, filename=filename)
+
+    except Exception as e:
+        return {
+            'filename': filename,
+            'valid': False,
+            'error': str(e)
+        }
+
+
+def _worker_validate(rules_source, rules_version, chunk, options):
+    """Pool entry point: sync the worker's rules with the parent, then validate a chunk of files"""
+    if get_rules().version != rules_version:
+        reload_rules(rules_source)
+    return [validate_file(file_info, *options) for file_info in chunk]
+
+
+def _chunks(files, size):
+    """Lists of up to ``size`` consecutive items of an iterator"""
+    while True:
+        chunk = list(itertools.islice(files, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+_pool = None
+_pool_workers = 0
+# Batches using each pool; a retired pool is stopped when its last batch is done
+_pool_users = {}
+_pool_lock = threading.Lock()
+
+
+def _acquire_pool(workers):
+    """The shared pool for ``workers`` workers; release it with _release_pool()"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            # Batches still running on a pool of another size keep it until they finish
+            if _pool is not None and not _pool_users.get(_pool):
+                _stop_pool(_pool)
+            # spawn: forking a multi-threaded server process is not safe
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        _pool_users[_pool] = _pool_users.get(_pool, 0) + 1
+        return _pool
+
+
+def _release_pool(pool):
+    with _pool_lock:
+        users = _pool_users.pop(pool, 1) - 1
+        if users:
+            _pool_users[pool] = users
+            return
+        if pool is _pool:
+            return
+    _stop_pool(pool)
+
+
+def _retire_pool(pool):
+    """Give later batches a fresh pool instead of one whose workers hung or died.
+
+    Batches already running on ``pool`` keep it, so their files are not
+    lost; it is stopped once the last of them releases it.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+
+
+def _stop_pool(pool):
+    pool.shutdown(wait=False, cancel_futures=True)
+    # Executor offers no public way to stop a worker stuck in a task
+    for process in list((getattr(pool, '_processes', None) or {}).values()):
+        process.terminate()
+
+
+def shutdown_pool():
+    """Stop the shared worker pool, if one was started"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+        if pool is not None:
+            _pool_users.pop(pool, None)
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def runs_in_process(count, workers):
+    """True when iter_batch validates a batch of ``count`` files without the pool"""
+    return workers <= 1 or count < PARALLEL_MIN_FILES
+
+
+def iter_batch(files_info, validator_type, trace_level='summary', trace_window=None,
+               workers=DEFAULT_WORKERS, timeout=DEFAULT_FILE_TIMEOUT, block_size=STREAM_BLOCK_SIZE,
+               chunk_size=1, use_cache=True):
+    """Yield one result per file, in input order.
+
+    Small batches (or workers <= 1) run in this process. Larger ones are
+    spread across a shared spawn-based process pool; workers receive file
+    paths and read (memory-mapping large files) themselves, so contents
+    are never pickled. ``files_info`` may be any iterable: it is consumed
+    as the pool frees up, ``chunk_size`` files per task, and only a few
+    tasks per worker are in flight at once, so memory stays flat however
+    large the batch. A task that takes longer than ``timeout`` seconds
+    per file to come back is reported as an error and this batch moves
+    to a fresh pool, leaving the old one to the batches still using it;
+    a failed chunk is retried file by file first, so only the file at
+    fault is lost.
+    """
+    options = (validator_type, trace_level, trace_window, block_size, use_cache)
+    files = iter(files_info)
+    head = list(itertools.islice(files, PARALLEL_MIN_FILES))
+
+    if runs_in_process(len(head), workers):
+        for file_info in itertools.chain(head, files):
+            yield validate_file(file_info, *options)
+        return
+
+    chunks = _chunks(itertools.chain(head, files), max(1, chunk_size))
+    rules = get_rules()
+    pool = _acquire_pool(workers)
+    window = workers * IN_FLIGHT_PER_WORKER
+    pending = deque()
+
+    def submit(chunk):
+        return chunk, pool.submit(_worker_validate, rules.source, rules.version, chunk, options)
+
+    try:
+        while True:
+            while len(pending) < window:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pending.append(submit(chunk))
+            if not pending:
+                break
+
+            chunk, future = pending.popleft()
+            try:
+                results = future.result(timeout=timeout * len(chunk))
+            except FutureTimeoutError:
+                error = f'Timeout after {timeout}s'
+            except BrokenProcessPool as e:
+                error = f'Worker failed: {e}'
+            else:
+                yield from results
+                continue
+
+            # Move to a fresh pool and resubmit every in-flight chunk that has
+            # not already finished cleanly
+            retired, pool = pool, None
+            _retire_pool(retired)
+            _release_pool(retired)
+            pool = _acquire_pool(workers)
+            resubmitted = deque()
+            if len(chunk) > 1:
+                resubmitted.extend(submit([file_info]) for file_info in chunk)
+            else:
+                yield {'filename': chunk[0].get('name', 'unknown'), 'valid': False, 'error': error}
+            for later, future in pending:
+                if not future.done() or future.cancelled() or future.exception() is not None:
+                    future.cancel()
+                    resubmitted.append(submit(later))
+                else:
+                    resubmitted.append((later, future))
+            pending = resubmitted
+    finally:
+        for _, future in pending:
+            future.cancel()
+        if pool is not None:
+            _release_pool(pool)
+
+
+def run_batch(files_info, validator_type, **options):
+    """Validate a batch and return the results list in input order"""
+    return list(iter_batch(files_info, validator_type, **options))
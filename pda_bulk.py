@@ -0,0 +1,225 @@
+"""Bulk filename validation for large name inventories.
+
+validate_filenames() gives, for every name, the verdict and the final
+history action PDA.process_filename would produce, without running the
+PDA per name. With NumPy installed, ASCII names are packed into a
+fixed-width byte matrix and classified with lookup tables; dots and
+offending characters are found with row reductions and extensions are
+compared as packed integers. Other names, and everything when NumPy is
+missing, go through a scalar loop over the same rules.
+differential_check() compares either path against the PDA itself.
+"""
+
+from pda_engine import PDA, FILENAME_RUNTIME, FILENAME_SPECIAL, OTHER
+from pda_rules import get_rules
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Names per vectorized chunk, and longest name packed into the matrix
+CHUNK_NAMES = 16384
+MAX_PACKED_LENGTH = 255
+# Extensions up to this many bytes are compared as one packed integer
+_PACKED_EXTENSION_BYTES = 8
+
+
+def _runtime_message(state, input_class):
+    for transition in FILENAME_RUNTIME.transitions:
+        if transition.state == state and transition.input == input_class:
+            return transition.message
+    raise LookupError(f'No filename transition for ({state}, {input_class})')
+
+
+# Final actions of process_filename; the per-character ones come from its table
+ACCEPT_REASON = 'ACCEPT - Nama file valid'
+NO_DOT_REASON = 'REJECT - Tidak ada titik'
+SPECIAL_REASON = _runtime_message('q0', FILENAME_SPECIAL)
+OTHER_REASON = _runtime_message('q0', OTHER)
+EXTENSION_CHAR_REASON = _runtime_message('q_dot', OTHER)
+
+
+def extension_reason(extension):
+    return f'REJECT - Ekstensi {extension} tidak valid'
+
+
+def filename_verdict(name, extensions):
+    """(valid, final action) for one name, following the filename PDA"""
+    dot = -1
+    for i, char in enumerate(name):
+        if char.isalnum():
+            continue
+        if dot >= 0:
+            # After the dot only letters and digits may follow
+            return False, EXTENSION_CHAR_REASON
+        if char == '.':
+            dot = i
+        elif char == '_':
+            continue
+        elif char in FILENAME_SPECIAL:
+            return False, SPECIAL_REASON
+        else:
+            return False, OTHER_REASON
+    if dot < 0:
+        return False, NO_DOT_REASON
+    extension = name[dot + 1:].lower()
+    if extension not in extensions:
+        return False, extension_reason(extension)
+    return True, ACCEPT_REASON
+
+
+# Codes produced by the vectorized kernel
+_ACCEPT, _SPECIAL, _OTHER, _NO_DOT, _EXTENSION_CHAR, _EXTENSION, _SCALAR = range(7)
+_CODE_REASONS = {
+    _ACCEPT: ACCEPT_REASON,
+    _SPECIAL: SPECIAL_REASON,
+    _OTHER: OTHER_REASON,
+    _NO_DOT: NO_DOT_REASON,
+    _EXTENSION_CHAR: EXTENSION_CHAR_REASON
+}
+
+# Flags of each byte, matching the filename table for ASCII. Rows are
+# padded with a byte no ASCII name contains, which carries no flags.
+_DOT_FLAG, _SPECIAL_FLAG, _OTHER_FLAG, _NOT_ALNUM_FLAG = 1, 2, 4, 8
+_PAD_BYTE = 0xFF
+
+
+def _ascii_flags(byte):
+    char = chr(byte)
+    if char.isalnum():
+        return 0
+    if char == '.':
+        return _DOT_FLAG | _NOT_ALNUM_FLAG
+    if char == '_':
+        return _NOT_ALNUM_FLAG
+    if char in FILENAME_SPECIAL:
+        return _SPECIAL_FLAG | _NOT_ALNUM_FLAG
+    return _OTHER_FLAG | _NOT_ALNUM_FLAG
+
+
+def _pack_extension(extension):
+    """Little-endian integer of an extension's bytes (they are never zero)"""
+    return int.from_bytes(extension.encode('ascii'), 'little')
+
+
+class _Kernel:
+    """Lookup tables and the allowed-extension keys for one rules version"""
+
+    def __init__(self, extensions):
+        self.extensions = extensions
+        self.flag_table = np.array([_ascii_flags(byte) for byte in range(128)] + [0] * 128, dtype=np.uint8)
+        self.lower_table = np.array([ord(chr(byte).lower()) if byte < 128 else byte for byte in range(256)], dtype=np.uint64)
+        self.allowed = np.array(sorted(
+            _pack_extension(ext) for ext in extensions
+            if ext.isascii() and ext.isalnum() and len(ext) <= _PACKED_EXTENSION_BYTES
+        ), dtype=np.uint64)
+
+    def codes(self, data, lengths):
+        """(codes, dot positions) for ASCII names concatenated in ``data``"""
+        count = len(lengths)
+        width = max(1, int(lengths.max()))
+        rows = np.arange(count)
+        # Row-major order of the mask is the order of the concatenated bytes
+        matrix = np.full((count, width), _PAD_BYTE, dtype=np.uint8)
+        matrix[np.arange(width) < lengths[:, None]] = np.frombuffer(data, dtype=np.uint8)
+        flags = np.take(self.flag_table, matrix)
+
+        dots = flags & _DOT_FLAG
+        first_dot = dots.argmax(axis=1)
+        has_dot = dots[rows, first_dot] != 0
+        first_dot = np.where(has_dot, first_dot, lengths)
+
+        # The first offending character decides the reason if it is before the dot
+        bad = flags & (_SPECIAL_FLAG | _OTHER_FLAG)
+        first_bad = (bad != 0).argmax(axis=1)
+        bad_flag = bad[rows, first_bad]
+        bad_before = (bad_flag != 0) & (first_bad < first_dot)
+        # After the dot, which is itself not alphanumeric, only letters and digits may follow
+        last_not_alnum = width - 1 - (flags & _NOT_ALNUM_FLAG)[:, ::-1].argmax(axis=1)
+        bad_after = has_dot & (last_not_alnum > first_dot)
+
+        # Up to 8 extension bytes, lower-cased and packed into one integer
+        extension_length = lengths - first_dot - 1
+        offsets = np.arange(_PACKED_EXTENSION_BYTES)
+        columns = np.minimum(first_dot[:, None] + 1 + offsets, width - 1)
+        extension_bytes = np.take(self.lower_table, matrix[rows[:, None], columns])
+        extension_bytes[offsets >= extension_length[:, None]] = 0
+        packed = (extension_bytes << (offsets * 8).astype(np.uint64)).sum(axis=1, dtype=np.uint64)
+        allowed = np.isin(packed, self.allowed)
+
+        codes = np.full(count, _ACCEPT, dtype=np.uint8)
+        codes[~allowed] = _EXTENSION
+        # Long or empty extensions are looked up in the set one by one
+        codes[(extension_length > _PACKED_EXTENSION_BYTES) | (extension_length == 0)] = _SCALAR
+        codes[bad_after] = _EXTENSION_CHAR
+        codes[~has_dot] = _NO_DOT
+        codes[bad_before & (bad_flag == _SPECIAL_FLAG)] = _SPECIAL
+        codes[bad_before & (bad_flag == _OTHER_FLAG)] = _OTHER
+        return codes, first_dot
+
+
+def _kernel_for(rules):
+    kernel = _kernels.get(rules.version)
+    if kernel is None:
+        kernel = _kernels[rules.version] = _Kernel(rules.filename_extensions)
+    return kernel
+
+
+_kernels = {}
+
+
+def validate_filenames(names, rules=None):
+    """([valid, ...], [final action, ...]) for a list of filenames"""
+    rules = rules or get_rules()
+    extensions = rules.filename_extensions
+    valid = [False] * len(names)
+    reasons = [None] * len(names)
+
+    if np is None:
+        for i, name in enumerate(names):
+            valid[i], reasons[i] = filename_verdict(name, extensions)
+        return valid, reasons
+
+    kernel = _kernel_for(rules)
+    for start in range(0, len(names), CHUNK_NAMES):
+        chunk = names[start:start + CHUNK_NAMES]
+        lengths = np.fromiter(map(len, chunk), dtype=np.int64, count=len(chunk))
+        packable = lengths <= MAX_PACKED_LENGTH
+        text = ''.join(chunk)
+        if not text.isascii():
+            packable &= np.fromiter(map(str.isascii, chunk), dtype=bool, count=len(chunk))
+        codes = np.full(len(chunk), _SCALAR, dtype=np.uint8)
+        first_dot = np.zeros(len(chunk), dtype=np.int64)
+        if packable.all():
+            codes, first_dot = kernel.codes(text.encode('ascii'), lengths)
+        elif packable.any():
+            indices = np.flatnonzero(packable)
+            data = ''.join([chunk[i] for i in indices.tolist()]).encode('ascii')
+            codes[indices], first_dot[indices] = kernel.codes(data, lengths[indices])
+
+        valid[start:start + len(chunk)] = (codes == _ACCEPT).tolist()
+        reasons[start:start + len(chunk)] = [_CODE_REASONS.get(code) for code in codes.tolist()]
+        for i in np.flatnonzero(codes == _EXTENSION).tolist():
+            reasons[start + i] = extension_reason(chunk[i][first_dot[i] + 1:].lower())
+        for i in np.flatnonzero(codes == _SCALAR).tolist():
+            valid[start + i], reasons[start + i] = filename_verdict(chunk[i], extensions)
+    return valid, reasons
+
+
+def differential_check(names):
+    """Names whose bulk result differs from PDA.process_filename: [(name, bulk, pda), ...]"""
+    valid, reasons = validate_filenames(names)
+    mismatches = []
+    for name, bulk_valid, bulk_reason in zip(names, valid, reasons):
+        pda = PDA(trace='windowed', window=(0, 1))
+        pda_valid, history = pda.process_filename(name)
+        expected = (pda_valid, history[-1]['action'])
+        if (bulk_valid, bulk_reason) != expected:
+            mismatches.append((name, (bulk_valid, bulk_reason), expected))
+    return mismatches
+
+
+def kernel_name():
+    """'numpy' when the vectorized kernel is available, else 'python'"""
+    return 'python' if np is None else 'numpy'
@@ -0,0 +1,235 @@
+"""Content-addressed cache for validation results"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from pda_engine import ENGINE_VERSION
+from pda_rules import get_rules, on_reload
+
+DEFAULT_MEMORY_BYTES = 64 * 1024 * 1024
+DEFAULT_ENTRY_BYTES = 1024 * 1024
+DEFAULT_DISK_BYTES = 512 * 1024 * 1024
+DEFAULT_DISK_PATH = os.path.join(tempfile.gettempdir(), 'pda_result_cache.sqlite3')
+
+logger = logging.getLogger(__name__)
+
+
+def digest(data):
+    """Content hash used in cache keys"""
+    if isinstance(data, str):
+        data = data.encode('utf-8', 'surrogatepass')
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """Two-tier cache of validation results keyed by validator, versions and input hash.
+
+    The first tier is an in-process LRU bounded by the encoded size of its
+    entries. The second is a SQLite file shared by every server and batch
+    worker process on the host; hits there are promoted into the LRU.
+    Keys embed ENGINE_VERSION and the rules version, and a rules reload
+    also drops entries made under older rules.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MEMORY_BYTES, max_entry_bytes=DEFAULT_ENTRY_BYTES,
+                 disk_path=DEFAULT_DISK_PATH, disk_max_bytes=DEFAULT_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.disk_path = disk_path
+        self.disk_max_bytes = disk_max_bytes
+
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._disk_writes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def make_key(self, validator_type, input_digest, variant=''):
+        """Cache key for one validator run over an input with the given digest"""
+        return f'{validator_type}:{ENGINE_VERSION}:{get_rules().version}:{variant}:{input_digest}'
+
+    def get(self, key):
+        """Cached result for ``key`` or None; the result is shared, do not mutate it"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        encoded = self._disk_get(key)
+        if encoded is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        value = json.loads(encoded)
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, value, len(encoded))
+        return value
+
+    def put(self, key, value, encoded=None):
+        """Store a JSON-serializable result; oversized results are skipped"""
+        if encoded is None:
+            encoded = json.dumps(value, ensure_ascii=False)
+        size = len(encoded)
+        if size > self.max_entry_bytes:
+            return False
+
+        with self._lock:
+            self.stores += 1
+            self._remember(key, value, size)
+        self._disk_put(key, encoded)
+        return True
+
+    def _remember(self, key, value, size):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= previous[1]
+        self._entries[key] = (value, size)
+        self._size += size
+        while self._size > self.max_bytes and self._entries:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._size -= evicted
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        self._disk_execute('DELETE FROM results')
+
+    def invalidate(self, rules):
+        """Forget results computed under rules other than ``rules``"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        self._disk_execute('DELETE FROM results WHERE rules_version != ?', (rules.version,))
+
+    def stats(self):
+        """Hit/miss counters and tier sizes"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_ratio': round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'disk_path': self.disk_path or None
+            }
+
+    # Shared on-disk tier
+
+    def _connect(self):
+        if not self.disk_path:
+            return None
+        db = getattr(self._local, 'db', None)
+        if db is not None and self._local.pid == os.getpid():
+            return db
+        try:
+            db = sqlite3.connect(self.disk_path, timeout=5)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, '
+                'rules_version TEXT NOT NULL, created REAL NOT NULL)'
+            )
+            db.execute('CREATE INDEX IF NOT EXISTS results_created ON results (created)')
+        except sqlite3.Error as e:
+            logger.warning(f'Disk cache disabled ({self.disk_path}): {e}')
+            self.disk_path = None
+            return None
+        self._local.db = db
+        self._local.pid = os.getpid()
+        return db
+
+    def _disk_execute(self, sql, params=()):
+        db = self._connect()
+        if db is None:
+            return
+        try:
+            with db:
+                db.execute(sql, params)
+        except sqlite3.Error as e:
+            logger.warning(f'Disk cache update failed: {e}')
+
+    def _disk_get(self, key):
+        db = self._connect()
+        if db is None:
+            return None
+        try:
+            row = db.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f'Disk cache read failed: {e}')
+            return None
+        return row[0] if row else None
+
+    def _disk_put(self, key, encoded):
+        db = self._connect()
+        if db is None:
+            return
+        rules_version = key.split(':', 3)[2]
+        try:
+            with db:
+                db.execute(
+                    'INSERT OR REPLACE INTO results (key, value, size, rules_version, created) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (key, encoded, len(encoded), rules_version, time.time())
+                )
+            self._disk_writes += 1
+            if self._disk_writes % 256 == 0:
+                self._trim_disk(db)
+        except sqlite3.Error as e:
+            logger.warning(f'Disk cache write failed: {e}')
+
+    def _trim_disk(self, db):
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        if total <= self.disk_max_bytes:
+            return
+        # Drop the oldest quarter by insertion time
+        with db:
+            db.execute(
+                'DELETE FROM results WHERE key IN '
+                '(SELECT key FROM results ORDER BY created LIMIT (SELECT COUNT(*) / 4 + 1 FROM results))'
+            )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Process-wide ResultCache configured from the environment"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache(
+                    max_bytes=int(os.environ.get('PDA_CACHE_MEMORY_BYTES', DEFAULT_MEMORY_BYTES)),
+                    max_entry_bytes=int(os.environ.get('PDA_CACHE_ENTRY_BYTES', DEFAULT_ENTRY_BYTES)),
+                    disk_path=os.environ.get('PDA_CACHE_PATH', DEFAULT_DISK_PATH),
+                    disk_max_bytes=int(os.environ.get('PDA_CACHE_DISK_BYTES', DEFAULT_DISK_BYTES))
+                )
+                on_reload(_cache.invalidate)
+    return _cache
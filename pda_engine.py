@@ -1,59 +1,320 @@
+import codecs
+import random
+
+from pda_runtime import (
+    PDARuntime, ChainPattern, TagStack, EOF, ANY, TAG,
+    READ, SKIP, PUSH, POP, BUFFER, CLEAR, REJECT
+)
+from pda_rules import get_rules
+from pda_ooxml import OOXMLPackage, ArchiveError, REQUIRED_PARTS
+from pda_pdf import PDFFile, PDFError
+from pda_signatures import HEADER_TRIE, byte_label, match_header, match_trailer
+from pda_trace import make_trace
+
+# Bump whenever a validator's verdicts or histories change, so cached results are not reused
+ENGINE_VERSION = '6'
+
+# Leading bytes checked as plain text when no signature matches
+TEXT_SAMPLE_BYTES = 50
+
+# Filename validator: letters, digits and '_' then one dot and an alphanumeric extension
+ALNUM = 'a-z/A-Z/0-9'
+FILENAME_SPECIAL = '@?#!%&*'
+OTHER = 'lainnya'
+
+
+def _classify_filename_char(char):
+    if char.isalnum():
+        return ALNUM
+    if char in ('_', '.'):
+        return char
+    if char in FILENAME_SPECIAL:
+        return FILENAME_SPECIAL
+    return OTHER
+
+
+FILENAME_RUNTIME = PDARuntime('filename', 'q0', (ALNUM, '_', '.', FILENAME_SPECIAL, OTHER), _classify_filename_char, [
+    ('q0', ALNUM, 'Z0', 'q0', READ, None, 'READ - Karakter valid'),
+    ('q0', '_', 'Z0', 'q0', READ, None, 'READ - Karakter valid'),
+    ('q0', '.', 'Z0', 'q_dot', PUSH, '.', 'PUSH . - Titik ditemukan'),
+    ('q0', FILENAME_SPECIAL, 'Z0', 'q_reject', REJECT, None, 'REJECT - Karakter tidak valid'),
+    ('q0', OTHER, 'Z0', 'q_reject', REJECT, None, 'REJECT - Karakter tidak diizinkan'),
+    ('q_dot', ALNUM, '.', 'q_dot', READ, None, 'READ - Bagian ekstensi'),
+    ('q_dot', '_', '.', 'q_reject', REJECT, None, 'REJECT - Ekstensi tidak valid'),
+    ('q_dot', '.', '.', 'q_reject', REJECT, None, 'REJECT - Ekstensi tidak valid'),
+    ('q_dot', FILENAME_SPECIAL, '.', 'q_reject', REJECT, None, 'REJECT - Ekstensi tidak valid'),
+    ('q_dot', OTHER, '.', 'q_reject', REJECT, None, 'REJECT - Ekstensi tidak valid'),
+])
+
+# The same table as one regex, used by process_filename when no trace is kept.
+# [^\W_] is exactly str.isalnum() for str patterns.
+FILENAME_PATTERN = ChainPattern(FILENAME_RUNTIME, {ALNUM: r'[^\W_]', '_': '_', '.': r'\.'})
+
+
+# XML validator: opening tags push their name, closing tags pop the matching name.
+# After '<' the PDA waits in q_lt for the next character to tell '<tag' from '</tag'.
+def _classify_xml_char(char):
+    if char in ('<', '/', '>'):
+        return char
+    return OTHER
+
+
+XML_RUNTIME = PDARuntime('xml', 'q0', ('<', '/', '>', OTHER), _classify_xml_char, [
+    ('q0', '<', ANY, 'q_lt', SKIP),
+    ('q0', '/', ANY, 'q0', SKIP),
+    ('q0', '>', ANY, 'q0', SKIP),
+    ('q0', OTHER, ANY, 'q0', SKIP),
+    ('q_content', '<', ANY, 'q_lt', SKIP),
+    ('q_content', '/', ANY, 'q_content', READ, None, 'READ - Konten'),
+    ('q_content', '>', ANY, 'q_content', SKIP),
+    ('q_content', OTHER, ANY, 'q_content', READ, None, 'READ - Konten'),
+    ('q_lt', '/', ANY, 'q_close_tag', CLEAR, None, 'READ - Tag penutup', '</'),
+    ('q_lt', '<', ANY, 'q_lt', CLEAR, None, 'READ - Tag pembuka', '<'),
+    ('q_lt', '>', ANY, 'q_open_tag', CLEAR, None, 'READ - Tag pembuka', '<', False),
+    ('q_lt', OTHER, ANY, 'q_open_tag', CLEAR, None, 'READ - Tag pembuka', '<', False),
+    ('q_lt', EOF, ANY, 'q_open_tag', CLEAR, None, 'READ - Tag pembuka', '<', False),
+    ('q_open_tag', '<', ANY, 'q_lt', SKIP),
+    ('q_open_tag', '/', ANY, 'q_open_tag', BUFFER),
+    ('q_open_tag', OTHER, ANY, 'q_open_tag', BUFFER),
+    ('q_open_tag', '>', ANY, 'q_content', PUSH, TAG, 'PUSH {tag} - Tag pembuka'),
+    ('q_close_tag', '<', ANY, 'q_lt', SKIP),
+    ('q_close_tag', '/', ANY, 'q_close_tag', BUFFER),
+    ('q_close_tag', OTHER, ANY, 'q_close_tag', BUFFER),
+    ('q_close_tag', '>', TAG, 'q_content', POP, None, 'POP {tag} - Tag penutup cocok'),
+    ('q_close_tag', '>', ANY, 'q_reject', REJECT, None, 'REJECT - Tag tidak cocok (dibuka: {top}, ditutup: {tag})'),
+])
+
+
+# XML parts of OOXML packages: real XML with attributes, empty-element tags,
+# the <?xml?> prolog and <!...> declarations. Character data is skipped, so
+# the history holds one row per tag rather than one per character.
+WHITESPACE = 'spasi'
+XML_PART_CLASSES = ('<', '>', '/', '?', '!', '"', "'", WHITESPACE, OTHER)
+
+
+def _classify_xml_part_char(char):
+    if char in ' \t\r\n':
+        return WHITESPACE
+    if char in XML_PART_CLASSES:
+        return char
+    return OTHER
+
+
+def _otherwise(classes, state, new_state, op, message='', *listed):
+    """Rows taking every input class not in ``listed`` from ``state`` to ``new_state``"""
+    return [(state, cls, ANY, new_state, op, None, message) for cls in classes if cls not in listed]
+
+
+XML_PART_RUNTIME = PDARuntime('xml-part', 'q0', XML_PART_CLASSES, _classify_xml_part_char, [
+    ('q0', '<', ANY, 'q_lt', SKIP),
+    *_otherwise(XML_PART_CLASSES, 'q0', 'q0', SKIP, '', '<'),
+    ('q_lt', '/', ANY, 'q_close_tag', CLEAR, None, 'READ - Tag penutup', '</'),
+    ('q_lt', '?', ANY, 'q_pi', SKIP),
+    ('q_lt', '!', ANY, 'q_decl', SKIP),
+    ('q_lt', OTHER, ANY, 'q_open_tag', CLEAR, None, 'READ - Tag pembuka', '<', False),
+    *_otherwise(XML_PART_CLASSES, 'q_lt', 'q_reject', REJECT, 'REJECT - Tag tidak valid', '/', '?', '!', OTHER),
+    ('q_open_tag', OTHER, ANY, 'q_open_tag', BUFFER),
+    ('q_open_tag', WHITESPACE, ANY, 'q_attrs', SKIP),
+    ('q_open_tag', '/', ANY, 'q_empty', SKIP),
+    ('q_open_tag', '>', ANY, 'q0', PUSH, TAG, 'PUSH {tag} - Tag pembuka'),
+    *_otherwise(XML_PART_CLASSES, 'q_open_tag', 'q_reject', REJECT, 'REJECT - Tag tidak valid', OTHER, WHITESPACE, '/', '>'),
+    ('q_attrs', '"', ANY, 'q_attr_dq', SKIP),
+    ('q_attrs', "'", ANY, 'q_attr_sq', SKIP),
+    ('q_attrs', '/', ANY, 'q_empty', SKIP),
+    ('q_attrs', '>', ANY, 'q0', PUSH, TAG, 'PUSH {tag} - Tag pembuka'),
+    ('q_attrs', '<', ANY, 'q_reject', REJECT, None, 'REJECT - Tag tidak valid'),
+    *_otherwise(XML_PART_CLASSES, 'q_attrs', 'q_attrs', SKIP, '', '"', "'", '/', '>', '<'),
+    ('q_attr_dq', '"', ANY, 'q_attrs', SKIP),
+    *_otherwise(XML_PART_CLASSES, 'q_attr_dq', 'q_attr_dq', SKIP, '', '"'),
+    ('q_attr_sq', "'", ANY, 'q_attrs', SKIP),
+    *_otherwise(XML_PART_CLASSES, 'q_attr_sq', 'q_attr_sq', SKIP, '', "'"),
+    ('q_empty', '>', ANY, 'q0', READ, None, 'READ {tag} - Tag kosong'),
+    *_otherwise(XML_PART_CLASSES, 'q_empty', 'q_reject', REJECT, 'REJECT - Tag tidak valid', '>'),
+    ('q_close_tag', OTHER, ANY, 'q_close_tag', BUFFER),
+    ('q_close_tag', WHITESPACE, ANY, 'q_close_end', SKIP),
+    ('q_close_tag', '>', TAG, 'q0', POP, None, 'POP {tag} - Tag penutup cocok'),
+    ('q_close_tag', '>', ANY, 'q_reject', REJECT, None, 'REJECT - Tag tidak cocok (dibuka: {top}, ditutup: {tag})'),
+    *_otherwise(XML_PART_CLASSES, 'q_close_tag', 'q_reject', REJECT, 'REJECT - Tag tidak valid', OTHER, WHITESPACE, '>'),
+    ('q_close_end', WHITESPACE, ANY, 'q_close_end', SKIP),
+    ('q_close_end', '>', TAG, 'q0', POP, None, 'POP {tag} - Tag penutup cocok'),
+    ('q_close_end', '>', ANY, 'q_reject', REJECT, None, 'REJECT - Tag tidak cocok (dibuka: {top}, ditutup: {tag})'),
+    *_otherwise(XML_PART_CLASSES, 'q_close_end', 'q_reject', REJECT, 'REJECT - Tag tidak valid', WHITESPACE, '>'),
+    # <?...?> processing instructions; <!...> declarations end at the first '>'
+    ('q_pi', '?', ANY, 'q_pi_end', SKIP),
+    *_otherwise(XML_PART_CLASSES, 'q_pi', 'q_pi', SKIP, '', '?'),
+    ('q_pi_end', '>', ANY, 'q0', SKIP),
+    ('q_pi_end', '?', ANY, 'q_pi_end', SKIP),
+    *_otherwise(XML_PART_CLASSES, 'q_pi_end', 'q_pi', SKIP, '', '>', '?'),
+    ('q_decl', '>', ANY, 'q0', SKIP),
+    *_otherwise(XML_PART_CLASSES, 'q_decl', 'q_decl', SKIP, '', '>'),
+    *[(state, EOF, ANY, 'q_reject', REJECT, None, 'REJECT - Dokumen terpotong') for state in (
+        'q_lt', 'q_open_tag', 'q_attrs', 'q_attr_dq', 'q_attr_sq', 'q_empty',
+        'q_close_tag', 'q_close_end', 'q_pi', 'q_pi_end', 'q_decl')],
+])
+
+
+# Multi-level validator: the XML table, with every text node run through the
+# filename table as it is read. Text nodes of only whitespace are skipped.
+# The extension replaces the tag name in the buffer and is checked against
+# the rules where the node ends, then the '.' pushed for the dot is popped.
+MULTILEVEL_CLASSES = ('<', '/', '>', ALNUM, '_', '.', FILENAME_SPECIAL, OTHER, WHITESPACE)
+KNOWN_EXTENSION = 'ekstensi valid'
+
+
+def _classify_multilevel_char(char):
+    if char in ('<', '/', '>'):
+        return char
+    if char in ' \t\r\n':
+        return WHITESPACE
+    return _classify_filename_char(char)
+
+
+def _known_extension(pda):
+    return pda._tag_buffer.lower() in get_rules().filename_extensions
+
+
+def _tag_rows():
+    """The XML rows outside text nodes, with OTHER split into the multi-level classes"""
+    rows = []
+    for t in XML_RUNTIME.transitions:
+        if t.state == 'q_content':
+            continue
+        if t.input == OTHER:
+            rows.extend(t._replace(input=cls) for cls in MULTILEVEL_CLASSES[3:])
+        else:
+            rows.append(t)
+    return rows
+
+
+def _filename_rows(state):
+    """Rows for the characters of a text node that follow the filename table from q0"""
+    return [
+        (state, ALNUM, ANY, 'q_text', READ, None, 'READ - Karakter valid'),
+        (state, '_', ANY, 'q_text', READ, None, 'READ - Karakter valid'),
+        (state, '.', ANY, 'q_text_dot', PUSH, '.', 'PUSH . - Titik ditemukan'),
+        (state, FILENAME_SPECIAL, ANY, 'q_reject', REJECT, None, 'REJECT - Karakter tidak valid'),
+        *[(state, cls, ANY, 'q_reject', REJECT, None, 'REJECT - Karakter tidak diizinkan') for cls in ('/', '>', OTHER)],
+    ]
+
+
+MULTILEVEL_RUNTIME = PDARuntime('multilevel', 'q0', MULTILEVEL_CLASSES, _classify_multilevel_char, [
+    *_tag_rows(),
+    # q_content starts a text node, q_blank holds one of only whitespace so far
+    ('q_content', '<', ANY, 'q_lt', SKIP),
+    ('q_content', WHITESPACE, ANY, 'q_blank', SKIP),
+    *_filename_rows('q_content'),
+    ('q_blank', '<', ANY, 'q_lt', SKIP),
+    ('q_blank', WHITESPACE, ANY, 'q_blank', SKIP),
+    *_otherwise(MULTILEVEL_CLASSES, 'q_blank', 'q_reject', REJECT, 'REJECT - Karakter tidak diizinkan', '<', WHITESPACE),
+    *_filename_rows('q_text'),
+    ('q_text', WHITESPACE, ANY, 'q_reject', REJECT, None, 'REJECT - Karakter tidak diizinkan'),
+    ('q_text', '<', ANY, 'q_reject', REJECT, None, 'REJECT - Tidak ada titik'),
+    ('q_text', EOF, ANY, 'q_reject', REJECT, None, 'REJECT - Tidak ada titik'),
+    ('q_text_dot', ALNUM, ANY, 'q_text_ext', CLEAR, None, 'READ - Bagian ekstensi', None, False),
+    *_otherwise(MULTILEVEL_CLASSES, 'q_text_dot', 'q_reject', REJECT, 'REJECT - Ekstensi tidak valid', ALNUM),
+    ('q_text_dot', EOF, ANY, 'q_reject', REJECT, None, 'REJECT - Ekstensi tidak valid'),
+    ('q_text_ext', ALNUM, ANY, 'q_text_ext', BUFFER),
+    *_otherwise(MULTILEVEL_CLASSES, 'q_text_ext', 'q_reject', REJECT, 'REJECT - Ekstensi tidak valid', ALNUM, '<'),
+    *[row for end in ('<', EOF) for row in (
+        ('q_text_ext', end, KNOWN_EXTENSION, 'q_text_end', SKIP, None, '', None, False),
+        ('q_text_ext', end, ANY, 'q_reject', REJECT, None, 'REJECT - Ekstensi {tag} tidak valid'),
+    )],
+    ('q_text_end', '<', '.', 'q_lt', POP, None, 'POP . - Ekstensi valid'),
+    ('q_text_end', EOF, '.', 'q_content', POP, None, 'POP . - Ekstensi valid'),
+], checks={KNOWN_EXTENSION: _known_extension})
+
+
+# PDF dictionaries and arrays: '<<' and '[' push, '>>' and ']' pop their match.
+# Literal strings may nest parentheses, so the outermost '(' pushes '(' and
+# nested ones push '((' to tell when the string ends. Hex strings <...> and
+# everything else are skipped.
+PDF_CLASSES = ('<', '>', '[', ']', '(', ')', '\\', OTHER)
+
+
+def _classify_pdf_char(char):
+    if char in PDF_CLASSES:
+        return char
+    return OTHER
+
+
+PDF_RUNTIME = PDARuntime('pdf', 'q0', PDF_CLASSES, _classify_pdf_char, [
+    ('q0', '<', ANY, 'q_lt', SKIP),
+    ('q0', '>', ANY, 'q_gt', SKIP),
+    ('q0', '[', ANY, 'q0', PUSH, '[', 'PUSH [ - Array dibuka'),
+    ('q0', ']', '[', 'q0', POP, None, 'POP [ - Array ditutup'),
+    ('q0', ']', ANY, 'q_reject', REJECT, None, 'REJECT - Delimiter tidak cocok (dibuka: {top}, ditutup: ])'),
+    ('q0', '(', ANY, 'q_string', PUSH, '(', 'PUSH ( - String dibuka'),
+    ('q0', ')', ANY, 'q_reject', REJECT, None, 'REJECT - Delimiter tidak cocok (dibuka: {top}, ditutup: ))'),
+    ('q0', '\\', ANY, 'q0', SKIP),
+    ('q0', OTHER, ANY, 'q0', SKIP),
+    ('q_lt', '<', ANY, 'q0', PUSH, '<<', 'PUSH << - Kamus dibuka', '<<'),
+    ('q_lt', '>', ANY, 'q0', SKIP),
+    ('q_lt', OTHER, ANY, 'q_hex', SKIP),
+    *_otherwise(PDF_CLASSES, 'q_lt', 'q_reject', REJECT, 'REJECT - Hex string tidak valid', '<', '>', OTHER),
+    ('q_hex', '>', ANY, 'q0', SKIP),
+    ('q_hex', OTHER, ANY, 'q_hex', SKIP),
+    *_otherwise(PDF_CLASSES, 'q_hex', 'q_reject', REJECT, 'REJECT - Hex string tidak valid', '>', OTHER),
+    ('q_gt', '>', '<<', 'q0', POP, None, 'POP << - Kamus ditutup', '>>'),
+    ('q_gt', '>', ANY, 'q_reject', REJECT, None, 'REJECT - Delimiter tidak cocok (dibuka: {top}, ditutup: >>)'),
+    *_otherwise(PDF_CLASSES, 'q_gt', 'q_reject', REJECT, 'REJECT - Delimiter tidak valid', '>'),
+    ('q_string', '(', ANY, 'q_string', PUSH, '((', 'PUSH (( - String bersarang'),
+    ('q_string', ')', '((', 'q_string', POP, None, 'POP (( - String bersarang ditutup'),
+    ('q_string', ')', '(', 'q0', POP, None, 'POP ( - String ditutup'),
+    ('q_string', '\\', ANY, 'q_escape', SKIP),
+    *_otherwise(PDF_CLASSES, 'q_string', 'q_string', SKIP, '', '(', ')', '\\'),
+    *_otherwise(PDF_CLASSES, 'q_escape', 'q_string', SKIP),
+    *[(state, EOF, ANY, 'q_reject', REJECT, None, 'REJECT - Kamus terpotong') for state in (
+        'q_lt', 'q_hex', 'q_gt', 'q_string', 'q_escape')],
+])
+
+
+# Validators run through begin(), feed() and finish(): (table, start action, accept action)
+FEED_VALIDATORS = {
+    'xml': (XML_RUNTIME, 'START - Validasi XML', 'ACCEPT - XML valid'),
+    'multilevel': (MULTILEVEL_RUNTIME, 'START - Validasi multi-level', 'ACCEPT - Validasi multi-level berhasil')
+}
+
+
 class PDA:
     """Pushdown Automata Engine for Document Validation"""
     
-    def __init__(self):
-        self.stack = ['Z0']
+    # Switched off by check_filename_fast_path() if it disagrees with the table
+    filename_fast_path = True
+    
+    def __init__(self, trace='full', window=None):
+        self.trace_level = trace
+        self.trace_window = window
+        self.stack = TagStack(('Z0',))
         self.current_state = 'q0'
-        self.history = []
+        self.history = make_trace(trace, window)
         
     def reset(self):
-        self.stack = ['Z0']
+        self.stack = TagStack(('Z0',))
         self.current_state = 'q0'
-        self.history = []
+        self.history = make_trace(self.trace_level, self.trace_window)
+    
+    @property
+    def steps(self):
+        """Total number of steps taken, including ones not retained in history"""
+        return self.history.steps
         
     def _add_history(self, char, action):
-        self.history.append({
-            'char': char,
-            'state': self.current_state,
-            'stack': self.stack.copy(),
-            'action': action
-        })
+        self.history.record(char, self.current_state, self.stack, action)
+    
+    def _add_history_run(self, chars, action):
+        self.history.record_run(chars, self.current_state, self.stack, action)
     
     def process_filename(self, filename):
         self.reset()
+        if self.trace_level == 'off' and self.filename_fast_path:
+            return self._match_filename(filename)
         self._add_history('ε', 'START - Validasi nama file')
         
-        dot_found = False
-        
-        for char in filename:
-            if self.current_state == 'q0':
-                if char.isalnum() or char == '_':
-                    self._add_history(char, 'READ - Karakter valid')
-                elif char == '.':
-                    if dot_found:
-                        self._add_history(char, 'REJECT - Lebih dari satu titik')
-                        self.current_state = 'q_reject'
-                        return False, self.history
-                    dot_found = True
-                    self.stack.append('.')
-                    self._add_history(char, 'PUSH . - Titik ditemukan')
-                    self.current_state = 'q_dot'
-                elif char in '@?#!%&*':
-                    self._add_history(char, 'REJECT - Karakter tidak valid')
-                    self.current_state = 'q_reject'
-                    return False, self.history
-                else:
-                    self._add_history(char, 'REJECT - Karakter tidak diizinkan')
-                    self.current_state = 'q_reject'
-                    return False, self.history
-            elif self.current_state == 'q_dot':
-                if char.isalnum():
-                    self._add_history(char, 'READ - Bagian ekstensi')
-                else:
-                    self._add_history(char, 'REJECT - Ekstensi tidak valid')
-                    self.current_state = 'q_reject'
-                    return False, self.history
+        FILENAME_RUNTIME.begin(self)
+        if not FILENAME_RUNTIME.feed(self, filename):
+            return False, self.history
         
+        dot_found = self.current_state == 'q_dot'
         if not dot_found:
             self._add_history('ε', 'REJECT - Tidak ada titik')
             self.current_state = 'q_reject'
@@ -66,9 +327,8 @@ class PDA:
             return False, self.history
         
         extension = parts[1].lower()
-        valid_extensions = ['pdf', 'docx', 'xlsx', 'txt', 'jpg', 'png', 'xml', 'html']
         
-        if extension not in valid_extensions:
+        if extension not in get_rules().filename_extensions:
             self._add_history('ε', f'REJECT - Ekstensi {extension} tidak valid')
             self.current_state = 'q_reject'
             return False, self.history
@@ -86,24 +346,45 @@ class PDA:
         self._add_history('ε', 'REJECT - Stack tidak kosong')
         return False, self.history
     
-    def process_content(self, content):
+    def _match_filename(self, filename):
+        """process_filename through FILENAME_PATTERN, for runs that keep no history"""
+        state, stack, read = FILENAME_PATTERN.run(filename)
+        self.stack = TagStack(stack)
+        self.current_state = 'q_reject'
+        if read < len(filename) or state != 'q_dot':
+            return False, self.history
+        if filename[filename.index('.') + 1:].lower() not in get_rules().filename_extensions:
+            return False, self.history
+        self.stack.pop()
+        self.current_state = 'q_accept'
+        return True, self.history
+    
+    def process_content(self, content, trailer=None):
+        """Detect the format from the leading bytes (or text) and, if given, the file's last bytes"""
         self.reset()
         self._add_history('ε', 'START - Validasi isi file')
         
-        if content.startswith('%PDF'):
-            for i in range(min(4, len(content))):
-                self._add_history(content[i], 'READ - Header PDF')
-            self.current_state = 'q_accept'
-            self._add_history('ε', 'ACCEPT - File PDF valid')
-            return True, self.history
-        
-        if content.startswith('PK'):
-            self._add_history('P', 'READ - Karakter pertama DOCX')
-            self._add_history('K', 'READ - Karakter kedua DOCX')
+        data = content.encode('utf-8', 'ignore') if isinstance(content, str) else content
+        signature, magic = match_header(data)
+        if signature is not None:
+            for byte in magic:
+                self._add_history(byte_label(byte), f'READ - Header {signature.label}')
+            
+            if trailer is not None and signature.trailer is not None:
+                if not match_trailer(signature, trailer):
+                    self.current_state = 'q_reject'
+                    self._add_history('ε', f'REJECT - Trailer {signature.label} tidak ditemukan')
+                    return False, self.history
+                for byte in signature.trailer:
+                    self._add_history(byte_label(byte), f'READ - Trailer {signature.label}')
+            
             self.current_state = 'q_accept'
-            self._add_history('ε', 'ACCEPT - File DOCX valid')
+            self._add_history('ε', f'ACCEPT - File {signature.label} valid')
             return True, self.history
         
+        # No known signature: plain text made of letters and digits only
+        if not isinstance(content, str):
+            content = str(bytes(data[:TEXT_SAMPLE_BYTES]), 'utf-8', 'ignore')
         if content.isalnum():
             for char in content[:10]:
                 self._add_history(char, 'READ - Karakter TXT valid')
@@ -115,27 +396,121 @@ class PDA:
         self._add_history('ε', 'REJECT - Format tidak dikenali')
         return False, self.history
     
+    def process_ooxml(self, source):
+        """Validate a DOCX/XLSX/PPTX package through its central directory and its XML index parts"""
+        self.reset()
+        self._add_history('ε', 'START - Validasi OOXML')
+        
+        try:
+            package = OOXMLPackage(source)
+        except ArchiveError as e:
+            self.current_state = 'q_reject'
+            self._add_history('ε', f'REJECT - {e}')
+            return False, self.history
+        
+        with package:
+            self._add_history('PK\\x05\\x06', f'READ - Central directory ({len(package.entries)} entri)')
+            for name in REQUIRED_PARTS:
+                if name not in package.entries:
+                    self.current_state = 'q_reject'
+                    self._add_history('ε', f'REJECT - Part {name} tidak ada')
+                    return False, self.history
+            
+            kind = package.kind
+            if kind is None:
+                self.current_state = 'q_reject'
+                self._add_history('ε', 'REJECT - Part dokumen utama tidak ditemukan')
+                return False, self.history
+            
+            for name in REQUIRED_PARTS:
+                if not self._check_xml_part(package, name):
+                    return False, self.history
+        
+        self.current_state = 'q_accept'
+        self._add_history('ε', f'ACCEPT - File {kind} valid')
+        return True, self.history
+    
+    def _check_xml_part(self, package, name):
+        """Run one part of a package through the XML part table, decompressing as it goes"""
+        self._add_history(name, 'READ - Part XML')
+        decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='ignore')
+        XML_PART_RUNTIME.begin(self)
+        try:
+            for block in package.iter_part(name):
+                if not XML_PART_RUNTIME.feed(self, decoder.decode(block)):
+                    return False
+        except ArchiveError as e:
+            self.current_state = 'q_reject'
+            self._add_history('ε', f'REJECT - {e}')
+            return False
+        
+        XML_PART_RUNTIME.feed(self, decoder.decode(b'', final=True))
+        if not XML_PART_RUNTIME.finish(self):
+            return False
+        if len(self.stack) > 1:
+            self.current_state = 'q_reject'
+            self._add_history('ε', f'REJECT - Tag belum ditutup di {name}: {", ".join(self.stack[1:])}')
+            return False
+        return True
+    
+    def process_pdf(self, source):
+        """Validate a PDF from its header, its tail and the xref section startxref points at"""
+        self.reset()
+        self._add_history('ε', 'START - Validasi PDF')
+        
+        try:
+            with PDFFile(source) as pdf:
+                version = pdf.header()
+                self._add_history(f'%PDF-{version}', 'READ - Header PDF')
+                offset = pdf.startxref()
+                self._add_history('%%EOF', 'READ - Trailer PDF')
+                self._add_history(str(offset), 'READ - startxref')
+                
+                section = pdf.read_xref(offset)
+                if section.kind == 'table':
+                    self._add_history('xref', f'READ - Tabel xref ({section.count} entri)')
+                else:
+                    self._add_history('/XRef', f'READ - Stream xref ({section.count} entri)')
+                if not self._check_pdf_dictionary(section.trailer):
+                    return False, self.history
+                if b'/Root' not in section.trailer:
+                    self.current_state = 'q_reject'
+                    self._add_history('ε', 'REJECT - Trailer tanpa /Root')
+                    return False, self.history
+                
+                for number, object_offset, generation in section.objects:
+                    if not pdf.check_object(number, object_offset, generation):
+                        self.current_state = 'q_reject'
+                        self._add_history('ε', f'REJECT - Objek {number} tidak ada di offset {object_offset}')
+                        return False, self.history
+                    self._add_history(f'{number} {generation} obj', f'READ - Objek {number} di offset {object_offset}')
+        except PDFError as e:
+            self.current_state = 'q_reject'
+            self._add_history('ε', f'REJECT - {e}')
+            return False, self.history
+        
+        self.current_state = 'q_accept'
+        self._add_history('ε', 'ACCEPT - File PDF valid')
+        return True, self.history
+    
+    def _check_pdf_dictionary(self, data):
+        """Match the << >> and [ ] delimiters of a trailer dictionary on the stack"""
+        PDF_RUNTIME.begin(self)
+        if not PDF_RUNTIME.feed(self, data.decode('latin-1')) or not PDF_RUNTIME.finish(self):
+            return False
+        if len(self.stack) > 1:
+            self.current_state = 'q_reject'
+            self._add_history('ε', f'REJECT - Delimiter belum ditutup: {", ".join(self.stack[1:])}')
+            return False
+        return True
+    
     def process_filetype(self, extension):
         self.reset()
         self._add_history('ε', 'START - Validasi tipe file')
         
         extension = extension.lower()
         
-        categories = {
-            'pdf': ['pdf'],
-            'doc': ['doc', 'docx'],
-            'gambar': ['jpg', 'jpeg', 'png', 'gif', 'bmp'],
-            'spreadsheet': ['xls', 'xlsx', 'csv'],
-            'teks': ['txt', 'text'],
-            'xml': ['xml', 'html', 'htm'],
-            'data': ['json', 'csv']
-        }
-        
-        found_category = None
-        for category, exts in categories.items():
-            if extension in exts:
-                found_category = category
-                break
+        found_category = get_rules().category_of(extension)
         
         if found_category:
             self._add_history(extension, f'READ - File {found_category}')
@@ -149,57 +524,39 @@ class PDA:
             return False, self.history
     
     def process_xml(self, xml_content):
-        self.reset()
-        self._add_history('ε', 'START - Validasi XML')
-        
-        tag_name = ''
-        in_tag = False
-        in_closing_tag = False
+        self.begin('xml')
+        self.feed(xml_content)
+        return self.finish()
+    
+    def begin(self, validator_type='xml', encoding='utf-8'):
+        """Start an incremental validation fed through feed() and finish(); bytes are decoded with ``encoding``"""
+        if validator_type not in FEED_VALIDATORS:
+            raise ValueError(f'Incremental validation not supported for {validator_type}')
         
-        i = 0
-        while i < len(xml_content):
-            char = xml_content[i]
-            
-            if char == '<':
-                if i + 1 < len(xml_content) and xml_content[i + 1] == '/':
-                    in_closing_tag = True
-                    self._add_history('</', 'READ - Tag penutup')
-                    i += 2
-                    continue
-                else:
-                    in_tag = True
-                    tag_name = ''
-                    self._add_history('<', 'READ - Tag pembuka')
-                    i += 1
-                    continue
-            elif char == '>':
-                if in_tag:
-                    self.stack.append(tag_name)
-                    self._add_history('>', f'PUSH {tag_name} - Tag pembuka')
-                    in_tag = False
-                    self.current_state = 'q_content'
-                elif in_closing_tag:
-                    if self.stack and self.stack[-1] == tag_name:
-                        self.stack.pop()
-                        self._add_history('>', f'POP {tag_name} - Tag penutup cocok')
-                    else:
-                        expected = self.stack[-1] if self.stack else 'nothing'
-                        self._add_history('>', f'REJECT - Tag tidak cocok (dibuka: {expected}, ditutup: {tag_name})')
-                        self.current_state = 'q_reject'
-                        return False, self.history
-                    in_closing_tag = False
-                i += 1
-                continue
-            elif in_tag or in_closing_tag:
-                tag_name += char
-            else:
-                if self.current_state == 'q_content':
-                    self._add_history(char, 'READ - Konten')
-            i += 1
+        self.reset()
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors='ignore')
+        self._runtime, start_message, self._accept_message = FEED_VALIDATORS[validator_type]
+        self._add_history('ε', start_message)
+        self._runtime.begin(self)
+    
+    def feed(self, chunk):
+        """Feed the next chunk of input, returns False once the input is rejected"""
+        if not isinstance(chunk, str):
+            chunk = self._decoder.decode(chunk)
+        return self._runtime.feed(self, chunk)
+    
+    def finish(self):
+        """End an incremental validation and return (valid, history)"""
+        # Characters still buffered in the decoder, if bytes were fed
+        tail = self._decoder.decode(b'', final=True)
+        if tail:
+            self._runtime.feed(self, tail)
+        if not self._runtime.finish(self):
+            return False, self.history
         
         if len(self.stack) == 1 and self.stack[0] == 'Z0':
             self.current_state = 'q_accept'
-            self._add_history('ε', 'ACCEPT - XML valid')
+            self._add_history('ε', self._accept_message)
             return True, self.history
         else:
             remaining_tags = self.stack[1:]
@@ -208,57 +565,67 @@ class PDA:
             return False, self.history
     
     def process_multilevel(self, content):
-        self.reset()
-        self._add_history('ε', 'START - Validasi multi-level')
-        
+        """Tag structure and every text node as a filename, in one pass; input without tags is validated as content"""
         if '<' in content and '>' in content:
-            xml_valid, xml_history = self.process_xml(content)
-            if not xml_valid:
-                return False, self.history
-            
-            import re
-            content_match = re.search(r'>(.*?)<', content)
-            if content_match and content_match.group(1):
-                inner_content = content_match.group(1)
-                
-                self._add_history('ε', 'CHECK - Validasi konten sebagai nama file')
-                filename_valid, filename_history = self.process_filename(inner_content)
-                
-                if filename_valid:
-                    for step in filename_history:
-                        if step not in self.history:
-                            self.history.append(step)
-                    self._add_history('ε', 'ACCEPT - Validasi multi-level berhasil')
-                    return True, self.history
-                else:
-                    self._add_history('ε', 'REJECT - Konten tidak valid sebagai nama file')
-                    return False, self.history
+            self.begin('multilevel')
+            self.feed(content)
+            return self.finish()
         
         return self.process_content(content)
     
     def get_transition_table(self, validator_type):
+        runtimes = {
+            'filename': [FILENAME_RUNTIME],
+            'xml': [XML_RUNTIME],
+            'multilevel': [MULTILEVEL_RUNTIME]
+        }
+        if validator_type in runtimes:
+            return [row for runtime in runtimes[validator_type] for row in runtime.describe()]
+        
+        # Content detection walks the signature trie; file types are a lookup
         tables = {
-            'filename': [
-                {'state': 'q0', 'input': 'a-z/A-Z/0-9/_', 'stack_top': 'Z0', 'new_state': 'q0', 'action': 'READ'},
-                {'state': 'q0', 'input': '.', 'stack_top': 'Z0', 'new_state': 'q_dot', 'action': 'PUSH .'},
-                {'state': 'q_dot', 'input': 'a-z/0-9', 'stack_top': '.', 'new_state': 'q_dot', 'action': 'READ'},
-            ],
-            'content': [
-                {'state': 'q0', 'input': '%', 'stack_top': 'Z0', 'new_state': 'q_pdf_check', 'action': 'CHECK PDF'},
-                {'state': 'q0', 'input': 'P', 'stack_top': 'Z0', 'new_state': 'q_docx_check', 'action': 'CHECK DOCX'},
-            ],
+            'content': HEADER_TRIE.describe(),
             'filetype': [
                 {'state': 'q0', 'input': 'pdf', 'stack_top': 'Z0', 'new_state': 'q_accept', 'action': 'ACCEPT (PDF)'},
                 {'state': 'q0', 'input': 'doc/docx', 'stack_top': 'Z0', 'new_state': 'q_accept', 'action': 'ACCEPT (DOC)'},
-            ],
-            'xml': [
-                {'state': 'q0', 'input': '<', 'stack_top': 'Z0', 'new_state': 'q_tag_open', 'action': 'READ TAG'},
-                {'state': 'q_tag_open', 'input': 'tag_name', 'stack_top': 'Z0', 'new_state': 'q_tag_push', 'action': 'PUSH tag'},
-            ],
-            'multilevel': [
-                {'state': 'q0', 'input': '<', 'stack_top': 'Z0', 'new_state': 'q_xml_parse', 'action': 'PARSE XML'},
-                {'state': 'q_xml_parse', 'input': 'content', 'stack_top': '*', 'new_state': 'q_filename_check', 'action': 'CHECK FILENAME'},
             ]
         }
         
-        return tables.get(validator_type, [])
\ No newline at end of file
+        return tables.get(validator_type, [])
+
+
+def _filename_samples(count, seed):
+    """Edge cases, then random strings over every filename input class"""
+    extensions = sorted(get_rules().filename_extensions)
+    samples = ['', '.', '..', '_', '_.', 'a.', '.a', 'a..b', 'a._b', 'a.b.c', 'a_b.', '__init__.py']
+    samples += [f'a.{ext}' for ext in extensions] + [f'a.{ext.upper()}' for ext in extensions]
+    alphabet = ['a', 'Z', '7', 'é', 'ß', '٣', 'ǅ', '²', '_', '.', ' ', '-', '\x00', '\n', '\u200b'] + list(FILENAME_SPECIAL)
+    rng = random.Random(seed)
+    for _ in range(count):
+        stem = ''.join(rng.choice(alphabet) for _ in range(rng.randrange(0, 8)))
+        if rng.random() < 0.5:
+            ext = rng.choice(extensions) if extensions else ''
+            ext = ''.join(c.upper() if rng.random() < 0.3 else c for c in ext)
+            stem += '.' + ext
+        samples.append(stem)
+    return samples
+
+
+def check_filename_fast_path(count=2000, seed=0):
+    """Compare the untraced fast path of process_filename with the table.
+
+    Runs ``count`` generated names through both; on any disagreement the
+    fast path is switched off and the mismatches, as (name, fast, table)
+    with (valid, state, stack) results, are returned.
+    """
+    mismatches = []
+    for name in _filename_samples(count, seed):
+        fast = PDA(trace='off')
+        table = PDA(trace='summary')
+        fast_result = (fast._match_filename(name)[0], fast.current_state, fast.stack)
+        table_result = (table.process_filename(name)[0], table.current_state, table.stack)
+        if fast_result != table_result:
+            mismatches.append((name, fast_result, table_result))
+    if mismatches:
+        PDA.filename_fast_path = False
+    return mismatches
@@ -0,0 +1,207 @@
+"""File reading helpers shared by the web app and batch workers"""
+
+import codecs
+import hashlib
+import io
+import mmap
+import os
+
+# Files at least this large are memory-mapped instead of read through a buffer
+MMAP_THRESHOLD = 256 * 1024
+STREAM_BLOCK_SIZE = 64 * 1024
+# Leading bytes used to tell text from binary and to detect the encoding
+SNIFF_BYTES = 4096
+# Share of control bytes in the first block above which a file is binary
+BINARY_CONTROL_RATIO = 0.1
+# Local file header that starts a ZIP (and so OOXML) file
+ZIP_LOCAL_MAGIC = b'PK\x03\x04'
+
+# C0 control bytes that do not occur in text (everything but \b \t \n \f \r and ESC)
+_CONTROL_BYTES = bytes(range(0x00, 0x08)) + b'\x0b' + bytes(range(0x0e, 0x1b)) + bytes(range(0x1c, 0x20))
+
+# Byte order marks, longest first so UTF-32 LE is not taken for UTF-16 LE
+_BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16')
+)
+
+_BINARY_SIGNATURES = (
+    (b'%PDF', 'PDF_FILE_SIGNATURE_DETECTED'),
+    (b'PK', 'ZIP_FILE_SIGNATURE_DETECTED (DOCX/XLSX)'),
+    (b'\xff\xd8\xff', 'JPEG_FILE_SIGNATURE_DETECTED'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG_FILE_SIGNATURE_DETECTED')
+)
+
+
+def is_buffer(source):
+    """True when a file source is an in-memory buffer rather than a path"""
+    return isinstance(source, (bytes, bytearray, memoryview))
+
+
+def open_source(source):
+    """Binary file object over a path or an in-memory buffer"""
+    if is_buffer(source):
+        return io.BytesIO(source)
+    return open(source, 'rb')
+
+
+def sniff(head):
+    """Classify a file from its first block: (kind, encoding, label).
+
+    ``kind`` is 'text' or 'binary'. Known binary signatures and blocks
+    with NUL bytes or many other control bytes are binary; ``label`` then
+    names the detected format. Text is decoded with the encoding given by
+    a byte order mark, else UTF-8 when the block is valid UTF-8, else
+    Latin-1.
+    """
+    head = bytes(head)
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return 'text', encoding, None
+
+    for signature, label in _BINARY_SIGNATURES:
+        if head.startswith(signature):
+            return 'binary', None, label
+
+    # Histogram of the byte classes: deleting text bytes leaves the controls
+    controls = len(head) - len(head.translate(None, _CONTROL_BYTES))
+    if b'\x00' in head or (head and controls / len(head) > BINARY_CONTROL_RATIO):
+        return 'binary', None, 'BINARY_FILE_CONTENT'
+
+    try:
+        # A character cut off at the end of the block is not an error
+        codecs.getincrementaldecoder('utf-8')().decode(head)
+        return 'text', 'utf-8', None
+    except UnicodeDecodeError:
+        return 'text', 'latin-1', None
+
+
+class FileSample:
+    """A file opened once for reading, with what sniffing found.
+
+    ``data`` is a memoryview of the whole file: a memory map for large
+    files, one read for small ones, or the buffer itself for in-memory
+    sources. Validators slice it without copying. Use as a context
+    manager so the map is released.
+    """
+
+    def __init__(self, source):
+        self._map = None
+        if is_buffer(source):
+            self.data = memoryview(source).cast('B')
+        else:
+            with open(source, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size >= MMAP_THRESHOLD:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    self.data = memoryview(self._map)
+                else:
+                    self.data = memoryview(f.read())
+        self.size = len(self.data)
+        self.kind, self.encoding, self.label = sniff(self.data[:SNIFF_BYTES])
+
+    def text(self, max_chars=None):
+        """The file decoded as text, or only its first ``max_chars`` characters"""
+        data = self.data
+        if max_chars is not None:
+            # No supported encoding uses more than 4 bytes per character
+            data = data[:max_chars * 4 + 4]
+        text = str(data, self.encoding or 'utf-8', 'ignore')
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return text if max_chars is None else text[:max_chars]
+
+    def blocks(self, block_size=STREAM_BLOCK_SIZE):
+        """Yield zero-copy memoryview slices of the file"""
+        for offset in range(0, self.size, block_size):
+            with self.data[offset:offset + block_size] as block:
+                yield block
+
+    def close(self):
+        self.data.release()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_file_content(filepath, max_chars=5000):
+    """Read file content with safety limits"""
+    try:
+        with FileSample(filepath) as sample:
+            if sample.kind == 'binary':
+                return sample.label, 'binary'
+            return sample.text(max_chars), 'text'
+    except Exception as e:
+        return f"Error opening file: {str(e)}", 'error'
+
+
+def read_edges(source, head_bytes=64, tail_bytes=1024):
+    """First and last bytes of a file or buffer, without reading the middle"""
+    if is_buffer(source):
+        with memoryview(source) as view:
+            return bytes(view[:head_bytes]), bytes(view[-tail_bytes:])
+    with open(source, 'rb') as f:
+        head = f.read(head_bytes)
+        size = os.fstat(f.fileno()).st_size
+        if size <= len(head):
+            return head, head[-tail_bytes:]
+        f.seek(max(0, size - tail_bytes))
+        return head, f.read()
+
+
+def validate_content(pda, source):
+    """Content validation of a file or buffer.
+
+    ZIP packages are checked as OOXML through their central directory and
+    PDFs through their xref section; anything else is matched on its
+    leading and trailing bytes.
+    """
+    head, tail = read_edges(source)
+    if head.startswith(ZIP_LOCAL_MAGIC):
+        return pda.process_ooxml(source)
+    if head.startswith(b'%PDF'):
+        return pda.process_pdf(source)
+    return pda.process_content(head, trailer=tail)
+
+
+def file_digest(filepath, block_size=1024 * 1024):
+    """Content hash of a whole file or buffer, memory-mapping large files"""
+    hasher = hashlib.blake2b(digest_size=16)
+    if is_buffer(filepath):
+        hasher.update(filepath)
+        return hasher.hexdigest()
+    with open(filepath, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hasher.update(mapped)
+        else:
+            while True:
+                data = f.read(block_size)
+                if not data:
+                    break
+                hasher.update(data)
+    return hasher.hexdigest()
+
+
+def stream_validate_file(pda, filepath, validator_type='xml', block_size=STREAM_BLOCK_SIZE):
+    """Validate a whole file block by block through the PDA feed API"""
+    with FileSample(filepath) as sample:
+        pda.begin(validator_type, encoding=sample.encoding or 'utf-8')
+        blocks = sample.blocks(block_size)
+        try:
+            for block in blocks:
+                if not pda.feed(block):
+                    break
+        finally:
+            # Release the last slice before the map is closed
+            blocks.close()
+        return pda.finish()
@@ -0,0 +1,213 @@
+"""Re-validation of edited XML from checkpoints of the previous run"""
+
+import threading
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from pda_engine import PDA, XML_RUNTIME
+from pda_runtime import TagStack
+
+# Characters between checkpoints. A checkpoint copies the stack, so deep
+# stacks space them further apart to keep the total size linear.
+CHECKPOINT_INTERVAL = 1024
+INCREMENTAL_TRACE_LEVELS = ('summary', 'off')
+
+Checkpoint = namedtuple('Checkpoint', 'position saved counters peak')
+Checkpoint.__doc__ = """The run after its first ``position`` characters.
+
+``saved`` is XML_RUNTIME.save() of the PDA, ``counters`` its trace
+counters and ``peak`` the deepest stack since the previous checkpoint.
+"""
+
+Outcome = namedtuple('Outcome', 'valid state stack counters peak')
+Outcome.__doc__ = """The end of a run; ``peak`` covers the steps after the last checkpoint"""
+
+
+class EditSession:
+    """An XML text being edited and the checkpoints of its last validation.
+
+    validate() resumes from the last checkpoint before the first changed
+    character. Once past the edited region it lands on the checkpoints
+    of the previous run, shifted by the change in length, and stops at
+    the first one whose state, stack and tag buffer are the same: the
+    rest of the text is unchanged, so the rest of the run is too. The
+    cost then follows the size of the edit rather than of the text.
+
+    Only the 'summary' and 'off' trace levels are supported, since a
+    resumed run has no history of the part it skipped.
+    """
+
+    def __init__(self, trace_level='summary', interval=CHECKPOINT_INTERVAL):
+        if trace_level not in INCREMENTAL_TRACE_LEVELS:
+            raise ValueError(f'Incremental validation needs trace level summary or off, not {trace_level}')
+        self.trace_level = trace_level
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.text = ''
+        self.checkpoints = []
+        self.positions = []
+        self.outcome = None
+        # The change the last validate() applied, as (start, old end, inserted text)
+        self.edit = None
+
+    def validate(self, text, edit_offset=0):
+        """(pda, valid, stats) for the new text, where stats tell how much of it was run"""
+        pda = PDA(trace=self.trace_level)
+        pda.begin('xml')
+        history = pda.history
+        old_checkpoints, old_positions = self.checkpoints, self.positions
+        fresh = self.outcome is None
+
+        if fresh:
+            offset = 0
+            checkpoints = [Checkpoint(0, XML_RUNTIME.save(pda), history.counters(), history.max_depth)]
+        else:
+            offset = self._unchanged_prefix(text, edit_offset)
+            index = bisect_right(old_positions, offset) - 1
+            checkpoints = old_checkpoints[:index + 1]
+            XML_RUNTIME.restore(pda, checkpoints[-1].saved)
+            history.set_counters(checkpoints[-1].counters)
+        start = position = checkpoints[-1].position
+
+        # Old checkpoints past the edited region, in new-text positions, are where the runs may meet
+        delta = len(text) - len(self.text)
+        suffix = self._unchanged_suffix(text, offset)
+        edit_end = len(text) - suffix
+        self.edit = None if fresh else (offset, len(self.text) - suffix, text[offset:edit_end])
+        target = bisect_left(old_positions, max(edit_end, position + 1) - delta)
+
+        alive = True
+        tail_peak = 0
+        while alive and position < len(text):
+            stop = min(len(text), position + max(self.interval, len(pda.stack)))
+            while target < len(old_positions) and old_positions[target] + delta <= position:
+                target += 1
+            if target < len(old_positions) and old_positions[target] + delta <= stop:
+                stop = old_positions[target] + delta
+
+            alive, peak = self._feed(pda, text[position:stop])
+            position = stop
+            if not alive:
+                tail_peak = peak
+                break
+            checkpoint = Checkpoint(position, XML_RUNTIME.save(pda), history.counters(), peak)
+            checkpoints.append(checkpoint)
+            if target < len(old_positions) and old_positions[target] + delta == position:
+                if old_checkpoints[target].saved == checkpoint.saved:
+                    valid = self._converge(pda, checkpoints, target, delta)
+                    self._keep(text, checkpoints)
+                    return pda, valid, {'resumed_from': start, 'replayed': position - start, 'converged': True}
+                target += 1
+
+        running = history.max_depth
+        history.max_depth = 0
+        valid, _ = pda.finish()
+        tail_peak = max(tail_peak, history.max_depth)
+        history.max_depth = max(running, tail_peak)
+        self.outcome = Outcome(valid, pda.current_state, tuple(pda.stack), history.counters(), tail_peak)
+        self._keep(text, checkpoints)
+        return pda, valid, {'resumed_from': start, 'replayed': position - start, 'converged': False}
+
+    def to_dict(self):
+        """The session as JSON-serializable data, for from_dict() in another process"""
+        return {
+            'trace_level': self.trace_level,
+            'interval': self.interval,
+            'text': self.text,
+            'checkpoints': self.checkpoints,
+            'outcome': self.outcome
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        session = cls(data['trace_level'], data['interval'])
+        # JSON turned the tuples into lists; saved states are compared as tuples
+        session._keep(data['text'], [
+            Checkpoint(position, (saved[0], tuple(saved[1]), saved[2]), tuple(counters), peak)
+            for position, saved, counters, peak in data['checkpoints']
+        ])
+        if data['outcome'] is not None:
+            valid, state, stack, counters, peak = data['outcome']
+            session.outcome = Outcome(valid, state, tuple(stack), tuple(counters), peak)
+        return session
+
+    def _feed(self, pda, chunk):
+        """(alive, deepest stack) after feeding one chunk"""
+        history = pda.history
+        running = history.max_depth
+        history.max_depth = 0
+        alive = pda.feed(chunk)
+        peak = history.max_depth
+        history.max_depth = max(running, peak)
+        return alive, peak
+
+    def _converge(self, pda, checkpoints, target, delta):
+        """Finish the run with the old checkpoints and outcome after ``target``"""
+        old = self.checkpoints[target]
+        new = checkpoints[-1]
+        running = new.counters[3]
+
+        def shifted(counters, peak):
+            steps, pushes, pops, _, depth = counters
+            return (
+                new.counters[0] + steps - old.counters[0],
+                new.counters[1] + pushes - old.counters[1],
+                new.counters[2] + pops - old.counters[2],
+                max(running, peak),
+                depth
+            )
+
+        for checkpoint in self.checkpoints[target + 1:]:
+            running = max(running, checkpoint.peak)
+            checkpoints.append(checkpoint._replace(
+                position=checkpoint.position + delta,
+                counters=shifted(checkpoint.counters, running)
+            ))
+        outcome = self.outcome
+        self.outcome = outcome._replace(counters=shifted(outcome.counters, max(running, outcome.peak)))
+
+        pda.current_state = outcome.state
+        pda.stack = TagStack(outcome.stack)
+        pda.history.set_counters(self.outcome.counters)
+        return outcome.valid
+
+    def _keep(self, text, checkpoints):
+        self.text = text
+        self.checkpoints = checkpoints
+        self.positions = [checkpoint.position for checkpoint in checkpoints]
+
+    def _unchanged_prefix(self, text, hint):
+        """Characters at the start of ``text`` unchanged since the last run.
+
+        ``hint`` is the edit offset the client reported; it is checked, and
+        the real prefix is searched for if the client was wrong.
+        """
+        old = self.text
+        limit = min(len(old), len(text), max(0, hint))
+        if old[:limit] == text[:limit]:
+            return limit
+        low, high = 0, limit - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if old[:middle] == text[:middle]:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def _unchanged_suffix(self, text, prefix):
+        """Characters at the end of ``text`` unchanged since the last run, not overlapping ``prefix``"""
+        old = self.text
+        limit = min(len(old), len(text)) - prefix
+        if limit <= 0:
+            return 0
+        if old[len(old) - limit:] == text[len(text) - limit:]:
+            return limit
+        low, high = 0, limit - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if old[len(old) - middle:] == text[len(text) - middle:]:
+                low = middle
+            else:
+                high = middle - 1
+        return low
@@ -0,0 +1,198 @@
+"""Background batch validation jobs with pollable progress"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from pda_batch import iter_batch, BatchStatistics
+from pda_metrics import process_alive
+
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_JOB_QUEUE = 16
+# Finished jobs are kept this many seconds for their results to be fetched
+DEFAULT_JOB_TTL = 3600
+# Seconds between progress updates a running job writes to the shared state
+PUBLISH_INTERVAL = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is at its limit"""
+
+
+class BatchJob:
+    """One submitted batch, its progress counters and its results"""
+
+    def __init__(self, files_info, validator_type, options, publish=None):
+        self.id = uuid.uuid4().hex
+        self.owner = os.getpid()
+        self.validator_type = validator_type
+        self.files_info = files_info
+        self.total_files = len(files_info)
+        self.options = options
+        self.status = 'queued'
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.results = []
+        self.statistics = BatchStatistics()
+        self._lock = threading.Lock()
+        self._publish = publish
+        self._published = 0.0
+
+    @property
+    def done(self):
+        return self.status in ('completed', 'failed')
+
+    def run(self):
+        """Validate every file, updating the counters as results arrive"""
+        self.status = 'running'
+        self.started = time.time()
+        self.report(force=True)
+        try:
+            for result in iter_batch(self.files_info, self.validator_type, **self.options):
+                with self._lock:
+                    self.results.append(result)
+                    self.statistics.add(result)
+                self.report()
+            self.status = 'completed'
+        except Exception as e:
+            logger.error(f'Batch job {self.id} failed: {e}')
+            self.error = str(e)
+            self.status = 'failed'
+        finally:
+            self.finished = time.time()
+            # The file list is no longer needed once the job has run
+            self.files_info = None
+            self.report(force=True)
+
+    def report(self, force=False):
+        """Hand the job to ``publish``, at most every PUBLISH_INTERVAL seconds unless forced"""
+        if self._publish is None:
+            return
+        now = time.monotonic()
+        if force or now - self._published >= PUBLISH_INTERVAL:
+            self._published = now
+            self._publish(self)
+
+    def snapshot(self, include_results=False):
+        """Job status as a JSON-serializable dict"""
+        with self._lock:
+            total = self.total_files
+            info = {
+                'job_id': self.id,
+                'status': self.status,
+                'validator_type': self.validator_type,
+                'total_files': total,
+                'completed_files': self.statistics.total,
+                'progress': round(self.statistics.total / total * 100, 2) if total else 100.0,
+                'statistics': self.statistics.as_dict(),
+                'created': self.created,
+                'started': self.started,
+                'finished': self.finished,
+                'error': self.error
+            }
+            if include_results:
+                info['results'] = list(self.results)
+        return info
+
+
+class StoredJob:
+    """A job run by another process, as last published to the shared state"""
+
+    def __init__(self, entry):
+        info = entry['job']
+        if info['status'] not in ('completed', 'failed') and not process_alive(entry['owner']):
+            info = dict(info, status='failed', error='The worker running the job exited')
+        self._info = info
+        self.id = info['job_id']
+        self.status = info['status']
+        self.created = info['created']
+
+    @property
+    def done(self):
+        return self.status in ('completed', 'failed')
+
+    def snapshot(self, include_results=False):
+        info = dict(self._info)
+        if not include_results:
+            info.pop('results', None)
+        return info
+
+
+class JobManager:
+    """Runs batch jobs on a bounded thread pool and keeps them for polling.
+
+    Each job thread drives iter_batch, which spreads the files across the
+    shared process pool, so only a couple of job threads are needed. At
+    most ``max_queued`` jobs may be waiting or running at once; further
+    submissions raise JobQueueFull instead of piling up.
+
+    With ``state`` (a pda_state.SharedState), jobs still run in the
+    process they were submitted to, but their progress and results are
+    published there, so any process can answer for them. The queue limit
+    stays per process.
+    """
+
+    def __init__(self, max_workers=DEFAULT_JOB_WORKERS, max_queued=DEFAULT_JOB_QUEUE, ttl=DEFAULT_JOB_TTL, state=None):
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.state = state
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pda-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, files_info, validator_type, **options):
+        """Queue a batch and return its BatchJob"""
+        publish = self._publish if self.state is not None else None
+        job = BatchJob(list(files_info), validator_type, options, publish)
+        with self._lock:
+            self._prune()
+            pending = sum(1 for j in self._jobs.values() if not j.done)
+            if pending >= self.max_queued:
+                raise JobQueueFull(f'Job queue is full ({pending} pending jobs)')
+            self._jobs[job.id] = job
+        job.report(force=True)
+        self._executor.submit(job.run)
+        return job
+
+    def _publish(self, job):
+        entry = {'owner': job.owner, 'job': job.snapshot(include_results=job.done)}
+        self.state.put('job', job.id, entry, self.ttl)
+
+    def get(self, job_id):
+        """The job with this id, or None if unknown or expired"""
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(job_id)
+        if job is None and self.state is not None:
+            entry = self.state.get('job', job_id)
+            if entry is not None:
+                job = StoredJob(entry)
+        return job
+
+    def list(self):
+        """All known jobs, newest first"""
+        with self._lock:
+            self._prune()
+            jobs = dict(self._jobs)
+        if self.state is not None:
+            for entry in self.state.values('job'):
+                job_id = entry['job']['job_id']
+                if job_id not in jobs:
+                    jobs[job_id] = StoredJob(entry)
+        return sorted(jobs.values(), key=lambda job: job.created, reverse=True)
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [j.id for j in self._jobs.values() if j.done and j.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and, by default, wait for running ones"""
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
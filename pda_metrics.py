@@ -0,0 +1,399 @@
+"""In-process metrics exposed in the Prometheus text format"""
+
+import atexit
+import bisect
+import contextlib
+import glob
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: snapshots of exited processes are kept as they are
+    fcntl = None
+
+# Seconds between snapshots written for other worker processes to merge
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STEP_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000, 10000000)
+DEPTH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 10000)
+SIZE_BUCKETS = (64, 1024, 16 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024, 64 * 1024 * 1024)
+
+_FILE_PREFIX = 'pda-metrics-'
+_SNAPSHOT_NAME = re.compile(rf'{_FILE_PREFIX}(\d+)-[0-9a-f]+\.json$')
+_ARCHIVE_NAME = f'{_FILE_PREFIX}archive.json'
+_LOCK_NAME = f'{_FILE_PREFIX}lock'
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f'Skipping metrics snapshot {path}: {e}')
+        return None
+
+
+def process_alive(pid):
+    """True if a process with this pid exists on this host"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic counter per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        """[[label values, value], ...] for merging and JSON snapshots"""
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        return value if total is None else total + value
+
+    def render(self, samples):
+        lines = []
+        for key, value in sorted(samples.items()):
+            lines.append(f'{self.name}{_format_labels(self.labels, key)} {_format_number(value)}')
+        return lines
+
+
+class Histogram:
+    """Bucketed distribution per label set, with running sum and count"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labels)
+        # Non-cumulative bucket counts, the last one for +Inf
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), [list(counts), total]] for key, (counts, total) in self._values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return [list(value[0]), value[1]]
+        for i, count in enumerate(value[0]):
+            total[0][i] += count
+        total[1] += value[1]
+        return total
+
+    def render(self, samples):
+        lines = []
+        for key, (counts, total) in sorted(samples.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labels, key, ('le', _format_number(bound)))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labels, key)
+            lines.append(f'{self.name}_sum{labels} {_format_number(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    """A set of metrics, optionally shared with sibling worker processes.
+
+    Updates only touch the metric's own lock. With ``directory`` set,
+    each process writes a JSON snapshot of its metrics there at most
+    every ``flush_interval`` seconds, and render() adds up the snapshots
+    of every process, so any worker can answer a scrape for all of them.
+    Snapshot names carry a random token as well as the pid, so a process
+    that reuses a pid never overwrites an older one. render() folds the
+    snapshots of exited processes into an archive file, so counters
+    never go back; clear_directory() removes it all when the whole
+    deployment restarts.
+    """
+
+    def __init__(self, directory=None, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._metrics = []
+        self._by_name = {}
+        self._owner = None
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        self._by_name[metric.name] = metric
+        return metric
+
+    @property
+    def _path(self):
+        pid = os.getpid()
+        if self._owner is None or self._owner[0] != pid:
+            self._owner = (pid, secrets.token_hex(4))
+        return os.path.join(self.directory, f'{_FILE_PREFIX}{pid}-{self._owner[1]}.json')
+
+    def maybe_flush(self):
+        """Write this process's snapshot if the flush interval has passed"""
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if not self.directory:
+            return
+        # Another thread flushing right now is as good as flushing here
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_flush = time.monotonic()
+            snapshot = {metric.name: metric.snapshot() for metric in self._metrics}
+            temporary = f'{self._path}.tmp'
+            with open(temporary, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(temporary, self._path)
+        except OSError as e:
+            logger.warning(f'Could not write metrics snapshot: {e}')
+        finally:
+            self._flush_lock.release()
+
+    @contextlib.contextmanager
+    def _directory_lock(self):
+        """Held while the snapshot files are read or folded, across processes"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, _LOCK_NAME), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _merge(self, merged, snapshot):
+        """Add a snapshot into {metric name: {label values: value}}"""
+        for name, samples in snapshot.items():
+            metric = self._by_name.get(name)
+            if metric is None:
+                continue
+            values = merged.setdefault(name, {})
+            for key, value in samples:
+                key = tuple(key)
+                values[key] = metric.merge(values.get(key), value)
+
+    def _fold_exited(self, own):
+        """Merge the snapshots of exited processes into the archive.
+
+        Returns the archived metrics and the names of the snapshot files
+        they include. The archive lists those files, so a snapshot is
+        never counted twice if removing it fails; names are dropped from
+        the list once their files are gone.
+        """
+        path = os.path.join(self.directory, _ARCHIVE_NAME)
+        archive = _read_json(path) or {'folded': [], 'metrics': {}}
+        folded = set(archive['folded'])
+        if fcntl is None:
+            return archive['metrics'], folded
+        exited = []
+        for snapshot_path in glob.glob(os.path.join(self.directory, f'{_FILE_PREFIX}*.json')):
+            match = _SNAPSHOT_NAME.match(os.path.basename(snapshot_path))
+            if match is not None and snapshot_path != own and not process_alive(int(match.group(1))):
+                exited.append(snapshot_path)
+        present = {os.path.basename(snapshot_path) for snapshot_path in exited}
+        if not exited and not folded:
+            return archive['metrics'], folded
+        new = [snapshot_path for snapshot_path in exited if os.path.basename(snapshot_path) not in folded]
+
+        merged = {}
+        self._merge(merged, archive['metrics'])
+        for snapshot_path in new:
+            snapshot = _read_json(snapshot_path)
+            if snapshot is not None:
+                self._merge(merged, snapshot)
+        archive = {
+            'folded': sorted(present),
+            'metrics': {name: [[list(key), value] for key, value in values.items()] for name, values in merged.items()}
+        }
+        try:
+            temporary = f'{path}.tmp'
+            with open(temporary, 'w') as f:
+                json.dump(archive, f)
+            os.replace(temporary, path)
+            for snapshot_path in exited:
+                os.remove(snapshot_path)
+        except OSError as e:
+            logger.warning(f'Could not archive metrics snapshots: {e}')
+        return archive['metrics'], present
+
+    def _snapshots(self):
+        """This process's live snapshot, the archive and the files of every other live process"""
+        snapshots = [{metric.name: metric.snapshot() for metric in self._metrics}]
+        if not self.directory:
+            return snapshots
+        own = self._path
+        with self._directory_lock():
+            archived, folded = self._fold_exited(own)
+            snapshots.append(archived)
+            for path in glob.glob(os.path.join(self.directory, f'{_FILE_PREFIX}*.json')):
+                name = os.path.basename(path)
+                if path == own or name == _ARCHIVE_NAME or name in folded:
+                    continue
+                snapshot = _read_json(path)
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+        return snapshots
+
+    def render(self):
+        """All metrics, merged across processes, in the Prometheus text format"""
+        merged = {metric.name: {} for metric in self._metrics}
+        for snapshot in self._snapshots():
+            self._merge(merged, snapshot)
+
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render(merged[metric.name]))
+        return '\n'.join(lines) + '\n'
+
+
+def clear_directory(directory):
+    """Remove the snapshots left by earlier worker processes"""
+    for path in glob.glob(os.path.join(directory, f'{_FILE_PREFIX}*.json*')):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class PDAMetrics(Registry):
+    """The metrics recorded by the web app"""
+
+    def __init__(self, directory=None, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        super().__init__(directory, flush_interval)
+        self.requests = self.counter(
+            'pda_http_requests_total', 'HTTP requests by route, validator and status',
+            ('route', 'method', 'validator', 'status'))
+        self.latency = self.histogram(
+            'pda_http_request_duration_seconds', 'Time to produce a response, by route and validator',
+            ('route', 'validator'), LATENCY_BUCKETS)
+        self.validations = self.counter(
+            'pda_validations_total', 'Validations by validator and result (accept or reject)',
+            ('validator', 'result'))
+        self.steps = self.histogram(
+            'pda_validation_steps', 'PDA steps taken per validation', ('validator',), STEP_BUCKETS)
+        self.depth = self.histogram(
+            'pda_validation_max_stack_depth', 'Deepest stack reached per validation', ('validator',), DEPTH_BUCKETS)
+        self.input_size = self.histogram(
+            'pda_validation_input_size', 'Characters of text input or bytes of files per validation',
+            ('validator',), SIZE_BUCKETS)
+        self.upload_bytes = self.counter('pda_upload_bytes_total', 'Bytes received in uploaded files')
+        self.upload_size = self.histogram('pda_upload_size_bytes', 'Size of each uploaded file', (), SIZE_BUCKETS)
+        self.exceptions = self.counter(
+            'pda_exceptions_total', 'Exceptions raised while handling requests', ('route', 'exception'))
+
+    def observe_request(self, route, method, validator, status, seconds):
+        self.requests.inc(route=route, method=method, validator=validator, status=status)
+        self.latency.observe(seconds, route=route, validator=validator)
+        self.maybe_flush()
+
+    def observe_validation(self, validator, valid, steps=None, max_depth=None, size=None):
+        self.validations.inc(validator=validator, result='accept' if valid else 'reject')
+        if steps is not None:
+            self.steps.observe(steps, validator=validator)
+        if max_depth is not None:
+            self.depth.observe(max_depth, validator=validator)
+        if size is not None:
+            self.input_size.observe(size, validator=validator)
+
+    def observe_upload(self, size):
+        self.upload_bytes.inc(size)
+        self.upload_size.observe(size)
+
+    def observe_exception(self, route, exception):
+        self.exceptions.inc(route=route, exception=type(exception).__name__)
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Process-wide PDAMetrics; PDA_METRICS_DIR shares them between worker processes"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                directory = os.environ.get('PDA_METRICS_DIR') or None
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                _metrics = PDAMetrics(
+                    directory=directory,
+                    flush_interval=float(os.environ.get('PDA_METRICS_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL))
+                )
+                if directory:
+                    # Counts since the last snapshot would be lost with the process
+                    atexit.register(_metrics.flush)
+    return _metrics
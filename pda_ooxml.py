@@ -0,0 +1,206 @@
+"""Seek-based reading of OOXML (DOCX/XLSX/PPTX) packages"""
+
+import struct
+import zlib
+from collections import namedtuple
+
+from pda_files import open_source, ZIP_LOCAL_MAGIC
+
+_EOCD = struct.Struct('<4sHHHHIIH')
+_EOCD_MAGIC = b'PK\x05\x06'
+_ZIP64_LOCATOR = struct.Struct('<4sIQI')
+_ZIP64_LOCATOR_MAGIC = b'PK\x06\x07'
+_ZIP64_EOCD = struct.Struct('<4sQHHIIQQQQ')
+_ZIP64_EOCD_MAGIC = b'PK\x06\x06'
+_CENTRAL = struct.Struct('<4sHHHHHHIIIHHHHHII')
+_CENTRAL_MAGIC = b'PK\x01\x02'
+_LOCAL = struct.Struct('<4sHHHHHIIIHH')
+_ZIP64_EXTRA_ID = 0x0001
+_MAX_COMMENT = 0xFFFF
+
+# Parts every package needs, and the main part that names the document kind
+REQUIRED_PARTS = ('[Content_Types].xml', '_rels/.rels')
+MAIN_PARTS = (
+    ('word/document.xml', 'DOCX'),
+    ('xl/workbook.xml', 'XLSX'),
+    ('ppt/presentation.xml', 'PPTX')
+)
+# Decompressed size allowed for a checked part, so a zip bomb cannot run away
+MAX_PART_BYTES = 4 * 1024 * 1024
+PART_BLOCK_SIZE = 64 * 1024
+
+Entry = namedtuple('Entry', 'name flags method crc compressed_size size offset')
+
+
+class ArchiveError(ValueError):
+    """Raised when a ZIP package is malformed or uses an unsupported feature"""
+
+
+class OOXMLPackage:
+    """A ZIP package opened through its central directory.
+
+    Opening reads only the end-of-central-directory record and the
+    central directory, so the cost grows with the number of entries, not
+    with the size of the compressed parts. Parts are decompressed on
+    demand, block by block, by iter_part().
+    """
+
+    def __init__(self, source):
+        self._file = open_source(source)
+        try:
+            self._file.seek(0, 2)
+            self.size = self._file.tell()
+            self.entries = self._read_central_directory()
+        except Exception:
+            self._file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def kind(self):
+        """'DOCX', 'XLSX' or 'PPTX' from the main part present, or None"""
+        for name, kind in MAIN_PARTS:
+            if name in self.entries:
+                return kind
+        return None
+
+    def _read_at(self, offset, size):
+        if offset + size > self.size:
+            raise ArchiveError('Arsip terpotong')
+        self._file.seek(offset)
+        data = self._file.read(size)
+        if len(data) != size:
+            raise ArchiveError('Arsip terpotong')
+        return data
+
+    def _read_central_directory(self):
+        tail_size = min(self.size, _EOCD.size + _MAX_COMMENT)
+        tail_start = self.size - tail_size
+        tail = self._read_at(tail_start, tail_size)
+        position = tail.rfind(_EOCD_MAGIC, 0, tail_size - _EOCD.size + len(_EOCD_MAGIC))
+        if position < 0:
+            raise ArchiveError('End of central directory tidak ditemukan')
+
+        _, disk, directory_disk, _, count, directory_size, directory_offset, _ = _EOCD.unpack_from(tail, position)
+        if disk or directory_disk:
+            raise ArchiveError('Arsip multi-disk tidak didukung')
+        if count == 0xFFFF or 0xFFFFFFFF in (directory_size, directory_offset):
+            count, directory_size, directory_offset = self._read_zip64_end(tail_start + position)
+        if directory_offset + directory_size > self.size:
+            raise ArchiveError('Central directory di luar file')
+
+        directory = self._read_at(directory_offset, directory_size)
+        entries = {}
+        position = 0
+        for _ in range(count):
+            if position + _CENTRAL.size > len(directory) or directory[position:position + 4] != _CENTRAL_MAGIC:
+                raise ArchiveError('Entri central directory rusak')
+            (_, _, _, flags, method, _, _, crc, compressed_size, size,
+             name_length, extra_length, comment_length, _, _, _, offset) = _CENTRAL.unpack_from(directory, position)
+            position += _CENTRAL.size
+            if position + name_length + extra_length + comment_length > len(directory):
+                raise ArchiveError('Entri central directory rusak')
+            raw_name = directory[position:position + name_length]
+            extra = directory[position + name_length:position + name_length + extra_length]
+            position += name_length + extra_length + comment_length
+
+            if 0xFFFFFFFF in (size, compressed_size, offset):
+                size, compressed_size, offset = _zip64_sizes(extra, size, compressed_size, offset)
+            # A malformed name only fails to match the required parts
+            name = raw_name.decode('utf-8' if flags & 0x800 else 'cp437', errors='replace')
+            entries[name] = Entry(name, flags, method, crc, compressed_size, size, offset)
+        return entries
+
+    def _read_zip64_end(self, eocd_offset):
+        """(count, size, offset) of the central directory from the ZIP64 records"""
+        if eocd_offset < _ZIP64_LOCATOR.size:
+            raise ArchiveError('ZIP64 locator tidak ditemukan')
+        magic, _, record_offset, _ = _ZIP64_LOCATOR.unpack(self._read_at(eocd_offset - _ZIP64_LOCATOR.size, _ZIP64_LOCATOR.size))
+        if magic != _ZIP64_LOCATOR_MAGIC:
+            raise ArchiveError('ZIP64 locator tidak ditemukan')
+        record = _ZIP64_EOCD.unpack(self._read_at(record_offset, _ZIP64_EOCD.size))
+        if record[0] != _ZIP64_EOCD_MAGIC:
+            raise ArchiveError('ZIP64 end of central directory rusak')
+        return record[7], record[8], record[9]
+
+    def iter_part(self, name, block_size=PART_BLOCK_SIZE):
+        """Yield the decompressed bytes of one part, a block at a time"""
+        entry = self.entries[name]
+        if entry.flags & 0x1:
+            raise ArchiveError(f'Part {name} terenkripsi')
+        if entry.method == 8:
+            decompressor = zlib.decompressobj(-15)
+        elif entry.method == 0:
+            decompressor = None
+        else:
+            raise ArchiveError(f'Metode kompresi {entry.method} tidak didukung')
+
+        header = _LOCAL.unpack(self._read_at(entry.offset, _LOCAL.size))
+        if header[0] != ZIP_LOCAL_MAGIC:
+            raise ArchiveError(f'Header lokal {name} rusak')
+        self._file.seek(entry.offset + _LOCAL.size + header[9] + header[10])
+
+        produced = 0
+        crc = 0
+        try:
+            for block in self._inflate(name, entry.compressed_size, decompressor, block_size):
+                produced += len(block)
+                if produced > MAX_PART_BYTES:
+                    raise ArchiveError(f'Part {name} terlalu besar')
+                crc = zlib.crc32(block, crc)
+                yield block
+        except zlib.error as e:
+            raise ArchiveError(f'Part {name} rusak: {e}') from e
+        if crc != entry.crc:
+            raise ArchiveError(f'CRC part {name} tidak cocok')
+
+    def _inflate(self, name, remaining, decompressor, block_size):
+        while remaining:
+            data = self._file.read(min(block_size, remaining))
+            if not data:
+                raise ArchiveError(f'Part {name} terpotong')
+            remaining -= len(data)
+            if decompressor is None:
+                yield data
+                continue
+            # Output is capped per call so one block cannot expand without bound
+            while data:
+                yield decompressor.decompress(data, block_size)
+                data = decompressor.unconsumed_tail
+        while decompressor is not None and not decompressor.eof:
+            block = decompressor.decompress(b'', block_size)
+            if not block:
+                raise ArchiveError(f'Part {name} terpotong')
+            yield block
+
+
+def _zip64_sizes(extra, size, compressed_size, offset):
+    """Replace 0xFFFFFFFF sizes and offset with the values in the ZIP64 extra field"""
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, length = struct.unpack_from('<HH', extra, position)
+        position += 4
+        if position + length > len(extra):
+            break
+        if header_id == _ZIP64_EXTRA_ID:
+            values = iter(struct.unpack_from(f'<{length // 8}Q', extra, position))
+            try:
+                if size == 0xFFFFFFFF:
+                    size = next(values)
+                if compressed_size == 0xFFFFFFFF:
+                    compressed_size = next(values)
+                if offset == 0xFFFFFFFF:
+                    offset = next(values)
+            except StopIteration:
+                raise ArchiveError('ZIP64 extra field rusak')
+            return size, compressed_size, offset
+        position += length
+    raise ArchiveError('ZIP64 extra field tidak ditemukan')
@@ -0,0 +1,259 @@
+"""Tail-first reading of PDF cross-reference data"""
+
+import re
+import zlib
+from collections import namedtuple
+
+from pda_files import open_source
+
+# The header may follow up to this many bytes of junk
+HEADER_BYTES = 1024
+# Bytes before the end searched for startxref and %%EOF
+TAIL_BYTES = 2048
+# Bytes read at a time around the xref section and its trailer
+XREF_WINDOW = 4096
+# In-use objects whose offsets are checked against the file
+SPOT_CHECKS = 8
+MAX_XREF_STREAM_BYTES = 4 * 1024 * 1024
+# Widest /W field of an xref stream; offsets fit in 8 bytes
+MAX_XREF_FIELD_BYTES = 8
+
+_TRAILING_PADDING = b' \t\r\n\x00'
+_HEADER = re.compile(rb'%PDF-(\d\.\d)')
+_STARTXREF = re.compile(rb'startxref\s+(\d+)\s*%%EOF$')
+_SUBSECTION = re.compile(rb'\s*(\d+)\s+(\d+)[ \t]*(?:\r\n|\r|\n)')
+_TABLE_ENTRY = re.compile(rb'(\d{10}) (\d{5}) ([nf])')
+_OBJECT = re.compile(rb'\s*(\d+)\s+(\d+)\s+obj')
+_STREAM = re.compile(rb'stream(?:\r\n|\n)')
+_LENGTH = re.compile(rb'/Length\s+(\d+)\b(?!\s+\d+\s+R)')
+_W = re.compile(rb'/W\s*\[\s*(\d+)\s+(\d+)\s+(\d+)\s*\]')
+_INDEX = re.compile(rb'/Index\s*\[([\d\s]*)\]')
+_SIZE = re.compile(rb'/Size\s+(\d+)')
+_FILTER = re.compile(rb'/Filter\s*\[?\s*/(\w+)')
+_PREDICTOR = re.compile(rb'/Predictor\s+(\d+)')
+_COLUMNS = re.compile(rb'/Columns\s+(\d+)')
+
+XrefSection = namedtuple('XrefSection', 'kind count objects trailer')
+XrefSection.__doc__ = """The cross-reference section startxref points at.
+
+``kind`` is 'table' or 'stream', ``count`` the number of entries,
+``objects`` the sampled in-use entries as (number, offset, generation)
+and ``trailer`` the raw bytes of the trailer (or xref stream) dictionary.
+"""
+
+
+class PDFError(ValueError):
+    """Raised when the PDF structure cannot be read"""
+
+
+class PDFFile:
+    """Random-access reader for the parts of a PDF that locate its objects.
+
+    Only the header, the last TAIL_BYTES, the xref section and a few
+    object headers are read, so validating a large file touches a few
+    KB of it.
+    """
+
+    def __init__(self, source):
+        self._file = open_source(source)
+        self._file.seek(0, 2)
+        self.size = self._file.tell()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def read_at(self, offset, size):
+        self._file.seek(offset)
+        return self._file.read(size)
+
+    def header(self):
+        """The version in the %PDF-x.y header"""
+        match = _HEADER.search(self.read_at(0, HEADER_BYTES))
+        if match is None:
+            raise PDFError('Header %PDF tidak ditemukan')
+        return match.group(1).decode('ascii')
+
+    def startxref(self):
+        """Offset of the last xref section, from the startxref line before %%EOF"""
+        tail = self.read_at(max(0, self.size - TAIL_BYTES), TAIL_BYTES).rstrip(_TRAILING_PADDING)
+        if not tail.endswith(b'%%EOF'):
+            raise PDFError('%%EOF tidak ditemukan')
+        start = tail.rfind(b'startxref')
+        match = _STARTXREF.match(tail, start) if start >= 0 else None
+        if match is None:
+            raise PDFError('startxref tidak ditemukan')
+        offset = int(match.group(1))
+        if offset >= self.size:
+            raise PDFError(f'startxref {offset} di luar file')
+        return offset
+
+    def read_xref(self, offset):
+        """Parse the xref table or stream at ``offset`` into an XrefSection"""
+        data = self.read_at(offset, XREF_WINDOW)
+        if data.startswith(b'xref'):
+            return self._read_table(offset + 4)
+        if _OBJECT.match(data):
+            return self._read_stream(offset, data)
+        raise PDFError(f'Xref tidak ditemukan di offset {offset}')
+
+    def _read_table(self, position):
+        # Subsection headers are read one by one; their fixed-width entries
+        # are skipped over and only sampled below
+        subsections = []
+        while True:
+            data = self.read_at(position, 64)
+            stripped = data.lstrip()
+            if stripped.startswith(b'trailer'):
+                position += len(data) - len(stripped) + len(b'trailer')
+                break
+            match = _SUBSECTION.match(data)
+            if match is None:
+                raise PDFError('Subbagian xref rusak')
+            first, count = int(match.group(1)), int(match.group(2))
+            start = position + match.end()
+            # Entries are 20 bytes; some writers end them with a single '\n'
+            width = 19 if self.read_at(start + 18, 1) == b'\n' else 20
+            if count * width > self.size - start:
+                raise PDFError(f'Subbagian xref {first} {count} melebihi ukuran file')
+            subsections.append((first, count, start, width))
+            position = start + count * width
+
+        total = sum(count for _, count, _, _ in subsections)
+        objects = []
+        for index in _sample(total):
+            for first, count, start, width in subsections:
+                if index < count:
+                    break
+                index -= count
+            match = _TABLE_ENTRY.match(self.read_at(start + index * width, width))
+            if match is None:
+                raise PDFError(f'Entri xref objek {first + index} rusak')
+            if match.group(3) == b'n':
+                objects.append((first + index, int(match.group(1)), int(match.group(2))))
+
+        trailer = self.read_at(position, XREF_WINDOW)
+        end = trailer.find(b'startxref')
+        return XrefSection('table', total, objects, trailer[:end] if end >= 0 else trailer)
+
+    def _read_stream(self, offset, data):
+        stream = _STREAM.search(data)
+        if stream is None:
+            raise PDFError('Kamus stream xref terlalu panjang')
+        dictionary = data[_OBJECT.match(data).end():stream.start()]
+
+        length = _LENGTH.search(dictionary)
+        widths = _W.search(dictionary)
+        size = _SIZE.search(dictionary)
+        if length is None or widths is None or size is None:
+            raise PDFError('Stream xref tanpa /Length, /W atau /Size langsung')
+        length = int(length.group(1))
+        widths = [int(w) for w in widths.groups()]
+        if length > MAX_XREF_STREAM_BYTES:
+            raise PDFError('Stream xref terlalu besar')
+        if max(widths) > MAX_XREF_FIELD_BYTES:
+            raise PDFError('Lebar /W stream xref tidak wajar')
+
+        index = _INDEX.search(dictionary)
+        ranges = [int(n) for n in index.group(1).split()] if index else [0, int(size.group(1))]
+        ranges = list(zip(ranges[0::2], ranges[1::2]))
+        total = sum(count for _, count in ranges)
+        row_width = sum(widths)
+        # Bounds the inflated size before anything is decompressed
+        if not row_width or total * row_width > MAX_XREF_STREAM_BYTES:
+            raise PDFError('Jumlah entri stream xref tidak wajar')
+
+        raw = self.read_at(offset + stream.end(), length)
+        if len(raw) != length:
+            raise PDFError('Stream xref terpotong')
+        rows = _decode_xref_stream(raw, dictionary, row_width, total)
+        if len(rows) < row_width * total:
+            raise PDFError('Stream xref lebih pendek dari /Index')
+
+        objects = []
+        for index in _sample(total):
+            row = rows[index * row_width:(index + 1) * row_width]
+            fields = []
+            position = 0
+            for width in widths:
+                fields.append(int.from_bytes(row[position:position + width], 'big'))
+                position += width
+            # A zero-width type field means every entry is an in-use object
+            kind = fields[0] if widths[0] else 1
+            if kind == 1:
+                for first, count in ranges:
+                    if index < count:
+                        break
+                    index -= count
+                objects.append((first + index, fields[1], fields[2]))
+        return XrefSection('stream', total, objects, dictionary)
+
+    def check_object(self, number, offset, generation):
+        """True if ``number generation obj`` starts at ``offset``"""
+        match = _OBJECT.match(self.read_at(offset, 64))
+        return match is not None and int(match.group(1)) == number and int(match.group(2)) == generation
+
+
+def _sample(total, count=SPOT_CHECKS):
+    """Up to ``count`` indices spread evenly over ``total`` entries"""
+    if total <= count:
+        return range(total)
+    return sorted({i * (total - 1) // (count - 1) for i in range(count)})
+
+
+def _decode_xref_stream(raw, dictionary, row_width, total):
+    """The rows of an xref stream, inflated and un-predicted"""
+    expected = row_width * total
+    filter_name = _FILTER.search(dictionary)
+    if filter_name is None:
+        return raw
+    if filter_name.group(1) != b'FlateDecode':
+        raise PDFError(f'Filter {filter_name.group(1).decode("ascii", "replace")} tidak didukung')
+
+    predictor = _PREDICTOR.search(dictionary)
+    predictor = int(predictor.group(1)) if predictor else 1
+    columns = _COLUMNS.search(dictionary)
+    columns = int(columns.group(1)) if columns else 1
+    if predictor >= 10 and not 1 <= columns <= row_width:
+        # A predictor row is one xref row, so /Columns can be no wider
+        raise PDFError(f'/Columns {columns} stream xref tidak wajar')
+    decompressor = zlib.decompressobj()
+    try:
+        # Bounded by the table size so a crafted stream cannot expand freely
+        data = decompressor.decompress(raw, expected + total + 1)
+    except zlib.error as e:
+        raise PDFError(f'Stream xref rusak: {e}')
+    if predictor < 10:
+        return data
+    return _unpredict_png(data, columns)
+
+
+def _unpredict_png(data, columns):
+    """Undo PNG row predictors (the byte before each row picks the filter)"""
+    rows = bytearray()
+    previous = bytearray(columns)
+    for start in range(0, len(data) - columns, columns + 1):
+        kind = data[start]
+        row = bytearray(data[start + 1:start + 1 + columns])
+        for i in range(len(row)):
+            left = row[i - 1] if i else 0
+            up = previous[i]
+            if kind == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif kind == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif kind == 3:
+                row[i] = (row[i] + (left + up) // 2) & 0xFF
+            elif kind == 4:
+                upper_left = previous[i - 1] if i else 0
+                estimate = left + up - upper_left
+                pa, pb, pc = abs(estimate - left), abs(estimate - up), abs(estimate - upper_left)
+                row[i] = (row[i] + (left if pa <= pb and pa <= pc else up if pb <= pc else upper_left)) & 0xFF
+        rows += row
+        previous = row
+    return bytes(rows)
@@ -0,0 +1,335 @@
+"""Prefork mode: several Waitress processes serving one port.
+
+A validation holds the GIL for its whole run, so one process keeps one
+core busy however many threads it has. Supervisor starts ``workers``
+copies of this module as separate interpreters; each loads the
+application from a 'module:function' factory and serves it on the
+listening socket inherited from the supervisor, or, with SO_REUSEPORT,
+on its own socket bound to the same port. The kernel spreads the
+connections over them.
+
+Workers that die are started again, with a growing delay while they
+keep dying at startup. SIGTERM or SIGINT stops the supervisor: the
+workers stop accepting, finish the requests they have (up to
+``graceful_timeout`` seconds) and exit. SIGHUP is passed on to the
+workers, which reload the rules. SIGTERM sent to one worker recycles
+just that worker.
+"""
+
+import argparse
+import importlib
+import logging
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from waitress import wasyncore
+from waitress.server import create_server
+
+DEFAULT_THREADS = 4
+DEFAULT_CONNECTION_LIMIT = 100
+DEFAULT_BACKLOG = 1024
+# Seconds workers are given to finish their requests when stopping
+DEFAULT_GRACEFUL_TIMEOUT = 30
+# A worker exiting sooner than this after starting counts as a failed start;
+# failed starts are retried after 1, 2, 4... seconds, up to MAX_RESTART_DELAY
+MIN_WORKER_LIFETIME = 5
+MAX_RESTART_DELAY = 30
+# Seconds between the supervisor's checks when no signal wakes it
+_TICK = 1.0
+_DRAIN_TICK = 0.1
+
+logger = logging.getLogger(__name__)
+
+
+def prefork_supported():
+    """True where workers can inherit the listening socket (not on Windows)"""
+    return os.name == 'posix'
+
+
+def reuse_port_supported():
+    return hasattr(socket, 'SO_REUSEPORT')
+
+
+def bound_socket(host, port, reuse_port=False):
+    """A TCP socket bound to (host, port), not yet listening"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host, port))
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def listen_socket(host, port, backlog=DEFAULT_BACKLOG, reuse_port=False):
+    """A TCP socket listening on (host, port)"""
+    sock = bound_socket(host, port, reuse_port)
+    try:
+        sock.listen(backlog)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def configure_logging():
+    """Log lines tagged with the process id, including this module's INFO lines"""
+    logging.basicConfig(format='%(asctime)s [%(process)d] %(levelname)s %(name)s: %(message)s')
+    logger.setLevel(logging.INFO)
+
+
+def load_app(spec):
+    """The WSGI application returned by the 'module:function' factory ``spec``"""
+    module_name, _, function = spec.partition(':')
+    return getattr(importlib.import_module(module_name), function)()
+
+
+def _idle(channel):
+    """True for a connection waiting for its next request, with nothing in progress"""
+    return not channel.requests and channel.request is None and not channel.total_outbufs_len
+
+
+def serve_worker(app, sock, threads=DEFAULT_THREADS, connection_limit=DEFAULT_CONNECTION_LIMIT,
+                 backlog=DEFAULT_BACKLOG, graceful_timeout=DEFAULT_GRACEFUL_TIMEOUT):
+    """Serve ``app`` on ``sock`` until SIGTERM, then finish the requests in progress"""
+    server = create_server(app, sockets=[sock], threads=threads,
+                           connection_limit=connection_limit, backlog=backlog)
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    # Ctrl-C reaches the whole process group; the supervisor turns it into SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    use_poll = server.adj.asyncore_use_poll
+    logger.info(f'Worker {os.getpid()} serving on http://{server.effective_host}:{server.effective_port}')
+    try:
+        while not stopping:
+            wasyncore.loop(timeout=server.adj.asyncore_loop_timeout, map=server._map, use_poll=use_poll, count=1)
+
+        # Leave new connections to the other workers, close idle keep-alive
+        # connections and let the busy ones send their responses
+        server.accepting = False
+        deadline = time.monotonic() + graceful_timeout
+        while server.active_channels and time.monotonic() < deadline:
+            for channel in list(server.active_channels.values()):
+                if _idle(channel):
+                    channel.will_close = True
+            wasyncore.loop(timeout=_DRAIN_TICK, map=server._map, use_poll=use_poll, count=1)
+        if server.active_channels:
+            logger.warning(f'Worker {os.getpid()} stopping with {len(server.active_channels)} connections still open')
+    finally:
+        server.close()
+        server.task_dispatcher.shutdown(timeout=_TICK)
+
+
+class _Worker:
+    """One slot of the supervisor and the process currently filling it"""
+
+    def __init__(self, slot):
+        self.slot = slot
+        self.process = None
+        self.started = 0.0
+        self.failures = 0
+        self.restart_at = 0.0
+
+
+class Supervisor:
+    """Runs ``workers`` worker processes until SIGTERM or SIGINT.
+
+    ``app_spec`` is the 'module:function' the workers call to get the
+    application; the module must be importable from this file's
+    directory. ``reuse_port`` binds a socket per worker with SO_REUSEPORT
+    instead of sharing the supervisor's, which spreads connections more
+    evenly on Linux.
+    """
+
+    def __init__(self, app_spec, host, port, workers, threads=DEFAULT_THREADS,
+                 connection_limit=DEFAULT_CONNECTION_LIMIT, backlog=DEFAULT_BACKLOG,
+                 graceful_timeout=DEFAULT_GRACEFUL_TIMEOUT, reuse_port=False):
+        self.app_spec = app_spec
+        self.host = host
+        self.port = port
+        self.threads = threads
+        self.connection_limit = connection_limit
+        self.backlog = backlog
+        self.graceful_timeout = graceful_timeout
+        self.reuse_port = reuse_port
+        self.workers = [_Worker(slot) for slot in range(workers)]
+        self.socket = None
+        self._signals = []
+        self._stopping = False
+        self._kill_at = None
+
+    def run(self):
+        """Serve until stopped and every worker has exited"""
+        if self.reuse_port:
+            # Fails early if the port is taken; not listening, so it is given no connections
+            self.socket = bound_socket(self.host, self.port, reuse_port=True)
+        else:
+            self.socket = listen_socket(self.host, self.port, self.backlog)
+        wake_read, wake_write = os.pipe()
+        os.set_blocking(wake_read, False)
+        os.set_blocking(wake_write, False)
+        handled = (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD)
+        previous = {signum: signal.signal(signum, self._on_signal) for signum in handled}
+        previous_wakeup = signal.set_wakeup_fd(wake_write)
+        logger.info(f'Supervisor {os.getpid()} starting {len(self.workers)} workers on {self.host}:{self.port}')
+        try:
+            while True:
+                self._handle_signals()
+                self._reap()
+                if self._stopping:
+                    if all(worker.process is None for worker in self.workers):
+                        break
+                    if time.monotonic() >= self._kill_at:
+                        self._kill()
+                else:
+                    self._start_due()
+                select.select([wake_read], [], [], _TICK)
+                try:
+                    while os.read(wake_read, 512):
+                        pass
+                except BlockingIOError:
+                    pass
+        finally:
+            self._kill()
+            signal.set_wakeup_fd(previous_wakeup)
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+            os.close(wake_read)
+            os.close(wake_write)
+            if self.socket is not None:
+                self.socket.close()
+        logger.info(f'Supervisor {os.getpid()} stopped')
+
+    def _on_signal(self, signum, frame):
+        self._signals.append(signum)
+
+    def _handle_signals(self):
+        while self._signals:
+            signum = self._signals.pop(0)
+            if signum in (signal.SIGTERM, signal.SIGINT):
+                if self._stopping:
+                    logger.warning('Stopping again, killing the workers')
+                    self._kill()
+                else:
+                    self._stop()
+            elif signum == signal.SIGHUP:
+                self._send(signal.SIGHUP)
+
+    def _stop(self):
+        logger.info(f'Stopping, workers have {self.graceful_timeout}s to finish their requests')
+        self._stopping = True
+        # The workers stop accepting; without our copy the port is free once they exit
+        self.socket.close()
+        self.socket = None
+        self._kill_at = time.monotonic() + self.graceful_timeout + 2 * _TICK
+        self._send(signal.SIGTERM)
+
+    def _send(self, signum):
+        for worker in self.workers:
+            if worker.process is not None:
+                try:
+                    worker.process.send_signal(signum)
+                except OSError:
+                    pass
+
+    def _kill(self):
+        self._send(signal.SIGKILL)
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.wait()
+                worker.process = None
+
+    def _reap(self):
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            code = worker.process.poll()
+            if code is None:
+                continue
+            pid = worker.process.pid
+            worker.process = None
+            if self._stopping:
+                logger.info(f'Worker {pid} exited ({code})')
+                continue
+            if now - worker.started < MIN_WORKER_LIFETIME:
+                worker.failures += 1
+            else:
+                worker.failures = 0
+            delay = min(MAX_RESTART_DELAY, 2 ** (worker.failures - 1)) if worker.failures else 0
+            worker.restart_at = now + delay
+            level = logging.INFO if code == 0 else logging.WARNING
+            logger.log(level, f'Worker {pid} exited ({code}), restarting in {delay}s')
+
+    def _start_due(self):
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.process is None and now >= worker.restart_at:
+                self._start(worker)
+
+    def _start(self, worker):
+        args = [
+            sys.executable, '-m', 'pda_prefork', self.app_spec,
+            '--threads', str(self.threads),
+            '--connection-limit', str(self.connection_limit),
+            '--backlog', str(self.backlog),
+            '--graceful-timeout', str(self.graceful_timeout)
+        ]
+        pass_fds = ()
+        if self.reuse_port:
+            args += ['--bind', f'{self.host}:{self.port}']
+        else:
+            args += ['--fd', str(self.socket.fileno())]
+            pass_fds = (self.socket.fileno(),)
+        env = dict(os.environ)
+        here = os.path.dirname(os.path.abspath(__file__))
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [here, env.get('PYTHONPATH')]))
+        try:
+            worker.process = subprocess.Popen(args, pass_fds=pass_fds, env=env)
+        except OSError as e:
+            worker.failures += 1
+            worker.restart_at = time.monotonic() + min(MAX_RESTART_DELAY, 2 ** (worker.failures - 1))
+            logger.error(f'Could not start worker {worker.slot}: {e}')
+            return
+        worker.started = time.monotonic()
+        logger.info(f'Started worker {worker.process.pid} in slot {worker.slot}')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='One prefork worker, started by Supervisor.')
+    parser.add_argument('app', help="'module:function' returning the WSGI application")
+    listen = parser.add_mutually_exclusive_group(required=True)
+    listen.add_argument('--fd', type=int, help='inherited listening socket')
+    listen.add_argument('--bind', help='host:port to bind with SO_REUSEPORT')
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS)
+    parser.add_argument('--connection-limit', type=int, default=DEFAULT_CONNECTION_LIMIT)
+    parser.add_argument('--backlog', type=int, default=DEFAULT_BACKLOG)
+    parser.add_argument('--graceful-timeout', type=float, default=DEFAULT_GRACEFUL_TIMEOUT)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging()
+    if args.fd is not None:
+        sock = socket.socket(fileno=args.fd)
+    else:
+        host, _, port = args.bind.rpartition(':')
+        sock = listen_socket(host.strip('[]'), int(port), args.backlog, reuse_port=True)
+    app = load_app(args.app)
+    serve_worker(app, sock, threads=args.threads, connection_limit=args.connection_limit,
+                 backlog=args.backlog, graceful_timeout=args.graceful_timeout)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""Opt-in cProfile capture of single requests"""
+
+import cProfile
+import itertools
+import logging
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+
+PROFILE_HEADER = 'X-PDA-Profile'
+DEFAULT_PROFILE_DIR = os.path.join(tempfile.gettempdir(), 'pda-profiles')
+DEFAULT_MAX_PROFILES = 50
+DEFAULT_TOP_FUNCTIONS = 30
+PROFILE_SUFFIX = '.pstats'
+
+_UNSAFE_NAME_CHARS = re.compile(r'[^A-Za-z0-9_.-]')
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileError(ValueError):
+    """Raised when a captured profile cannot be read"""
+
+
+class RequestProfiler:
+    """Decides which requests to profile and keeps their .pstats files.
+
+    A request is profiled when it carries PROFILE_HEADER with ``token``,
+    or as every ``sample_every``-th request when sampling is on. With
+    neither configured, start() returns None after one attribute check.
+    Only one request is profiled at a time, since a profiler hooks the
+    interpreter; requests arriving meanwhile just run unprofiled. The
+    directory keeps the newest ``max_profiles`` files. Captured profiles
+    are only served over HTTP to requests carrying the token; sampling
+    without one leaves them on disk.
+    """
+
+    def __init__(self, directory=DEFAULT_PROFILE_DIR, token=None, sample_every=0, max_profiles=DEFAULT_MAX_PROFILES):
+        self.directory = directory
+        self.token = token or None
+        self.sample_every = sample_every
+        self.max_profiles = max_profiles
+        self.enabled = bool(self.token or self.sample_every > 0)
+        self._counter = itertools.count(1)
+        self._busy = threading.Lock()
+
+    def authorized(self, headers):
+        """True if the request carries the profiling token"""
+        return self.token is not None and headers.get(PROFILE_HEADER) == self.token
+
+    def start(self, headers):
+        """A running cProfile.Profile if this request is to be profiled, else None"""
+        if not self.enabled:
+            return None
+        if self.authorized(headers):
+            reason = 'header'
+        elif self.sample_every > 0 and next(self._counter) % self.sample_every == 0:
+            reason = 'sample'
+        else:
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        profile.reason = reason
+        profile.started = time.time()
+        profile.enable()
+        return profile
+
+    def stop(self, profile, label):
+        """Stop a profile and write it to the directory; returns the file name"""
+        profile.disable()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(profile.started))
+            millis = int(profile.started * 1000) % 1000
+            name = f'{stamp}-{millis:03d}-{_UNSAFE_NAME_CHARS.sub("_", label)}-{profile.reason}{PROFILE_SUFFIX}'
+            profile.dump_stats(os.path.join(self.directory, name))
+            self._rotate()
+            return name
+        except OSError as e:
+            logger.warning(f'Could not write profile: {e}')
+            return None
+        finally:
+            self._busy.release()
+
+    def _rotate(self):
+        for entry in self.list()[self.max_profiles:]:
+            try:
+                os.remove(os.path.join(self.directory, entry['name']))
+            except OSError:
+                pass
+
+    def list(self):
+        """Captured profiles, newest first"""
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(PROFILE_SUFFIX)]
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            try:
+                info = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append({'name': name, 'size': info.st_size, 'created': info.st_mtime})
+        entries.sort(key=lambda entry: entry['name'], reverse=True)
+        return entries
+
+    def path_of(self, name):
+        """Path of a captured profile, or None for unknown or unsafe names"""
+        if _UNSAFE_NAME_CHARS.search(name) or not name.endswith(PROFILE_SUFFIX):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+    def top_functions(self, name, limit=DEFAULT_TOP_FUNCTIONS):
+        """(total seconds, rows) of a profile's functions by cumulative time.
+
+        Returns None for unknown profiles and raises ProfileError for
+        files that are truncated or not pstats dumps.
+        """
+        path = self.path_of(name)
+        if path is None:
+            return None
+        try:
+            stats = pstats.Stats(path)
+        except (OSError, EOFError, ValueError, TypeError) as e:
+            raise ProfileError(f'Profile {name} cannot be read: {e}') from e
+        rows = []
+        for (filename, line, function), (primitive, calls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                'function': f'{filename}:{line}({function})',
+                'calls': calls,
+                'primitive_calls': primitive,
+                'tottime': tottime,
+                'cumtime': cumtime
+            })
+        rows.sort(key=lambda row: row['cumtime'], reverse=True)
+        return stats.total_tt, rows[:limit]
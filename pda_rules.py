@@ -0,0 +1,147 @@
+"""Validator rule registry loaded from rules.json"""
+
+import hashlib
+import json
+import logging
+import os
+import signal
+import threading
+from types import MappingProxyType
+
+RULES_PATH = os.environ.get(
+    'PDA_RULES_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json')
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RuleSet:
+    """One immutable, precompiled version of the validator rules.
+
+    Lists from the config file become frozensets and read-only mappings,
+    including an inverted extension -> category index, so lookups are a
+    single hash probe. A reload builds a new RuleSet instead of mutating
+    this one, so a request that holds a RuleSet sees consistent rules.
+    """
+
+    __slots__ = (
+        'version', 'source', 'filename_extensions', 'categories',
+        'category_index', 'allowed_extensions', 'supported_files',
+        'icons', 'default_icon'
+    )
+
+    def __init__(self, config, source=None):
+        canonical = json.dumps(config, sort_keys=True).encode('utf-8')
+        self.version = hashlib.sha256(canonical).hexdigest()[:16]
+        self.source = source
+
+        self.filename_extensions = frozenset(ext.lower() for ext in config['filename_extensions'])
+        self.categories = MappingProxyType({
+            name: tuple(ext.lower() for ext in exts)
+            for name, exts in config['categories'].items()
+        })
+
+        # First category listing an extension wins, as in the config order
+        index = {}
+        for name, exts in self.categories.items():
+            for ext in exts:
+                index.setdefault(ext, name)
+        self.category_index = MappingProxyType(index)
+
+        self.allowed_extensions = frozenset(ext.lower() for ext in config['allowed_extensions'])
+        self.supported_files = MappingProxyType({
+            validator: tuple(exts)
+            for validator, exts in config['supported_files'].items()
+        })
+        self.icons = MappingProxyType(dict(config.get('icons', {})))
+        self.default_icon = config.get('default_icon', 'fas fa-file')
+
+    def __setattr__(self, name, value):
+        if hasattr(self, 'version') and hasattr(self, name):
+            raise AttributeError('RuleSet is read-only')
+        object.__setattr__(self, name, value)
+
+    def category_of(self, extension):
+        """Category name of an extension, or None"""
+        return self.category_index.get(extension)
+
+    def icon_for(self, extension):
+        """Font Awesome icon class for an extension"""
+        return self.icons.get(extension, self.default_icon)
+
+    def __repr__(self):
+        return f'<RuleSet version={self.version} source={self.source!r}>'
+
+
+_current = None
+# Reentrant so a SIGHUP arriving while the main thread holds it cannot deadlock
+_lock = threading.RLock()
+_listeners = []
+
+
+def load_rules(path=None):
+    """Read and compile a rules file without installing it"""
+    path = path or RULES_PATH
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    return RuleSet(config, source=path)
+
+
+def get_rules():
+    """The active RuleSet, loaded on first use"""
+    rules = _current
+    if rules is None:
+        with _lock:
+            if _current is None:
+                _install(load_rules())
+            rules = _current
+    return rules
+
+
+def reload_rules(path=None):
+    """Compile the rules file and atomically swap it in.
+
+    A file that fails to load or compile raises and leaves the active
+    rules untouched.
+    """
+    rules = load_rules(path)
+    with _lock:
+        previous = _current
+        _install(rules)
+    if previous is None or previous.version != rules.version:
+        logger.info(f'Rules reloaded: version {rules.version} from {rules.source}')
+        for callback in list(_listeners):
+            callback(rules)
+    return rules
+
+
+def _install(rules):
+    global _current
+    _current = rules
+
+
+def on_reload(callback):
+    """Register ``callback(rules)`` to run after the rules change"""
+    _listeners.append(callback)
+    return callback
+
+
+def install_reload_signal(signum=None):
+    """Reload the rules when the process receives SIGHUP.
+
+    Returns False where the signal is unavailable (Windows) or when not
+    called from the main thread.
+    """
+    signum = signum or getattr(signal, 'SIGHUP', None)
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+
+    def _handle(signum, frame):
+        try:
+            reload_rules()
+        except Exception as e:
+            logger.error(f'Rules reload failed, keeping version {get_rules().version}: {e}')
+
+    signal.signal(signum, _handle)
+    return True
@@ -0,0 +1,445 @@
+"""Table-driven runtime for the PDA validators"""
+
+import re
+from array import array
+from collections import namedtuple
+
+# Input class consumed once when the input ends
+EOF = 'EOF'
+
+# Stack top guards: any symbol, or the symbol equal to the buffered tag name.
+# A table may also name checks of the PDA, passed to PDARuntime as ``checks``.
+ANY = '*'
+TAG = 'tag'
+
+# Stack operations
+READ = 'READ'
+SKIP = 'SKIP'
+PUSH = 'PUSH'
+POP = 'POP'
+BUFFER = 'BUFFER'
+CLEAR = 'CLEAR'
+REJECT = 'REJECT'
+
+_OP_READ, _OP_SKIP, _OP_PUSH, _OP_POP, _OP_BUFFER, _OP_CLEAR, _OP_REJECT = range(7)
+_OPCODES = {
+    READ: _OP_READ,
+    SKIP: _OP_SKIP,
+    PUSH: _OP_PUSH,
+    POP: _OP_POP,
+    BUFFER: _OP_BUFFER,
+    CLEAR: _OP_CLEAR,
+    REJECT: _OP_REJECT
+}
+_SIMPLE_OPS = (_OP_READ, _OP_SKIP, _OP_BUFFER)
+_NON_LATIN1 = re.compile('[^\x00-\xff]')
+
+class TagStack(array):
+    """PDA stack of interned symbols, held as an array('I') of ids.
+
+    Every symbol gets an id from this stack's own table the first time it
+    is pushed, so a push or pop moves a 4-byte integer and checking the
+    top against a tag is a dict lookup and an integer compare. len() and
+    truth testing are the array's own; indexing, slicing, iteration and
+    == read as a list of names, so traces and messages turn ids back into
+    names only when they need them. The runtime works on the ids through
+    the array methods directly (_ids_append, _ids_pop, _ids_top).
+    """
+
+    __slots__ = ('names', 'symbol_ids')
+
+    def __new__(cls, symbols=()):
+        stack = super().__new__(cls, 'I')
+        stack.names = []
+        stack.symbol_ids = {}
+        for symbol in symbols:
+            stack.append(symbol)
+        return stack
+
+    def intern(self, symbol):
+        """The id of ``symbol`` in this stack's table, adding it if new"""
+        symbol_id = self.symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.symbol_ids[symbol] = len(self.names)
+            self.names.append(symbol)
+        return symbol_id
+
+    def append(self, symbol):
+        _ids_append(self, self.intern(symbol))
+
+    def pop(self):
+        return self.names[_ids_pop(self)]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.names[symbol_id] for symbol_id in _ids_top(self, index)]
+        return self.names[_ids_top(self, index)]
+
+    def __iter__(self):
+        return map(self.names.__getitem__, array.__iter__(self))
+
+    def __eq__(self, other):
+        if isinstance(other, (TagStack, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __copy__(self):
+        return TagStack(self)
+
+    def __deepcopy__(self, memo):
+        return TagStack(self)
+
+    def __reduce_ex__(self, protocol):
+        return TagStack, (list(self),)
+
+    def __repr__(self):
+        return f'TagStack({list(self)!r})'
+
+
+# Id-level operations on a TagStack, bypassing its name-level overrides
+_ids_append = array.append
+_ids_pop = array.pop
+_ids_top = array.__getitem__
+
+
+Transition = namedtuple(
+    'Transition',
+    'state input stack_top new_state op symbol message label consume',
+    defaults=(None, '', None, True)
+)
+Transition.__doc__ = """One row of a PDA transition table.
+
+``symbol`` is the symbol pushed by PUSH (``TAG`` pushes the buffered tag
+name), ``message`` is the history action template (may use ``{tag}`` and
+``{top}``), ``label`` replaces the input character in the history and
+``consume`` is False for epsilon moves that re-read the same character.
+"""
+
+
+class PDARuntime:
+    """Executes a declarative transition table compiled into dense lookup arrays.
+
+    Characters are mapped to input classes through a lookup table and the
+    transition for (state, class) is a single index into a flat list, so
+    validators share one loop instead of hand-written if/elif chains.
+    Execution state (stack, state, tag buffer) lives on the PDA instance.
+    ``checks`` maps guard names used in the stack_top column to functions
+    of the PDA, for conditions a stack symbol cannot express.
+    """
+
+    def __init__(self, name, start, input_classes, classify, transitions, checks=None):
+        self.name = name
+        self.start = start
+        self.transitions = tuple(Transition(*t) for t in transitions)
+        self.input_classes = tuple(input_classes) + (EOF,)
+        self._classify = classify
+
+        states = [start]
+        for t in self.transitions:
+            for state in (t.state, t.new_state):
+                if state not in states:
+                    states.append(state)
+        self.states = tuple(states)
+        self._state_ids = {state: i for i, state in enumerate(states)}
+        self._class_ids = {cls: i for i, cls in enumerate(self.input_classes)}
+        self._width = len(self.input_classes)
+        self._eof = self._class_ids[EOF]
+
+        # Latin-1 is classified up front, anything else on first sight
+        self._char_class = {}
+        for code in range(256):
+            self._lookup_class(chr(code))
+
+        self._table = [None] * (len(states) * self._width)
+        for t in self.transitions:
+            if t.input not in self._class_ids:
+                raise ValueError(f'{name}: unknown input class {t.input!r}')
+            slot = self._state_ids[t.state] * self._width + self._class_ids[t.input]
+            guard = None if t.stack_top == ANY else t.stack_top
+            if checks and guard in checks:
+                guard = checks[guard]
+            entry = (guard, (
+                self._state_ids[t.new_state],
+                _OPCODES[t.op],
+                t.symbol,
+                t.message,
+                '{' in t.message,
+                t.label,
+                t.consume
+            ))
+            self._table[slot] = (self._table[slot] or ()) + (entry,)
+
+        # Per slot, a pattern for a run of characters that take the same plain
+        # self-loop, so tag names are sliced out of the input and runs of
+        # text read or skipped in one step
+        self._runs = [None] * len(self._table)
+        for state_id in range(len(states)):
+            self._add_runs(state_id)
+
+    def _simple_loop(self, state_id, class_id):
+        """The entry of an unguarded READ/SKIP/BUFFER row staying in its state, or None"""
+        candidates = self._table[state_id * self._width + class_id]
+        if candidates and len(candidates) == 1 and candidates[0][0] is None:
+            entry = candidates[0][1]
+            new_state, opcode, _, _, templated, label, consume = entry
+            if new_state == state_id and opcode in _SIMPLE_OPS and consume and not templated and label is None:
+                return entry
+        return None
+
+    def _add_runs(self, state_id):
+        loops = {}
+        for class_id in range(self._width):
+            entry = self._simple_loop(state_id, class_id)
+            if entry is not None:
+                loops.setdefault(entry, set()).add(class_id)
+        for loop_classes in loops.values():
+            # Latin-1 is classified up front; other characters are checked after matching
+            stops = ''.join(re.escape(chr(code)) for code in range(256) if self._char_class[chr(code)] not in loop_classes)
+            run = re.compile(f'[^{stops}]+' if stops else '.+', re.DOTALL).match, loop_classes
+            for class_id in loop_classes:
+                self._runs[state_id * self._width + class_id] = run
+
+    def _run_end(self, text, start, run):
+        """End of the run of characters in the run's classes starting at ``start``"""
+        match_run, loop_classes = run
+        end = match_run(text, start).end()
+        for match in _NON_LATIN1.finditer(text, start, end):
+            char = match.group()
+            class_id = self._char_class.get(char)
+            if class_id is None:
+                class_id = self._lookup_class(char)
+            if class_id not in loop_classes:
+                return match.start()
+        return end
+
+    def _lookup_class(self, char):
+        class_id = self._class_ids[self._classify(char)]
+        if len(self._char_class) < 65536:
+            self._char_class[char] = class_id
+        return class_id
+
+    def describe(self):
+        """Transition table rows in the format shown by the UI"""
+        rows = []
+        for t in self.transitions:
+            action = t.op
+            if t.op == PUSH:
+                action = f'PUSH {t.symbol}'
+            elif t.op == POP:
+                action = f'POP {t.stack_top}'
+            rows.append({
+                'state': t.state,
+                'input': t.input,
+                'stack_top': t.stack_top,
+                'new_state': t.new_state,
+                'action': action
+            })
+        return rows
+
+    def begin(self, pda):
+        """Put the PDA in the start state of this table"""
+        pda.current_state = self.start
+        pda._state_id = self._state_ids[self.start]
+        pda._tag_buffer = ''
+
+    def save(self, pda):
+        """(state id, stack, tag buffer) of a run, to continue it later with restore()"""
+        return pda._state_id, tuple(pda.stack), pda._tag_buffer
+
+    def restore(self, pda, saved):
+        """Put the PDA back where save() found it"""
+        state_id, stack, tag_buffer = saved
+        pda._state_id = state_id
+        pda._tag_buffer = tag_buffer
+        pda.current_state = self.states[state_id]
+        pda.stack = TagStack(stack)
+
+    def _select(self, pda, candidates):
+        stack = pda.stack
+        for guard, transition in candidates:
+            if guard is None:
+                return transition
+            if guard.__class__ is not str:
+                if guard(pda):
+                    return transition
+            elif stack and stack.symbol_ids.get(pda._tag_buffer if guard == TAG else guard) == _ids_top(stack, -1):
+                return transition
+        return None
+
+    def _reject(self, pda, char, message):
+        pda._add_history(char, message)
+        pda.current_state = 'q_reject'
+        pda._state_id = None
+        return False
+
+    def _step(self, pda, char, class_id):
+        """Apply one transition, returns (accepted, consumed)"""
+        candidates = self._table[pda._state_id * self._width + class_id]
+        transition = self._select(pda, candidates) if candidates else None
+        if transition is None:
+            return self._reject(pda, char, 'REJECT - Tidak ada transisi'), True
+
+        new_state, opcode, symbol, message, templated, label, consume = transition
+        if templated:
+            stack = pda.stack
+            message = message.format(tag=pda._tag_buffer, top=stack[-1] if stack else 'nothing')
+        if label is not None:
+            char = label
+
+        if opcode == _OP_BUFFER:
+            pda._tag_buffer += char
+        elif opcode == _OP_READ:
+            pda._add_history(char, message)
+        elif opcode == _OP_PUSH:
+            stack = pda.stack
+            symbol = pda._tag_buffer if symbol == TAG else symbol
+            symbol_id = stack.symbol_ids.get(symbol)
+            _ids_append(stack, stack.intern(symbol) if symbol_id is None else symbol_id)
+            pda._add_history(char, message)
+        elif opcode == _OP_POP:
+            _ids_pop(pda.stack)
+            pda._add_history(char, message)
+        elif opcode == _OP_CLEAR:
+            pda._tag_buffer = ''
+            pda._add_history(char, message)
+        elif opcode == _OP_REJECT:
+            return self._reject(pda, char, message), True
+
+        pda._state_id = new_state
+        pda.current_state = self.states[new_state]
+        return True, consume
+
+    def feed(self, pda, text):
+        """Run the table over ``text``, returns False once the input is rejected"""
+        if pda._state_id is None:
+            return False
+
+        char_class = self._char_class
+        table = self._table
+        width = self._width
+        states = self.states
+        runs = self._runs
+        history = pda._add_history
+        history_run = pda._add_history_run
+        # Runs in Latin-1 text end where their pattern does
+        latin1 = _NON_LATIN1.search(text) is None
+
+        i = 0
+        n = len(text)
+        while i < n:
+            char = text[i]
+            class_id = char_class.get(char)
+            if class_id is None:
+                class_id = self._lookup_class(char)
+
+            slot = pda._state_id * width + class_id
+            candidates = table[slot]
+
+            # A run of characters on the same unguarded READ/SKIP/BUFFER self-loop
+            run = runs[slot]
+            if run is not None:
+                end = run[0](text, i).end() if latin1 else self._run_end(text, i, run)
+                opcode, message = candidates[0][1][1], candidates[0][1][3]
+                if opcode == _OP_READ:
+                    history_run(text[i:end], message)
+                elif opcode == _OP_BUFFER:
+                    pda._tag_buffer += text[i:end]
+                i = end
+                continue
+
+            # Fast path for the other unguarded READ/SKIP/BUFFER rows
+            if candidates and len(candidates) == 1 and candidates[0][0] is None:
+                new_state, opcode, _, message, templated, label, consume = candidates[0][1]
+                if consume and not templated and label is None and opcode in _SIMPLE_OPS:
+                    if opcode == _OP_READ:
+                        history(char, message)
+                    elif opcode == _OP_BUFFER:
+                        pda._tag_buffer += char
+                    pda._state_id = new_state
+                    pda.current_state = states[new_state]
+                    i += 1
+                    continue
+
+            accepted, consumed = self._step(pda, char, class_id)
+            if not accepted:
+                return False
+            if consumed:
+                i += 1
+        return True
+
+    def finish(self, pda):
+        """Apply end-of-input transitions, returns False if the input is rejected"""
+        if pda._state_id is None:
+            return False
+        # Rows that do not consume the end of input are followed by the next state's
+        while self._table[pda._state_id * self._width + self._eof]:
+            accepted, consumed = self._step(pda, 'ε', self._eof)
+            if not accepted or consumed:
+                return accepted
+        return True
+
+
+class ChainPattern:
+    """A regular expression equivalent to a table whose rows form a chain.
+
+    Each state may loop on some input classes and move to the next state
+    on one other class, pushing or reading; every other input rejects and
+    no row pops or reads the end of input. Such a table is a finite
+    automaton (the stack only ever holds the symbols pushed on the way),
+    so it compiles into one regex with a group per state. run() then
+    replaces feed() when no history is recorded.
+    """
+
+    def __init__(self, runtime, class_patterns):
+        self.runtime = runtime
+        parts = []
+        self._groups = []
+        self._stacks = []
+        state = runtime.start
+        stack = ('Z0',)
+        while state is not None:
+            if state in self._groups:
+                raise ValueError(f'{runtime.name}: state {state} is entered twice')
+            loops = []
+            exits = []
+            for t in runtime.transitions:
+                if t.state != state or t.op == REJECT:
+                    continue
+                if t.input == EOF or not t.consume or t.op not in (READ, PUSH):
+                    raise ValueError(f'{runtime.name}: row {t} is not a plain read or push')
+                if t.stack_top not in (ANY, stack[-1]):
+                    raise ValueError(f'{runtime.name}: row {t} expects {t.stack_top} on the stack')
+                if t.input not in class_patterns:
+                    raise ValueError(f'{runtime.name}: no pattern for input class {t.input!r}')
+                (loops if t.new_state == state and t.op == READ else exits).append(t)
+            if len(exits) > 1:
+                raise ValueError(f'{runtime.name}: state {state} leaves on more than one input')
+
+            self._groups.append(state)
+            self._stacks.append(stack)
+            loop = '|'.join(class_patterns[t.input] for t in loops)
+            parts.append(f'((?:{loop})*)' if loops else '()')
+            if not exits:
+                break
+            t = exits[0]
+            if t.op == PUSH:
+                stack += (t.symbol,)
+            parts.append(f'(?:{class_patterns[t.input]}')
+            state = t.new_state
+        # Every state after the first is optional: (a)*(?:x(b)*(?:y(c)*)?)?
+        pattern = parts[0] + ''.join(parts[1:]) + ')?' * (len(self._groups) - 1)
+        self.regex = re.compile(pattern)
+
+    def run(self, text):
+        """(state, stack, characters read) after feeding ``text`` to the table.
+
+        Reading stops at the first rejected character, so the text was
+        accepted up to its end exactly when the count equals len(text).
+        """
+        match = self.regex.match(text)
+        index = len(self._groups) - 1
+        while match.group(index + 1) is None:
+            index -= 1
+        return self._groups[index], list(self._stacks[index]), match.end()
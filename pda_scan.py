@@ -0,0 +1,206 @@
+"""Offline bulk validation of a directory tree, without the web app.
+
+    python pda_scan.py ARSIP --validator content --format csv --output hasil.csv
+
+Files are found with os.scandir and validated by pda_batch.iter_batch on
+a process pool, in chunks, with the same sniffing as the upload routes.
+One result per file is written as NDJSON (ending with a statistics line,
+like /batch-validate in stream mode) or CSV; the statistics also go to
+stderr.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+
+from pda_batch import iter_batch, shutdown_pool, BatchStatistics, DEFAULT_WORKERS, DEFAULT_FILE_TIMEOUT
+from pda_files import STREAM_BLOCK_SIZE
+from pda_rules import get_rules, reload_rules
+
+VALIDATOR_TYPES = ('filename', 'content', 'filetype', 'xml', 'multilevel')
+# Files handed to a worker per task, so the pool round trip is paid once per chunk
+DEFAULT_CHUNK_SIZE = 64
+CSV_FIELDS = ('filename', 'valid', 'final_state', 'steps', 'stack_size', 'error')
+
+logger = logging.getLogger(__name__)
+
+
+def walk(root, extensions=None, include_hidden=False, follow_symlinks=False, on_error=None):
+    """Yield the paths of the regular files under ``root``, depth first.
+
+    ``extensions`` keeps only files with one of these (lower-case, no dot)
+    extensions. Directories that cannot be read are passed to ``on_error``
+    as (path, exception) and skipped.
+    """
+    directories = [root]
+    while directories:
+        directory = directories.pop()
+        try:
+            with os.scandir(directory) as entries:
+                subdirectories = []
+                for entry in entries:
+                    if not include_hidden and entry.name.startswith('.'):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=follow_symlinks):
+                            subdirectories.append(entry.path)
+                        elif entry.is_file(follow_symlinks=follow_symlinks):
+                            if extensions is None or os.path.splitext(entry.name)[1][1:].lower() in extensions:
+                                yield entry.path
+                    except OSError as e:
+                        if on_error is not None:
+                            on_error(entry.path, e)
+        except OSError as e:
+            if on_error is not None:
+                on_error(directory, e)
+            continue
+        # Reversed so the stack visits them in directory order
+        directories.extend(reversed(sorted(subdirectories)))
+
+
+class ScanStatistics(BatchStatistics):
+    """Batch statistics plus errors, skipped directories and throughput"""
+
+    def __init__(self):
+        super().__init__()
+        self.errors = 0
+        self.unreadable = 0
+        self.started = time.monotonic()
+
+    def add(self, result):
+        super().add(result)
+        if 'error' in result:
+            self.errors += 1
+
+    def as_dict(self):
+        elapsed = time.monotonic() - self.started
+        statistics = super().as_dict()
+        statistics.update({
+            'errors': self.errors,
+            'unreadable_paths': self.unreadable,
+            'seconds': round(elapsed, 3),
+            'files_per_second': round(self.total / elapsed, 1) if elapsed > 0 else 0
+        })
+        return statistics
+
+
+class NDJSONWriter:
+    """One JSON object per line, then the statistics line"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, result):
+        self.stream.write(json.dumps(result, ensure_ascii=False) + '\n')
+
+    def close(self, statistics):
+        self.stream.write(json.dumps({'success': True, 'statistics': statistics}) + '\n')
+
+
+class CSVWriter:
+    """CSV_FIELDS columns, one row per file"""
+
+    def __init__(self, stream):
+        self.writer = csv.DictWriter(stream, CSV_FIELDS, extrasaction='ignore')
+        self.writer.writeheader()
+
+    def write(self, result):
+        self.writer.writerow(result)
+
+    def close(self, statistics):
+        pass
+
+
+WRITERS = {'ndjson': NDJSONWriter, 'csv': CSVWriter}
+
+
+def scan(root, validator_type, writer, workers=DEFAULT_WORKERS, chunk_size=DEFAULT_CHUNK_SIZE,
+         trace_level='summary', timeout=DEFAULT_FILE_TIMEOUT, block_size=STREAM_BLOCK_SIZE,
+         use_cache=False, **walk_options):
+    """Validate every file under ``root`` and write the results; returns the statistics"""
+    statistics = ScanStatistics()
+
+    def unreadable(path, error):
+        statistics.unreadable += 1
+        logger.warning(f'Skipping {path}: {error}')
+
+    files = (
+        {'name': os.path.relpath(path, root), 'path': path}
+        for path in walk(root, on_error=unreadable, **walk_options)
+    )
+    try:
+        for result in iter_batch(files, validator_type, trace_level=trace_level, workers=workers,
+                                 timeout=timeout, block_size=block_size, chunk_size=chunk_size,
+                                 use_cache=use_cache):
+            statistics.add(result)
+            writer.write(result)
+    finally:
+        shutdown_pool()
+    summary = statistics.as_dict()
+    writer.close(summary)
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Validate every file in a directory tree with the PDA validators.')
+    parser.add_argument('root', help='directory to scan')
+    parser.add_argument('--validator', '-v', choices=VALIDATOR_TYPES, default='content', help='validator to run (default: content)')
+    parser.add_argument('--format', '-f', choices=sorted(WRITERS), default='ndjson', help='output format (default: ndjson)')
+    parser.add_argument('--output', '-o', help='output file (default: stdout)')
+    parser.add_argument('--workers', '-w', type=int, default=DEFAULT_WORKERS, help=f'worker processes (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help=f'files per worker task (default: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_FILE_TIMEOUT, help=f'seconds allowed per file (default: {DEFAULT_FILE_TIMEOUT})')
+    parser.add_argument('--trace', choices=('summary', 'off'), default='summary',
+                        help="'summary' reports steps, 'off' skips them and is faster (default: summary)")
+    parser.add_argument('--extensions', help='only files with these comma-separated extensions, e.g. pdf,docx')
+    parser.add_argument('--include-hidden', action='store_true', help='also scan files and directories starting with a dot')
+    parser.add_argument('--follow-symlinks', action='store_true', help='follow symbolic links (beware of cycles)')
+    parser.add_argument('--rules', help='rules file to use instead of rules.json')
+    parser.add_argument('--cache', action='store_true', help='read and store results in the result cache')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(message)s')
+    if not os.path.isdir(args.root):
+        print(f'Not a directory: {args.root}', file=sys.stderr)
+        return 2
+    if args.rules:
+        reload_rules(args.rules)
+    rules = get_rules()
+    extensions = None
+    if args.extensions:
+        extensions = {ext.strip().lstrip('.').lower() for ext in args.extensions.split(',') if ext.strip()}
+
+    output = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        summary = scan(
+            args.root, args.validator, WRITERS[args.format](output),
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            trace_level=args.trace,
+            timeout=args.timeout,
+            use_cache=args.cache,
+            extensions=extensions,
+            include_hidden=args.include_hidden,
+            follow_symlinks=args.follow_symlinks
+        )
+    except KeyboardInterrupt:
+        print('Interrupted', file=sys.stderr)
+        return 130
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(f'Rules: {rules.source} (version {rules.version})', file=sys.stderr)
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
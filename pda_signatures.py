@@ -0,0 +1,114 @@
+"""Magic-number signatures matched on raw file bytes"""
+
+from collections import namedtuple
+
+Signature = namedtuple('Signature', 'magic label trailer', defaults=(None,))
+Signature.__doc__ = """A file format recognised by its leading bytes.
+
+``trailer`` is the byte string the format ends with, when it has one;
+it is checked only when the caller supplies the file's last bytes.
+"""
+
+SIGNATURES = (
+    Signature(b'%PDF', 'PDF', b'%%EOF'),
+    # Bare 'PK' is the historical DOCX check; full ZIP records are more specific
+    Signature(b'PK', 'DOCX'),
+    Signature(b'PK\x03\x04', 'ZIP/OOXML'),
+    Signature(b'PK\x05\x06', 'ZIP (kosong)'),
+    Signature(b'PK\x07\x08', 'ZIP (spanned)'),
+    Signature(b'\x89PNG\r\n\x1a\n', 'PNG', b'IEND\xaeB`\x82'),
+    Signature(b'\xff\xd8\xff', 'JPEG', b'\xff\xd9'),
+    Signature(b'GIF87a', 'GIF', b';'),
+    Signature(b'GIF89a', 'GIF', b';'),
+    Signature(b'II*\x00', 'TIFF'),
+    Signature(b'MM\x00*', 'TIFF'),
+    Signature(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'DOC/XLS (OLE2)'),
+    Signature(b'{\\rtf', 'RTF'),
+    Signature(b'\x1f\x8b', 'GZIP'),
+    Signature(b'7z\xbc\xaf\x27\x1c', '7Z'),
+    Signature(b'Rar!\x1a\x07', 'RAR'),
+    Signature(b'<?xml', 'XML'),
+    Signature(b'\xef\xbb\xbf', 'UTF-8 BOM'),
+    Signature(b'\xff\xfe', 'UTF-16 LE BOM'),
+    Signature(b'\xfe\xff', 'UTF-16 BE BOM'),
+    Signature(b'\xff\xfe\x00\x00', 'UTF-32 LE BOM'),
+    Signature(b'\x00\x00\xfe\xff', 'UTF-32 BE BOM'),
+)
+
+# Bytes ignored at the very end of a file before trailers are matched
+_TRAILING_PADDING = b' \t\r\n\x00'
+
+
+def byte_label(byte):
+    """History label for one input byte: the character if printable, else \\xNN"""
+    if 0x20 < byte < 0x7f:
+        return chr(byte)
+    return f'\\x{byte:02x}'
+
+
+class SignatureTrie:
+    """Byte trie over signature strings, matched in one pass.
+
+    Each node is a dict of byte -> child node; the key None holds the
+    signature ending at that node. match() walks at most ``depth`` bytes
+    and returns the longest signature that is a prefix of the data, so
+    overlapping magics (PK vs PK\\x03\\x04, UTF-16 vs UTF-32 BOMs) resolve
+    to the most specific one.
+    """
+
+    def __init__(self, entries):
+        self.root = {}
+        self.depth = 0
+        for key, value in entries:
+            node = self.root
+            for byte in key:
+                node = node.setdefault(byte, {})
+            node[None] = value
+            self.depth = max(self.depth, len(key))
+
+    def match(self, data):
+        """(value, matched length) of the longest key prefixing ``data``, or (None, 0)"""
+        node = self.root
+        best, length = None, 0
+        for i, byte in enumerate(bytes(data[:self.depth]), 1):
+            node = node.get(byte)
+            if node is None:
+                break
+            if None in node:
+                best, length = node[None], i
+        return best, length
+
+    def describe(self):
+        """Transition rows for the UI, one per trie edge"""
+        rows = []
+        names = {id(self.root): 'q0'}
+        pending = [self.root]
+        while pending:
+            node = pending.pop(0)
+            for byte, child in node.items():
+                if byte is None:
+                    continue
+                names[id(child)] = f'q_sig{len(names)}'
+                rows.append({
+                    'state': names[id(node)],
+                    'input': byte_label(byte),
+                    'stack_top': 'Z0',
+                    'new_state': names[id(child)],
+                    'action': f'ACCEPT ({child[None].label})' if None in child else 'READ'
+                })
+                pending.append(child)
+        return rows
+
+
+HEADER_TRIE = SignatureTrie((signature.magic, signature) for signature in SIGNATURES)
+
+
+def match_header(data):
+    """(Signature, matched bytes) for the leading bytes of a file, or (None, b'')"""
+    signature, length = HEADER_TRIE.match(data)
+    return signature, bytes(data[:length])
+
+
+def match_trailer(signature, tail):
+    """True if ``tail`` (the file's last bytes) ends with the signature's trailer"""
+    return bytes(tail).rstrip(_TRAILING_PADDING).endswith(signature.trailer)
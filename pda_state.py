@@ -0,0 +1,397 @@
+"""Traces, edit sessions and jobs shared between processes in a SQLite file.
+
+The web app keeps these in the memory of the process that made them.
+Prefork workers each have their own memory and the kernel hands a
+client's next request to any of them, so with PDA_STATE_PATH set the
+app keeps them here instead and every worker can answer for them.
+Entries expire like their in-memory counterparts.
+
+Writing here is on the request path, so what is written is kept small:
+traces are stored delta-encoded and compressed, only up to
+DEFAULT_STATE_TRACE_STEPS steps, and an edit session is stored in full
+once and then as the edits made to it.
+"""
+
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+from pda_incremental import EditSession
+from pda_trace import Trace
+
+# Steps per stored row of a trace, so a page reads only the rows it covers
+TRACE_CHUNK_STEPS = 1000
+# Steps of a trace stored for other processes; /trace reports the rest as omitted
+DEFAULT_STATE_TRACE_STEPS = 100000
+# Edits logged after a full copy of a session before the next full copy
+SESSION_LOG_EDITS = 64
+
+_UPSERT = (
+    'INSERT INTO entries (kind, key, value, created, expires) VALUES (?, ?, ?, ?, ?) '
+    'ON CONFLICT (kind, key) DO UPDATE SET value = excluded.value, expires = excluded.expires'
+)
+_INSERT_CHUNK = 'INSERT OR REPLACE INTO trace_chunks (trace_id, chunk, steps) VALUES (?, ?, ?)'
+
+logger = logging.getLogger(__name__)
+
+
+def remove_state(path):
+    """Delete a state file and its WAL files, left by an earlier run"""
+    for suffix in ('', '-wal', '-shm'):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8'), 1)
+
+
+def _unpack(blob):
+    return json.loads(zlib.decompress(blob))
+
+
+class SharedState:
+    """Expiring JSON entries by (kind, key), plus trace chunks and session logs.
+
+    Each thread of each process opens its own connection. SQLite errors
+    are logged and read as a missing entry, like the result cache does.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is not None and self._local.pid == os.getpid():
+            return db
+        db = sqlite3.connect(self.path, timeout=10)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+            'created REAL NOT NULL, expires REAL NOT NULL, PRIMARY KEY (kind, key))'
+        )
+        db.execute('CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires)')
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS trace_chunks ('
+            'trace_id TEXT NOT NULL, chunk INTEGER NOT NULL, steps BLOB NOT NULL, '
+            'PRIMARY KEY (trace_id, chunk))'
+        )
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS session_log ('
+            'token TEXT NOT NULL, version INTEGER NOT NULL, record BLOB NOT NULL, '
+            'PRIMARY KEY (token, version))'
+        )
+        self._local.db = db
+        self._local.pid = os.getpid()
+        return db
+
+    def _execute(self, sql, params=()):
+        try:
+            db = self._connect()
+            with db:
+                db.execute(sql, params)
+            return True
+        except sqlite3.Error as e:
+            logger.warning(f'Shared state update failed: {e}')
+            return False
+
+    def _query(self, sql, params=()):
+        try:
+            return self._connect().execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f'Shared state read failed: {e}')
+            return []
+
+    def put(self, kind, key, value, ttl):
+        """Store a JSON-serializable value for ``ttl`` seconds"""
+        now = time.time()
+        stored = self._execute(_UPSERT, (kind, key, json.dumps(value, ensure_ascii=False), now, now + ttl))
+        self._wrote()
+        return stored
+
+    def _wrote(self):
+        self._writes += 1
+        if self._writes % 64 == 0:
+            self.prune()
+
+    def get(self, kind, key, ttl=None):
+        """The value stored for (kind, key), or None; ``ttl`` extends its life"""
+        now = time.time()
+        rows = self._query('SELECT value FROM entries WHERE kind = ? AND key = ? AND expires > ?', (kind, key, now))
+        if not rows:
+            return None
+        if ttl is not None:
+            self._execute('UPDATE entries SET expires = ? WHERE kind = ? AND key = ?', (now + ttl, kind, key))
+        return json.loads(rows[0][0])
+
+    def values(self, kind):
+        """Every live value of a kind, newest first"""
+        rows = self._query(
+            'SELECT value FROM entries WHERE kind = ? AND expires > ? ORDER BY created DESC',
+            (kind, time.time())
+        )
+        return [json.loads(value) for value, in rows]
+
+    def trim(self, kind, keep):
+        """Drop all but the ``keep`` newest entries of a kind"""
+        self._execute(
+            'DELETE FROM entries WHERE kind = ? AND key NOT IN '
+            '(SELECT key FROM entries WHERE kind = ? ORDER BY created DESC LIMIT ?)',
+            (kind, kind, keep)
+        )
+
+    def prune(self):
+        """Remove expired entries and the chunks and logs of entries no longer listed"""
+        self._execute('DELETE FROM entries WHERE expires <= ?', (time.time(),))
+        self._execute(
+            "DELETE FROM trace_chunks WHERE trace_id NOT IN (SELECT key FROM entries WHERE kind = 'trace')"
+        )
+        self._execute(
+            "DELETE FROM session_log WHERE token NOT IN (SELECT key FROM entries WHERE kind = 'session')"
+        )
+
+    def put_trace(self, trace_id, chunks, value, ttl):
+        """Store the (chunk number, chunk) pairs of a trace and its 'trace' entry.
+
+        Both go in one transaction: prune() in another process must never
+        see the chunks without the entry, or it would delete them.
+        """
+        now = time.time()
+        try:
+            db = self._connect()
+            with db:
+                db.executemany(_INSERT_CHUNK, ((trace_id, number, _pack(chunk)) for number, chunk in chunks))
+                db.execute(_UPSERT, ('trace', trace_id, json.dumps(value), now, now + ttl))
+            stored = True
+        except sqlite3.Error as e:
+            logger.warning(f'Shared state update failed: {e}')
+            stored = False
+        self._wrote()
+        return stored
+
+    def get_chunks(self, trace_id, first, last):
+        """Chunks ``first`` to ``last`` of a trace, in order"""
+        rows = self._query(
+            'SELECT steps FROM trace_chunks WHERE trace_id = ? AND chunk BETWEEN ? AND ? ORDER BY chunk',
+            (trace_id, first, last)
+        )
+        return [_unpack(chunk) for chunk, in rows]
+
+    def save_session(self, token, meta, record, ttl, previous=None):
+        """Log ``record`` as version meta['version'] of a session and store ``meta`` as its entry.
+
+        A record that is a full copy (meta['base'] is its version) drops
+        the log before it. With ``previous``, nothing is written and False
+        is returned unless the stored session is still at that version.
+        """
+        version = meta['version']
+        now = time.time()
+        try:
+            db = self._connect()
+            with db:
+                db.execute('BEGIN IMMEDIATE')
+                if previous is not None:
+                    row = db.execute(
+                        "SELECT value FROM entries WHERE kind = 'session' AND key = ? AND expires > ?", (token, now)
+                    ).fetchone()
+                    if row is None or json.loads(row[0])['version'] != previous:
+                        return False
+                db.execute(
+                    'INSERT OR REPLACE INTO session_log (token, version, record) VALUES (?, ?, ?)',
+                    (token, version, _pack(record))
+                )
+                if meta['base'] == version:
+                    db.execute('DELETE FROM session_log WHERE token = ? AND version < ?', (token, version))
+                db.execute(_UPSERT, ('session', token, json.dumps(meta), now, now + ttl))
+            stored = True
+        except sqlite3.Error as e:
+            logger.warning(f'Shared state update failed: {e}')
+            stored = False
+        self._wrote()
+        return stored
+
+    def session_log(self, token, first, last):
+        """Records ``first`` to ``last`` of a session's log, in order"""
+        rows = self._query(
+            'SELECT record FROM session_log WHERE token = ? AND version BETWEEN ? AND ? ORDER BY version',
+            (token, first, last)
+        )
+        return [_unpack(record) for record, in rows]
+
+
+def _trace_chunks(trace, count):
+    """(chunk number, chunk) pairs covering the first ``count`` steps of a trace"""
+    if isinstance(trace, Trace):
+        # Packed straight from the trace's deltas, without building step dicts
+        for number, start in enumerate(range(0, count, TRACE_CHUNK_STEPS)):
+            yield number, trace.pack(start, min(count, start + TRACE_CHUNK_STEPS))
+        return
+    steps = itertools.islice(iter(trace), count)
+    for number in itertools.count():
+        chunk = list(itertools.islice(steps, TRACE_CHUNK_STEPS))
+        if not chunk:
+            return
+        yield number, {'steps': chunk}
+
+
+class StoredTrace:
+    """A trace read back from SharedState; supports len() and slices.
+
+    ``omitted`` counts the steps of the run past those stored.
+    """
+
+    def __init__(self, state, trace_id, total, omitted=0):
+        self.state = state
+        self.trace_id = trace_id
+        self.total = total
+        self.omitted = omitted
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError('StoredTrace only supports slices')
+        start, stop, stride = index.indices(self.total)
+        if start >= stop:
+            return []
+        first = start // TRACE_CHUNK_STEPS
+        steps = []
+        for chunk in self.state.get_chunks(self.trace_id, first, (stop - 1) // TRACE_CHUNK_STEPS):
+            steps.extend(Trace.unpack(chunk) if 'ops' in chunk else chunk['steps'])
+        offset = first * TRACE_CHUNK_STEPS
+        return steps[start - offset:stop - offset:stride]
+
+
+class SharedTraceStore:
+    """TraceStore kept in SharedState, so /trace pages come from any worker.
+
+    Only the first ``max_steps`` steps of a trace are stored.
+    """
+
+    def __init__(self, state, ttl, max_traces, max_steps=DEFAULT_STATE_TRACE_STEPS):
+        self.state = state
+        self.ttl = ttl
+        self.max_traces = max_traces
+        self.max_steps = max_steps
+
+    def put(self, trace):
+        trace_id = uuid.uuid4().hex
+        total = len(trace)
+        kept = min(total, self.max_steps)
+        self.state.put_trace(trace_id, _trace_chunks(trace, kept), {'total': kept, 'omitted': total - kept}, self.ttl)
+        self.state.trim('trace', self.max_traces)
+        return trace_id
+
+    def get(self, trace_id):
+        entry = self.state.get('trace', trace_id, ttl=self.ttl)
+        if entry is None:
+            return None
+        return StoredTrace(self.state, trace_id, entry['total'], entry['omitted'])
+
+
+class _KnownSession:
+    """A session this process holds, at the log version it matches"""
+
+    def __init__(self, session, meta):
+        self.session = session
+        self.version = meta['version']
+        self.base = meta['base']
+        self.logged = meta['logged']
+
+
+class SharedSessionStore:
+    """Edit sessions kept in SharedState.
+
+    A session is logged in full once, then as the edits validate() made
+    to it, so saving an edit writes about as much as the edit. Each
+    process keeps the sessions it last used and replays the edits other
+    processes logged since; one that has not seen a session loads its
+    full copy and replays the edits after it. A new full copy is logged
+    after SESSION_LOG_EDITS edits, or once the logged edits outgrow the
+    text, which bounds the replay.
+    """
+
+    def __init__(self, state, ttl, max_sessions):
+        self.state = state
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, session):
+        token = uuid.uuid4().hex
+        meta = {'version': 1, 'base': 1, 'logged': 0}
+        self.state.save_session(token, meta, session.to_dict(), self.ttl)
+        self.state.trim('session', self.max_sessions)
+        self._remember(token, session, meta)
+        return token
+
+    def get(self, token):
+        meta = self.state.get('session', token, ttl=self.ttl)
+        with self._lock:
+            known = self._sessions.get(token)
+            if meta is None:
+                self._sessions.pop(token, None)
+                return None
+        if known is not None and known.version == meta['version']:
+            return known.session
+
+        if known is not None and known.version >= meta['base']:
+            session, first = known.session, known.version + 1
+        else:
+            session, first = None, meta['base']
+        records = self.state.session_log(token, first, meta['version'])
+        if len(records) != meta['version'] - first + 1:
+            # Pruned or unreadable; the client starts a new session
+            return None
+        for record in records:
+            if 'text' in record:
+                session = EditSession.from_dict(record)
+            elif session is None:
+                return None
+            else:
+                start, end, inserted = record['edit']
+                with session.lock:
+                    session.validate(session.text[:start] + inserted + session.text[end:], start)
+        self._remember(token, session, meta)
+        return session
+
+    def update(self, token, session):
+        """Log the edit the last validate() of ``session`` made, or a full copy"""
+        with self._lock:
+            known = self._sessions.get(token)
+        edit = session.edit
+        saved = False
+        if (known is not None and known.session is session and edit is not None
+                and known.version - known.base < SESSION_LOG_EDITS
+                and known.logged + len(edit[2]) <= len(session.text)):
+            meta = {'version': known.version + 1, 'base': known.base, 'logged': known.logged + len(edit[2])}
+            saved = self.state.save_session(token, meta, {'edit': list(edit)}, self.ttl, previous=known.version)
+        if not saved:
+            # A full copy is due, or another process edited the session meanwhile and the last edit wins
+            current = self.state.get('session', token)
+            version = max(known.version if known else 0, current['version'] if current else 0) + 1
+            meta = {'version': version, 'base': version, 'logged': 0}
+            self.state.save_session(token, meta, session.to_dict(), self.ttl)
+        self._remember(token, session, meta)
+
+    def _remember(self, token, session, meta):
+        with self._lock:
+            self._sessions[token] = _KnownSession(session, meta)
+            self._sessions.move_to_end(token)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
@@ -0,0 +1,438 @@
+"""Compact execution traces for the PDA engine"""
+
+import itertools
+import threading
+import time
+import uuid
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from collections.abc import Sequence
+
+TRACE_LEVELS = ('full', 'windowed', 'summary', 'off')
+DEFAULT_WINDOW = (100, 100)
+DEFAULT_TRACE_TTL = 300
+DEFAULT_MAX_TRACES = 256
+
+# Stack operation markers stored per step
+_POP = object()
+_SNAPSHOT = object()
+
+
+def _stack_delta(shadow, stack):
+    """Return the single push/pop turning ``shadow`` into ``stack``.
+
+    ``shadow`` is updated in place. Anything other than one push, one pop
+    or no change yields ``_SNAPSHOT`` and leaves ``shadow`` untouched.
+    """
+    depth = len(stack)
+    known = len(shadow)
+
+    if depth == known:
+        if depth == 0 or stack[-1] == shadow[-1]:
+            return None
+    elif depth == known + 1:
+        if depth == 1 or stack[-2] == shadow[-1]:
+            shadow.append(stack[-1])
+            return stack[-1]
+    elif depth == known - 1:
+        if depth == 0 or stack[-1] == shadow[-2]:
+            shadow.pop()
+            return _POP
+    return _SNAPSHOT
+
+
+def make_trace(level='full', window=None):
+    """Create an empty trace for the given trace level"""
+    if level == 'full':
+        return Trace()
+    if level == 'windowed':
+        head, tail = window or DEFAULT_WINDOW
+        return WindowedTrace(head, tail)
+    if level == 'summary':
+        return SummaryTrace()
+    if level == 'off':
+        return NullTrace()
+    raise ValueError(f'Unknown trace level: {level}')
+
+
+class TraceBase(Sequence):
+    """Common step counters shared by every trace level"""
+
+    level = None
+
+    def __init__(self):
+        self.steps = 0
+        self.pushes = 0
+        self.pops = 0
+        self.max_depth = 0
+        self._depth = 0
+
+    def _count(self, depth):
+        self.steps += 1
+        if depth > self._depth:
+            self.pushes += 1
+        elif depth < self._depth:
+            self.pops += 1
+        self._depth = depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def record(self, char, state, stack, action):
+        """Record one step given the stack as it is after the step"""
+        self._count(len(stack))
+
+    def record_run(self, chars, state, stack, action):
+        """Record one step per character of ``chars``, none of which changes the stack"""
+        for char in chars:
+            self.record(char, state, stack, action)
+
+    def append(self, step):
+        """Append a step given in the dict form returned by indexing"""
+        self.record(step['char'], step['state'], step['stack'], step['action'])
+
+    def counters(self):
+        """(steps, pushes, pops, max_depth, depth), to carry a run over to another trace"""
+        return self.steps, self.pushes, self.pops, self.max_depth, self._depth
+
+    def set_counters(self, counters):
+        self.steps, self.pushes, self.pops, self.max_depth, self._depth = counters
+
+    def summary(self):
+        """Counters describing the whole run, whatever was retained"""
+        return {
+            'level': self.level,
+            'steps': self.steps,
+            'pushes': self.pushes,
+            'pops': self.pops,
+            'max_depth': self.max_depth
+        }
+
+    def to_list(self):
+        """Materialize the retained steps as a list of step dicts"""
+        return list(self)
+
+    def __len__(self):
+        return 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return []
+        raise IndexError('trace index out of range')
+
+
+class NullTrace(TraceBase):
+    """Trace level ``off``: nothing is recorded, not even counters"""
+
+    level = 'off'
+
+    def record(self, char, state, stack, action):
+        pass
+
+    def record_run(self, chars, state, stack, action):
+        pass
+
+
+class SummaryTrace(TraceBase):
+    """Trace level ``summary``: only step counters are kept"""
+
+    level = 'summary'
+
+    def record_run(self, chars, state, stack, action):
+        if chars:
+            self._count(len(stack))
+            self.steps += len(chars) - 1
+
+
+class Trace(TraceBase):
+    """Delta-encoded PDA history.
+
+    Each step stores only the stack operation it performed (push of one
+    symbol, pop, or nothing). Full stack snapshots are kept as checkpoints
+    and the stack of any step is rebuilt lazily when it is accessed, so
+    memory stays linear in the number of steps instead of steps x depth.
+    """
+
+    level = 'full'
+    CHECKPOINT_INTERVAL = 64
+
+    def __init__(self):
+        super().__init__()
+        self._chars = []
+        self._states = []
+        self._actions = []
+        self._ops = []
+        self._checkpoint_steps = []
+        self._checkpoints = []
+        self._shadow = []
+        self._since_checkpoint = 0
+
+    def record(self, char, state, stack, action):
+        """Record one step given the stack as it is after the step"""
+        self._count(len(stack))
+        op = _stack_delta(self._shadow, stack) if self._ops else _SNAPSHOT
+        index = len(self._ops)
+
+        # A checkpoint costs O(depth), so only take one after at least
+        # depth steps to keep the total snapshot size linear.
+        if op is _SNAPSHOT or self._since_checkpoint >= max(self.CHECKPOINT_INTERVAL, len(stack)):
+            self._shadow = list(stack)
+            self._checkpoint_steps.append(index)
+            self._checkpoints.append(tuple(stack))
+            self._since_checkpoint = 0
+            op = _SNAPSHOT
+        else:
+            self._since_checkpoint += 1
+
+        self._chars.append(char)
+        self._states.append(state)
+        self._actions.append(action)
+        self._ops.append(op)
+
+    def stack_at(self, index):
+        """Rebuild the stack as it was after step ``index``"""
+        index = self._normalize(index)
+        slot = bisect_right(self._checkpoint_steps, index) - 1
+        start = self._checkpoint_steps[slot]
+        stack = list(self._checkpoints[slot])
+        ops = self._ops
+        for i in range(start + 1, index + 1):
+            op = ops[i]
+            if op is _POP:
+                stack.pop()
+            elif op is not None:
+                stack.append(op)
+        return stack
+
+    def _normalize(self, index):
+        size = len(self._ops)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError('trace index out of range')
+        return index
+
+    def _step(self, index, stack):
+        return {
+            'char': self._chars[index],
+            'state': self._states[index],
+            'stack': stack,
+            'action': self._actions[index]
+        }
+
+    def __len__(self):
+        return len(self._ops)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, stride = index.indices(len(self))
+            if stride != 1:
+                return [self[i] for i in range(start, stop, stride)]
+            return list(self.iter_range(start, stop))
+        index = self._normalize(index)
+        return self._step(index, self.stack_at(index))
+
+    def iter_range(self, start, stop):
+        """Yield steps ``start``..``stop`` replaying the stack incrementally"""
+        stop = min(stop, len(self))
+        if start >= stop:
+            return
+        stack = self.stack_at(start)
+        yield self._step(start, list(stack))
+
+        slot = bisect_right(self._checkpoint_steps, start) - 1
+        ops = self._ops
+        for i in range(start + 1, stop):
+            op = ops[i]
+            if op is _SNAPSHOT:
+                slot += 1
+                stack = list(self._checkpoints[slot])
+            elif op is _POP:
+                stack.pop()
+            elif op is not None:
+                stack.append(op)
+            yield self._step(i, list(stack))
+
+    def __iter__(self):
+        return self.iter_range(0, len(self))
+
+    def pack(self, start, stop):
+        """Steps ``start``..``stop`` as JSON-serializable columns for unpack().
+
+        Stacks stay delta-encoded: 0 for no change, 1 for a pop, [symbol]
+        for a push and {'stack': [...]} for a full stack, which the first
+        step always has.
+        """
+        stop = min(stop, len(self))
+        if start >= stop:
+            return {'chars': [], 'states': [], 'actions': [], 'ops': []}
+        ops = [{'stack': self.stack_at(start)}]
+        slot = bisect_right(self._checkpoint_steps, start) - 1
+        for op in itertools.islice(self._ops, start + 1, stop):
+            if op is None:
+                ops.append(0)
+            elif op is _POP:
+                ops.append(1)
+            elif op is _SNAPSHOT:
+                slot += 1
+                ops.append({'stack': list(self._checkpoints[slot])})
+            else:
+                ops.append([op])
+        return {
+            'chars': self._chars[start:stop],
+            'states': self._states[start:stop],
+            'actions': self._actions[start:stop],
+            'ops': ops
+        }
+
+    @staticmethod
+    def unpack(packed):
+        """The step dicts of a pack() result"""
+        steps = []
+        stack = []
+        for char, state, action, op in zip(packed['chars'], packed['states'], packed['actions'], packed['ops']):
+            if op == 1:
+                stack.pop()
+            elif isinstance(op, list):
+                stack.append(op[0])
+            elif op:
+                stack = list(op['stack'])
+            steps.append({'char': char, 'state': state, 'stack': list(stack), 'action': action})
+        return steps
+
+    def __repr__(self):
+        return f'<Trace steps={len(self)} checkpoints={len(self._checkpoints)}>'
+
+
+class WindowedTrace(TraceBase):
+    """Trace level ``windowed``: the first ``head`` and last ``tail`` steps.
+
+    The tail is a ring buffer of stack deltas on top of a base stack that
+    absorbs each step as it falls out of the window. Retained steps carry
+    their 1-based ``step`` number so the gap in the middle is visible.
+    """
+
+    level = 'windowed'
+
+    def __init__(self, head=DEFAULT_WINDOW[0], tail=DEFAULT_WINDOW[1]):
+        super().__init__()
+        self._head = Trace()
+        self._head_limit = max(0, head)
+        self._tail = deque()
+        self._tail_limit = max(0, tail)
+        self._base = None
+        self._shadow = None
+
+    @property
+    def omitted(self):
+        """Number of steps dropped between the head and the tail"""
+        return self.steps - len(self)
+
+    def record(self, char, state, stack, action):
+        self._count(len(stack))
+        if len(self._head) < self._head_limit:
+            self._head.record(char, state, stack, action)
+            return
+        if not self._tail_limit:
+            return
+
+        if self._shadow is None:
+            self._shadow = self._head.stack_at(-1) if len(self._head) else []
+            self._base = list(self._shadow)
+        op = _stack_delta(self._shadow, stack)
+        if op is _SNAPSHOT:
+            op = tuple(stack)
+            self._shadow = list(stack)
+        self._tail.append((self.steps, char, state, action, op))
+
+        if len(self._tail) > self._tail_limit:
+            self._base = self._apply(self._base, self._tail.popleft()[4])
+
+    @staticmethod
+    def _apply(stack, op):
+        if op is _POP:
+            stack.pop()
+        elif isinstance(op, tuple):
+            stack = list(op)
+        elif op is not None:
+            stack.append(op)
+        return stack
+
+    def __len__(self):
+        return len(self._head) + len(self._tail)
+
+    def __iter__(self):
+        for number, step in enumerate(self._head, 1):
+            step['step'] = number
+            yield step
+        stack = list(self._base or [])
+        for number, char, state, action, op in self._tail:
+            stack = self._apply(stack, op)
+            yield {
+                'step': number,
+                'char': char,
+                'state': state,
+                'stack': list(stack),
+                'action': action
+            }
+
+    def __getitem__(self, index):
+        return self.to_list()[index]
+
+    def summary(self):
+        summary = super().summary()
+        summary['omitted'] = self.omitted
+        return summary
+
+
+class TraceStore:
+    """Short-lived registry of traces that clients page through by id.
+
+    Entries expire ``ttl`` seconds after their last access and the oldest
+    are dropped beyond ``max_traces``, so abandoned traces do not pile up.
+    """
+
+    def __init__(self, ttl=DEFAULT_TRACE_TTL, max_traces=DEFAULT_MAX_TRACES):
+        self.ttl = ttl
+        self.max_traces = max_traces
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, trace):
+        """Keep a trace (any step sequence) and return its id"""
+        trace_id = uuid.uuid4().hex
+        with self._lock:
+            self._prune()
+            self._traces[trace_id] = (trace, time.monotonic() + self.ttl)
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+        return trace_id
+
+    def get(self, trace_id):
+        """The trace with this id, or None once it has expired"""
+        with self._lock:
+            self._prune()
+            entry = self._traces.get(trace_id)
+            if entry is None:
+                return None
+            self._traces[trace_id] = (entry[0], time.monotonic() + self.ttl)
+            self._traces.move_to_end(trace_id)
+            return entry[0]
+
+    def update(self, trace_id, trace):
+        """Keep ``trace`` under an existing id, e.g. after changing it"""
+        with self._lock:
+            self._traces[trace_id] = (trace, time.monotonic() + self.ttl)
+            self._traces.move_to_end(trace_id)
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+
+    def _prune(self):
+        now = time.monotonic()
+        while self._traces:
+            trace_id, (_, expires) = next(iter(self._traces.items()))
+            if expires > now:
+                break
+            del self._traces[trace_id]
+
+    def __len__(self):
+        return len(self._traces)
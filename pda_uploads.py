@@ -0,0 +1,265 @@
+"""Spooled ingestion of uploaded files"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from pda_engine import PDA
+from pda_files import open_source, sniff, SNIFF_BYTES
+
+# Uploads up to this size stay in memory, larger ones spill to their path once
+SPOOL_MAX_BYTES = 1024 * 1024
+# Memory held by all spooled uploads before the oldest are spilled to disk
+DEFAULT_MEMORY_BYTES = 64 * 1024 * 1024
+# Leading bytes kept for content sniffing
+HEAD_BYTES = 64 * 1024
+DEFAULT_UPLOAD_TTL = 3600
+
+logger = logging.getLogger(__name__)
+
+
+class Upload:
+    """An uploaded file written block by block into memory or its spill path.
+
+    Used as the stream the multipart parser writes a file part into, so
+    the content hash, the sniffing head and any consumers (such as a
+    StreamingXMLCheck) see each block while the request body is read.
+    Bytes stay in memory until ``spool_max`` is exceeded; then everything
+    so far is written to ``path`` once and the rest is appended there.
+    """
+
+    def __init__(self, upload_id, path, spool_max=SPOOL_MAX_BYTES, consumers=()):
+        self.id = upload_id
+        self.path = path
+        self.spool_max = spool_max
+        self.consumers = list(consumers)
+        self.size = 0
+        self.created = time.time()
+        self._hasher = hashlib.blake2b(digest_size=16)
+        self._head = bytearray()
+        self._buffer = bytearray()
+        self._spill = None
+        self._spilled = False
+        self._position = 0
+
+    @property
+    def in_memory(self):
+        return not self._spilled
+
+    @property
+    def digest(self):
+        """Content hash, the same as pda_files.file_digest of the file"""
+        return self._hasher.hexdigest()
+
+    @property
+    def head(self):
+        """The first HEAD_BYTES bytes"""
+        return bytes(self._head)
+
+    def write(self, data):
+        self.size += len(data)
+        self._hasher.update(data)
+        if len(self._head) < HEAD_BYTES:
+            self._head += data[:HEAD_BYTES - len(self._head)]
+        for consumer in self.consumers:
+            consumer.write(data)
+
+        if self._spill is not None:
+            self._spill.write(data)
+        elif len(self._buffer) + len(data) > self.spool_max:
+            self._spill = open(self.path, 'wb')
+            self._spill.write(self._buffer)
+            self._spill.write(data)
+            self._buffer = bytearray()
+            self._spilled = True
+        else:
+            self._buffer += data
+        return len(data)
+
+    def finish(self):
+        """Flush the spill file once the whole upload has been written"""
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    # Enough of the file protocol for FileStorage after parsing
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._position
+        elif whence == 2:
+            offset += self.size
+        self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
+
+    def read(self, size=-1):
+        self.finish()
+        with open_source(self.source()) as f:
+            f.seek(self._position)
+            data = f.read(size)
+        self._position += len(data)
+        return data
+
+    def close(self):
+        # Called when the upload request ends; the data must outlive it
+        self.finish()
+
+    def source(self):
+        """The file's bytes while in memory, otherwise its path"""
+        if self._spilled:
+            return self.path
+        return memoryview(self._buffer).toreadonly()
+
+    def spill(self):
+        """Write an in-memory upload to its path and free the buffer"""
+        if self._spilled:
+            return
+        with open(self.path, 'wb') as f:
+            f.write(self._buffer)
+        self._buffer = bytearray()
+        self._spilled = True
+
+    def release(self):
+        """Free the in-memory bytes; a spilled file is left in place"""
+        self._buffer = bytearray()
+
+    def discard(self):
+        """Free the buffer and remove the spill file, if any"""
+        self.finish()
+        self.release()
+        if self._spilled and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class StreamingXMLCheck:
+    """XML validation fed with raw upload blocks as they arrive.
+
+    Blocks are held back until SNIFF_BYTES have arrived, so the encoding
+    is detected from the same first block stream_validate_file uses.
+    """
+
+    def __init__(self, trace_level='windowed', trace_window=None):
+        self.trace_level = trace_level
+        self.trace_window = trace_window
+        self.pda = PDA(trace=trace_level, window=trace_window)
+        self._pending = bytearray()
+        self._rejected = False
+
+    def _start(self):
+        pending, self._pending = self._pending, None
+        _, encoding, _ = sniff(pending[:SNIFF_BYTES])
+        self.pda.begin('xml', encoding=encoding or 'utf-8')
+        self._feed(pending)
+
+    def _feed(self, data):
+        if not self._rejected and not self.pda.feed(data):
+            self._rejected = True
+
+    def write(self, data):
+        if self._pending is None:
+            self._feed(data)
+            return
+        self._pending += data
+        if len(self._pending) >= SNIFF_BYTES:
+            self._start()
+
+    def finish(self):
+        """Close the input and return (valid, history)"""
+        if self._pending is not None:
+            self._start()
+        return self.pda.finish()
+
+
+class UploadStore:
+    """Uploads kept between the upload request and the validation requests.
+
+    In-memory uploads are bounded by ``max_memory``: beyond it the oldest
+    are spilled to disk. Uploads are forgotten ``ttl`` seconds after
+    arriving; files already spilled stay until /cleanup removes them.
+    """
+
+    def __init__(self, max_memory=DEFAULT_MEMORY_BYTES, ttl=DEFAULT_UPLOAD_TTL):
+        self.max_memory = max_memory
+        self.ttl = ttl
+        self._uploads = OrderedDict()
+        self._by_path = {}
+        self._memory = 0
+        self._lock = threading.Lock()
+
+    def add(self, upload):
+        with self._lock:
+            self._prune()
+            self._uploads[upload.id] = upload
+            self._by_path[upload.path] = upload.id
+            if upload.in_memory:
+                self._memory += upload.size
+            for other in list(self._uploads.values()):
+                if self._memory <= self.max_memory:
+                    break
+                if other.in_memory:
+                    try:
+                        other.spill()
+                        self._memory -= other.size
+                    except OSError as e:
+                        logger.warning(f'Could not spill upload {other.id}: {e}')
+        return upload
+
+    def get(self, upload_id):
+        """The upload with this id, or None"""
+        with self._lock:
+            return self._uploads.get(upload_id)
+
+    def get_by_path(self, path):
+        """The upload stored (or to be spilled) at ``path``, or None"""
+        with self._lock:
+            upload_id = self._by_path.get(path)
+            return self._uploads.get(upload_id) if upload_id else None
+
+    def spill(self, upload):
+        """Move an in-memory upload to its path, e.g. before a worker process reads it"""
+        with self._lock:
+            if upload.in_memory:
+                upload.spill()
+                if upload.id in self._uploads:
+                    self._memory -= upload.size
+
+    def discard(self, upload_id):
+        """Forget an upload and delete its data; returns False if unknown"""
+        with self._lock:
+            upload = self._uploads.pop(upload_id, None)
+            if upload is None:
+                return False
+            self._by_path.pop(upload.path, None)
+            if upload.in_memory:
+                self._memory -= upload.size
+        upload.discard()
+        return True
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        while self._uploads:
+            upload = next(iter(self._uploads.values()))
+            if upload.created > cutoff:
+                break
+            del self._uploads[upload.id]
+            self._by_path.pop(upload.path, None)
+            if upload.in_memory:
+                self._memory -= upload.size
+            upload.release()
+
+    def stats(self):
+        with self._lock:
+            in_memory = sum(1 for upload in self._uploads.values() if upload.in_memory)
+            return {
+                'uploads': len(self._uploads),
+                'in_memory': in_memory,
+                'spilled': len(self._uploads) - in_memory,
+                'memory_bytes': self._memory,
+                'max_memory_bytes': self.max_memory
+            }
@@ -0,0 +1,51 @@
+"""Batch validation of files"""
+
+import threading
+
+import pda_batch
+from pda_batch import iter_batch, shutdown_pool, validate_file
+from pda_cache import ResultCache
+
+
+def xml_file(path, items):
+    path.write_text('<root>' + '<item><name>a</name></item>' * items + '</root>')
+    return {'name': path.name, 'path': str(path)}
+
+
+def test_cached_step_count_follows_trace_level(tmp_path, monkeypatch):
+    cache = ResultCache(disk_path=str(tmp_path / 'cache.sqlite3'))
+    monkeypatch.setattr(pda_batch, 'get_cache', lambda: cache)
+    file_info = xml_file(tmp_path / 'a.xml', 1)
+
+    uncached = validate_file(file_info, 'xml', 'summary', use_cache=False)
+    assert uncached['steps'] > 0
+
+    assert validate_file(file_info, 'xml', 'off')['steps'] == 0
+    assert validate_file(file_info, 'xml', 'summary') == uncached
+    assert validate_file(file_info, 'xml', 'full') == uncached
+    assert validate_file(file_info, 'xml', 'off')['steps'] == 0
+
+
+def test_timeout_leaves_other_batches_alone(tmp_path):
+    slow = [xml_file(tmp_path / f'slow-{i}.xml', 4000) for i in range(40)]
+    hung = [xml_file(tmp_path / 'hung.xml', 60000)] + [xml_file(tmp_path / f'a-{i}.xml', 1) for i in range(7)]
+    started = threading.Event()
+    others = []
+
+    def other_batch():
+        for result in iter_batch(slow, 'xml', workers=2, timeout=60, use_cache=False):
+            others.append(result)
+            started.set()
+
+    thread = threading.Thread(target=other_batch)
+    thread.start()
+    try:
+        assert started.wait(60)
+        timed_out = list(iter_batch(hung, 'xml', workers=2, timeout=0.3, use_cache=False))
+        thread.join(120)
+    finally:
+        shutdown_pool()
+
+    assert timed_out[0]['error'].startswith('Timeout')
+    assert len(others) == len(slow)
+    assert [result.get('error') for result in others] == [None] * len(slow)
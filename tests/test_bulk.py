@@ -0,0 +1,54 @@
+"""Bulk filename validation against PDA.process_filename"""
+
+import random
+import string
+
+import pytest
+
+import pda_bulk
+from pda_bulk import differential_check, validate_filenames
+from pda_rules import get_rules
+
+EDGE_CASES = [
+    '', '.', '..', '...', 'a.', '.pdf', 'a..pdf', 'a.b.pdf', 'a_b.pdf', '_.pdf', 'A.PDF', 'a.Pdf',
+    'laporan final.pdf', 'a@b.pdf', 'a.p@f', 'a.p_f', 'a.p df', 'nodot', '1.2', 'é.pdf', 'файл.docx',
+    'a.pdé', '日本.txt', 'a\x00.pdf', 'a.pdf\n', 'x' * 300 + '.pdf', 'a.' + 'x' * 9, 'a.' + 'x' * 8,
+]
+
+
+def generated_names(count, seed):
+    rng = random.Random(seed)
+    extensions = sorted(get_rules().filename_extensions)
+    alphabet = string.ascii_letters + string.digits + '_.-@# ()!é日'
+    names = []
+    for _ in range(count):
+        stem = ''.join(rng.choice(alphabet) for _ in range(rng.randrange(0, 24)))
+        choice = rng.random()
+        if choice < 0.5:
+            extension = rng.choice(extensions)
+            extension = extension.upper() if rng.random() < 0.2 else extension
+            names.append(f'{stem}.{extension}')
+        elif choice < 0.8:
+            names.append(stem)
+        else:
+            names.append(f'{stem}.' + ''.join(rng.choice(alphabet) for _ in range(rng.randrange(0, 12))))
+    return names
+
+
+NAMES = EDGE_CASES + generated_names(3000, seed=19)
+
+
+@pytest.mark.skipif(pda_bulk.np is None, reason='the vectorized kernel needs NumPy')
+def test_kernel_matches_pda(monkeypatch):
+    # Small chunks also cover chunks mixing packed and scalar names
+    monkeypatch.setattr(pda_bulk, 'CHUNK_NAMES', 97)
+    assert differential_check(NAMES) == []
+
+
+def test_scalar_path_matches_pda(monkeypatch):
+    monkeypatch.setattr(pda_bulk, 'np', None)
+    assert differential_check(NAMES) == []
+
+
+def test_empty_input():
+    assert validate_filenames([]) == ([], [])
@@ -0,0 +1,48 @@
+"""The compiled filename pattern against the table-driven PDA"""
+
+import pytest
+
+from pda_engine import PDA, check_filename_fast_path, _filename_samples
+from pda_rules import get_rules
+
+EDGE_CASES = [
+    '', '.', '..', '...', '_', '._', 'a.', '.a', '.pdf', 'a..pdf', 'a.b.pdf', 'A.PDF', 'a.Pdf',
+    'é.pdf', 'ß.docx', '٣.pdf', 'ǅ.pdf', '²', 'файл.pdf', '日本.txt', 'a.pdé', 'a.p²',
+    'a\x00.pdf', 'a.pdf\n', '\u200b.pdf', 'a b.pdf', 'x' * 1000 + '.pdf',
+]
+
+
+def outcome(pda, valid):
+    return valid, pda.current_state, list(pda.stack)
+
+
+def compare(name):
+    fast = PDA(trace='off')
+    table = PDA(trace='summary')
+    return outcome(fast, fast._match_filename(name)[0]), outcome(table, table.process_filename(name)[0])
+
+
+@pytest.mark.parametrize('name', EDGE_CASES + [f'a.{ext}' for ext in sorted(get_rules().filename_extensions)])
+def test_edge_cases(name):
+    fast, table = compare(name)
+    assert fast == table
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_generated_names(seed):
+    mismatches = [(name, *compare(name)) for name in _filename_samples(2000, seed)]
+    assert [mismatch for mismatch in mismatches if mismatch[1] != mismatch[2]] == []
+
+
+def test_untraced_runs_use_fast_path():
+    assert PDA.filename_fast_path
+    for name in EDGE_CASES:
+        fast = PDA(trace='off')
+        table = PDA(trace='summary')
+        assert outcome(fast, fast.process_filename(name)[0]) == outcome(table, table.process_filename(name)[0])
+
+
+def test_startup_check_agrees(monkeypatch):
+    monkeypatch.setattr(PDA, 'filename_fast_path', True)
+    assert check_filename_fast_path(count=200) == []
+    assert PDA.filename_fast_path
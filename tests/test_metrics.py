@@ -0,0 +1,82 @@
+"""Metrics shared between processes through a snapshot directory"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import pda_metrics
+from pda_metrics import Registry
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def registry(directory):
+    metrics = Registry(str(directory))
+    metrics.counter('pda_test_total', 'Test counter', ('kind',))
+    return metrics
+
+
+def write_snapshot(directory, pid, token, value):
+    path = os.path.join(str(directory), f'pda-metrics-{pid}-{token}.json')
+    with open(path, 'w') as f:
+        json.dump({'pda_test_total': [[['a'], value]]}, f)
+    return path
+
+
+def total(metrics):
+    for line in metrics.render().splitlines():
+        if line.startswith('pda_test_total{'):
+            return float(line.split()[-1])
+    return 0
+
+
+def test_snapshot_names_differ_per_process(tmp_path):
+    metrics = registry(tmp_path)
+    metrics.flush()
+    name = os.path.basename(metrics._path)
+    assert name.startswith(f'pda-metrics-{os.getpid()}-')
+    assert registry(tmp_path)._path != metrics._path
+
+
+def test_reused_pid_keeps_both_snapshots(tmp_path):
+    pid = os.getpid()
+    write_snapshot(tmp_path, pid, 'aaaa0001', 3)
+    write_snapshot(tmp_path, pid, 'aaaa0002', 4)
+    assert total(registry(tmp_path)) == 7
+
+
+@pytest.mark.skipif(pda_metrics.fcntl is None, reason='snapshots are only folded where fcntl is available')
+def test_exited_snapshots_folded_into_archive(tmp_path):
+    metrics = registry(tmp_path)
+    metrics._metrics[0].inc(kind='a')
+    dead = write_snapshot(tmp_path, exited_pid(), 'bbbb0001', 5)
+    alive = write_snapshot(tmp_path, os.getppid(), 'bbbb0002', 2)
+
+    assert total(metrics) == 8
+    assert not os.path.exists(dead)
+    assert os.path.exists(alive)
+    # Folding again, and scraping from another process, changes nothing
+    assert total(metrics) == 8
+    assert total(registry(tmp_path)) == 7
+
+    write_snapshot(tmp_path, exited_pid(), 'bbbb0003', 10)
+    assert total(metrics) == 18
+
+
+@pytest.mark.skipif(pda_metrics.fcntl is None, reason='snapshots are only folded where fcntl is available')
+def test_folded_snapshot_left_behind_counted_once(tmp_path):
+    dead = write_snapshot(tmp_path, exited_pid(), 'cccc0001', 5)
+    name = os.path.basename(dead)
+    with open(os.path.join(str(tmp_path), 'pda-metrics-archive.json'), 'w') as f:
+        json.dump({'folded': [name], 'metrics': {'pda_test_total': [[['a'], 5]]}}, f)
+
+    assert total(registry(tmp_path)) == 5
+    assert not os.path.exists(dead)
+    assert total(registry(tmp_path)) == 5
@@ -0,0 +1,67 @@
+"""Malformed OOXML packages are rejected, never raised out of the validator"""
+
+import io
+import random
+import struct
+import zipfile
+
+import pytest
+
+from benchmarks import inputs
+from pda_engine import PDA
+from pda_ooxml import OOXMLPackage, ArchiveError, _zip64_sizes
+
+DOCX = inputs.minimal_docx(20)
+
+
+def zip64_docx():
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name in ('[Content_Types].xml', '_rels/.rels', 'word/document.xml'):
+            with archive.open(name, 'w', force_zip64=True) as part:
+                part.write(b'<a><b/></a>')
+    return data.getvalue()
+
+
+def validate(data):
+    pda = PDA(trace='summary')
+    valid, _ = pda.process_ooxml(data)
+    return valid, pda.current_state
+
+
+@pytest.mark.parametrize('data', [DOCX, zip64_docx()])
+def test_valid_packages_accepted(data):
+    assert validate(data) == (True, 'q_accept')
+
+
+@pytest.mark.parametrize('length', [0, 4, 22, len(DOCX) // 2, len(DOCX) - 23, len(DOCX) - 1])
+def test_truncated_package_rejected(length):
+    assert validate(DOCX[:length]) == (False, 'q_reject')
+
+
+def test_corrupted_packages_rejected_or_accepted():
+    rng = random.Random(14)
+    for base in (DOCX, zip64_docx()):
+        for _ in range(2000):
+            data = bytearray(base)
+            for _ in range(rng.randint(1, 3)):
+                data[rng.randrange(len(data))] = rng.randrange(256)
+            if rng.random() < 0.2:
+                data = data[:rng.randrange(len(data))]
+            valid, state = validate(bytes(data))
+            assert state == ('q_accept' if valid else 'q_reject')
+
+
+def test_corrupt_deflate_stream_rejected():
+    data = bytearray(DOCX)
+    offset = OOXMLPackage(DOCX).entries['[Content_Types].xml'].offset
+    # First bytes of the compressed data, after the 30-byte local header and the name
+    start = offset + 30 + len('[Content_Types].xml')
+    data[start:start + 4] = b'\xff\xff\xff\xff'
+    assert validate(bytes(data)) == (False, 'q_reject')
+
+
+def test_zip64_extra_field_past_its_end():
+    extra = struct.pack('<HH', 0x0001, 24) + b'\x00' * 8
+    with pytest.raises(ArchiveError):
+        _zip64_sizes(extra, 0xFFFFFFFF, 0xFFFFFFFF, 0xFFFFFFFF)
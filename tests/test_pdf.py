@@ -0,0 +1,96 @@
+"""PDFs with crafted cross-reference sections"""
+
+import zlib
+
+import pytest
+
+from pda_engine import PDA
+
+
+OBJECTS = (b'<< /Type /Catalog /Pages 2 0 R >>',
+           b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+           b'<< /Type /Page /Parent 2 0 R >>')
+HUGE = b'99999999999999999999999'
+
+
+def pdf_objects(version):
+    """The header and objects of a one-page PDF, and the object offsets"""
+    body = b'%%PDF-%s\n' % version
+    offsets = []
+    for number, content in enumerate(OBJECTS, 1):
+        offsets.append(len(body))
+        body += b'%d 0 obj\n' % number + content + b'\nendobj\n'
+    return body, offsets
+
+
+def xref_table_pdf():
+    """A one-page PDF indexed by a classic xref table"""
+    body, offsets = pdf_objects(b'1.4')
+    xref_offset = len(body)
+    body += b'xref\n0 %d\n0000000000 65535 f \n' % (len(offsets) + 1)
+    body += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    body += b'trailer\n<< /Size %d /Root 1 0 R >>\n' % (len(offsets) + 1)
+    return body + b'startxref\n%d\n%%%%EOF\n' % xref_offset
+
+
+def xref_stream_pdf(columns=None):
+    """A one-page PDF indexed by a PNG-predicted, deflated xref stream"""
+    body, offsets = pdf_objects(b'1.5')
+    xref_offset = len(body)
+    entries = [(0, 0, 255)] + [(1, offset, 0) for offset in offsets] + [(1, xref_offset, 0)]
+    rows = b''
+    widths = (1, 2, 1)
+    previous = bytes(sum(widths))
+    for entry in entries:
+        row = b''.join(value.to_bytes(width, 'big') for value, width in zip(entry, widths))
+        # PNG "up" predictor
+        rows += b'\x02' + bytes((byte - up) & 0xFF for byte, up in zip(row, previous))
+        previous = row
+    stream = zlib.compress(rows)
+    columns = sum(widths) if columns is None else columns
+    dictionary = (b'<< /Type /XRef /Size %d /W [%d %d %d] /Root 1 0 R /Length %d '
+                  b'/Filter /FlateDecode /DecodeParms << /Predictor 12 /Columns %d >> >>'
+                  % (len(entries), *widths, len(stream), columns))
+    body += b'4 0 obj\n' + dictionary + b'\nstream\n' + stream + b'\nendstream\nendobj\n'
+    return body + b'startxref\n%d\n%%%%EOF\n' % xref_offset
+
+
+def validate(data):
+    pda = PDA(trace='windowed', window=(0, 1))
+    valid, history = pda.process_pdf(data)
+    return valid, history[-1]['action']
+
+
+def test_xref_stream_accepted():
+    valid, action = validate(xref_stream_pdf())
+    assert valid, action
+
+
+@pytest.mark.parametrize('columns', [0, 5, 99999999999])
+def test_unreasonable_columns_rejected(columns):
+    valid, action = validate(xref_stream_pdf(columns=columns))
+    assert not valid
+    assert 'Columns' in action
+
+
+def test_unreasonable_field_width_rejected():
+    # The stream object comes last, so the longer dictionary moves no offsets
+    data = xref_stream_pdf().replace(b'/W [1 2 1]', b'/W [1 99999999999 1]')
+    valid, action = validate(data)
+    assert not valid
+
+
+def test_xref_table_accepted():
+    valid, action = validate(xref_table_pdf())
+    assert valid, action
+
+
+@pytest.mark.parametrize('data', [
+    xref_table_pdf().replace(b'xref\n0 4\n', b'xref\n0 ' + HUGE + b'\n'),
+    xref_stream_pdf().replace(b'/Size 5', b'/Size ' + HUGE),
+    xref_stream_pdf().replace(b'/Type /XRef', b'/Type /XRef /Index [0 ' + HUGE + b']'),
+], ids=['table-count', 'stream-size', 'stream-index'])
+def test_huge_entry_counts_rejected(data):
+    valid, action = validate(data)
+    assert not valid
+    assert action.startswith('REJECT')
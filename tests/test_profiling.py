@@ -0,0 +1,51 @@
+"""Access to captured request profiles"""
+
+import pytest
+
+import app as app_module
+from pda_profiling import RequestProfiler, ProfileError, PROFILE_HEADER
+
+NAME = '20260101-000000-000-validate-header.pstats'
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    def use(token=None, sample_every=0):
+        profiler = RequestProfiler(str(tmp_path), token=token, sample_every=sample_every)
+        monkeypatch.setattr(app_module, 'profiler', profiler)
+        return app_module.app.test_client()
+    return use
+
+
+def test_profiles_hidden_without_token(client):
+    test_client = client(sample_every=1)
+    assert test_client.get('/profiles').status_code == 404
+    assert test_client.get(f'/profiles/{NAME}').status_code == 404
+
+
+def test_profiles_need_token(client, tmp_path):
+    test_client = client(token='secret')
+    (tmp_path / NAME).write_bytes(b'')
+    assert test_client.get('/profiles').status_code == 403
+    assert test_client.get(f'/profiles/{NAME}', headers={PROFILE_HEADER: 'wrong'}).status_code == 403
+    assert test_client.get('/profiles', headers={PROFILE_HEADER: 'secret'}).status_code == 200
+
+
+@pytest.mark.parametrize('content', [b'', b'\xe3\x00', b'not a profile at all'])
+def test_corrupt_profile_rejected(client, tmp_path, content):
+    test_client = client(token='secret')
+    (tmp_path / NAME).write_bytes(content)
+    response = test_client.get(f'/profiles/{NAME}', headers={PROFILE_HEADER: 'secret'})
+    assert response.status_code == 422
+    with pytest.raises(ProfileError):
+        RequestProfiler(str(tmp_path)).top_functions(NAME)
+
+
+def test_captured_profile_served(client, tmp_path):
+    test_client = client(token='secret')
+    test_client.post('/validate', json={'type': 'xml', 'text': '<a></a>'}, headers={PROFILE_HEADER: 'secret'})
+    listing = test_client.get('/profiles', headers={PROFILE_HEADER: 'secret'}).get_json()
+    assert listing['profiles']
+    response = test_client.get(listing['profiles'][0]['url'], headers={PROFILE_HEADER: 'secret'})
+    assert response.status_code == 200
+    assert response.get_json()['functions']
@@ -0,0 +1,210 @@
+"""Traces, edit sessions and jobs shared between processes through SQLite"""
+
+import json
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+import pda_state
+from pda_engine import PDA
+from pda_incremental import EditSession
+from pda_jobs import JobManager
+from pda_state import SharedState, SharedTraceStore, SharedSessionStore, TRACE_CHUNK_STEPS
+
+
+def xml_text(items):
+    return '<root>' + ''.join(f'<item><name>n{i}</name></item>' for i in range(items)) + '</root>'
+
+
+def full_trace(items):
+    pda = PDA(trace='full')
+    valid, history = pda.process_xml(xml_text(items))
+    assert valid
+    return history
+
+
+def stored_bytes(path, sql, params=()):
+    with sqlite3.connect(path) as db:
+        return db.execute(sql, params).fetchone()[0] or 0
+
+
+@pytest.mark.parametrize('packed', [True, False], ids=['trace', 'list'])
+def test_trace_pages_from_another_connection(tmp_path, packed):
+    path = str(tmp_path / 'state.sqlite3')
+    trace = full_trace(200)
+    steps = trace[0:len(trace)]
+    assert len(trace) > 2 * TRACE_CHUNK_STEPS
+    trace_id = SharedTraceStore(SharedState(path), ttl=60, max_traces=8).put(trace if packed else steps)
+
+    stored = SharedTraceStore(SharedState(path), ttl=60, max_traces=8).get(trace_id)
+    assert len(stored) == len(trace)
+    assert stored.omitted == 0
+    assert stored[0:5] == steps[0:5]
+    assert stored[TRACE_CHUNK_STEPS - 3:TRACE_CHUNK_STEPS + 3] == steps[TRACE_CHUNK_STEPS - 3:TRACE_CHUNK_STEPS + 3]
+    assert stored[len(trace) - 4:len(trace) + 100] == steps[-4:]
+    assert stored[len(trace):] == []
+
+
+def test_stored_trace_is_capped_and_compact(tmp_path):
+    path = str(tmp_path / 'state.sqlite3')
+    trace = full_trace(2000)
+    trace_id = SharedTraceStore(SharedState(path), ttl=60, max_traces=8, max_steps=5000).put(trace)
+
+    stored = SharedTraceStore(SharedState(path), ttl=60, max_traces=8).get(trace_id)
+    assert len(stored) == 5000
+    assert stored.omitted == len(trace) - 5000
+    assert stored[4990:6000] == trace[4990:5000]
+    # Delta-encoded and compressed: a few bytes per step, not a JSON dict with its stack
+    assert stored_bytes(path, 'SELECT sum(length(steps)) FROM trace_chunks') < 4 * 5000
+
+
+def test_trace_chunks_appear_with_their_entry(tmp_path):
+    path = str(tmp_path / 'state.sqlite3')
+    state = SharedState(path)
+    other = SharedState(path)
+    seen = []
+
+    def chunks():
+        for number in range(3):
+            # Until the entry is written with them, prune() elsewhere cannot see the chunks
+            seen.append(other.get_chunks('abc', 0, 2))
+            yield number, {'steps': [{'step': number}]}
+
+    assert state.put_trace('abc', chunks(), {'total': 3, 'omitted': 0}, 60)
+    assert seen == [[], [], []]
+    other.prune()
+    assert other.get('trace', 'abc') == {'total': 3, 'omitted': 0}
+    assert len(other.get_chunks('abc', 0, 2)) == 3
+
+
+def test_traces_expire_and_are_trimmed(tmp_path):
+    state = SharedState(str(tmp_path / 'state.sqlite3'))
+    store = SharedTraceStore(state, ttl=60, max_traces=2)
+    first = store.put([{'step': 0}])
+    time.sleep(0.01)
+    store.put([{'step': 1}])
+    time.sleep(0.01)
+    store.put([{'step': 2}])
+    assert store.get(first) is None
+    assert store.get('unknown') is None
+
+    expired = SharedTraceStore(state, ttl=-1, max_traces=2).put([{'step': 3}])
+    assert store.get(expired) is None
+
+
+def edit(store, token, text, item):
+    """Insert a character before n{item} through the session ``store`` holds for ``token``"""
+    offset = text.index(f'n{item}<')
+    text = text[:offset] + 'x' + text[offset:]
+    session = store.get(token)
+    with session.lock:
+        pda, valid, stats = session.validate(text, offset)
+        store.update(token, session)
+    assert valid
+    return text, stats
+
+
+def test_edit_session_resumes_in_another_process(tmp_path):
+    path = str(tmp_path / 'state.sqlite3')
+    text = xml_text(400)
+    session = EditSession('summary')
+    session.validate(text)
+    workers = [SharedSessionStore(SharedState(path), ttl=60, max_sessions=8) for _ in range(2)]
+    token = workers[0].put(session)
+
+    reference = EditSession('summary')
+    reference.validate(text)
+    for number in range(6):
+        text, stats = edit(workers[number % 2], token, text, 100 + number)
+        assert stats['converged']
+        reference.validate(text)
+
+    # Each edit is logged as itself, not as another copy of the text and its checkpoints
+    copy = stored_bytes(path, 'SELECT length(record) FROM session_log WHERE token = ? AND version = 1', (token,))
+    edits = stored_bytes(path, 'SELECT max(length(record)) FROM session_log WHERE token = ? AND version > 1', (token,))
+    assert copy > len(text) // 20
+    assert edits < 100
+
+    restored = SharedSessionStore(SharedState(path), ttl=60, max_sessions=8).get(token)
+    assert restored.text == text
+    assert restored.checkpoints == reference.checkpoints
+    assert restored.outcome == reference.outcome
+
+
+def test_edit_session_log_is_rebased(tmp_path, monkeypatch):
+    monkeypatch.setattr(pda_state, 'SESSION_LOG_EDITS', 2)
+    path = str(tmp_path / 'state.sqlite3')
+    text = xml_text(50)
+    session = EditSession('summary')
+    session.validate(text)
+    store = SharedSessionStore(SharedState(path), ttl=60, max_sessions=8)
+    token = store.put(session)
+    for number in range(5):
+        text, _ = edit(store, token, text, 10 + number)
+
+    versions = stored_bytes(path, 'SELECT group_concat(version) FROM session_log WHERE token = ?', (token,))
+    assert versions == '4,5,6'
+    assert SharedSessionStore(SharedState(path), ttl=60, max_sessions=8).get(token).text == text
+
+
+def test_edit_session_moved_on_elsewhere_is_saved_in_full(tmp_path):
+    path = str(tmp_path / 'state.sqlite3')
+    text = xml_text(50)
+    session = EditSession('summary')
+    session.validate(text)
+    first = SharedSessionStore(SharedState(path), ttl=60, max_sessions=8)
+    second = SharedSessionStore(SharedState(path), ttl=60, max_sessions=8)
+    token = first.put(session)
+    stale = first.get(token)
+    edit(second, token, text, 10)
+
+    # ``first`` still holds version 1; its edit wins as a full copy
+    other = xml_text(51)
+    with stale.lock:
+        stale.validate(other, other.index('n50'))
+        first.update(token, stale)
+    assert second.get(token).text == other
+
+
+def test_job_visible_from_another_manager(tmp_path):
+    path = str(tmp_path / 'state.sqlite3')
+    document = tmp_path / 'a.xml'
+    document.write_text(xml_text(3))
+    owner = JobManager(max_workers=1, state=SharedState(path))
+    other = JobManager(max_workers=1, state=SharedState(path))
+    try:
+        job = owner.submit([{'name': 'a.xml', 'path': str(document)}], 'xml', workers=1, use_cache=False)
+        deadline = time.monotonic() + 10
+        while not other.get(job.id).done and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        shared = other.get(job.id)
+        assert shared.status == 'completed'
+        assert shared.snapshot()['completed_files'] == 1
+        assert 'results' not in shared.snapshot()
+        assert shared.snapshot(include_results=True)['results'][0]['valid']
+        assert [listed.id for listed in other.list()] == [job.id]
+        assert other.get('unknown') is None
+    finally:
+        owner.shutdown()
+        other.shutdown()
+
+
+def test_job_of_exited_owner_reports_failed(tmp_path):
+    state = SharedState(str(tmp_path / 'state.sqlite3'))
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    job = {'job_id': 'abc', 'status': 'running', 'created': time.time(), 'error': None}
+    state.put('job', 'abc', {'owner': process.pid, 'job': job}, 60)
+
+    manager = JobManager(max_workers=1, state=state)
+    try:
+        shared = manager.get('abc')
+        assert shared.done
+        assert shared.snapshot()['status'] == 'failed'
+        assert json.dumps(shared.snapshot())
+    finally:
+        manager.shutdown()
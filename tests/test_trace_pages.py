@@ -0,0 +1,48 @@
+"""Long histories sent a page at a time"""
+
+import uuid
+
+import pytest
+
+import app as app_module
+from pda_cache import get_cache, digest
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def xml_text():
+    # Unique, so the result cache never answers for it
+    return f'<root><item><name>{uuid.uuid4().hex}</name></item></root>'
+
+
+@pytest.mark.parametrize('page_size', ['abc', '1.5', None, [10]])
+def test_bad_page_size_rejected_before_validating(client, page_size):
+    text = xml_text()
+    response = client.post('/validate', json={'type': 'xml', 'text': text, 'page_size': page_size})
+    assert response.status_code == 400
+    assert 'page_size' in response.get_json()['error']
+    cache = get_cache()
+    assert cache.get(cache.make_key('xml', digest(text), 'full')) is None
+
+
+def test_bad_page_size_rejected_for_uploads(client):
+    response = client.post('/process-upload', json={
+        'file_info': {'name': 'a.xml', 'path': 'missing.xml'},
+        'validator_type': 'xml',
+        'page_size': 'abc'
+    })
+    assert response.status_code == 400
+    assert 'page_size' in response.get_json()['error']
+
+
+def test_numeric_page_size_pages_history(client):
+    response = client.post('/validate', json={'type': 'xml', 'text': xml_text(), 'page_size': '3'})
+    result = response.get_json()
+    assert response.status_code == 200
+    assert len(result['history']) == 3
+    page = client.get(f"/trace/{result['trace_id']}?offset=3&limit=2").get_json()
+    assert [step['step'] for step in page['steps']] == [4, 5]
+    assert page['omitted'] == 0
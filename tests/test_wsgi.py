@@ -0,0 +1,29 @@
+"""The production entry point"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import wsgi
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_does_not_load_app():
+    code = "import sys, wsgi; print('app' in sys.modules)"
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == 'False'
+
+
+def test_app_is_created_on_first_access():
+    from wsgi import app
+    assert app is sys.modules['app'].app
+    assert app.config['ENV'] == 'production'
+    assert wsgi.app is app
+
+
+def test_unknown_attribute_raises():
+    with pytest.raises(AttributeError, match='missing'):
+        wsgi.missing
@@ -1,39 +1,111 @@
 """
 Production WSGI server using Waitress
+
+PDA_WEB_WORKERS above 1 serves from that many processes (pda_prefork),
+since one process validates on one core; 0 starts one per CPU.
 """
 
 import os
 import sys
+import tempfile
 from waitress import serve
 
 # Add current directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app import app
+from pda_metrics import clear_directory
+from pda_prefork import (Supervisor, configure_logging, prefork_supported, reuse_port_supported, DEFAULT_THREADS,
+                         DEFAULT_CONNECTION_LIMIT, DEFAULT_BACKLOG, DEFAULT_GRACEFUL_TIMEOUT)
+from pda_rules import get_rules, install_reload_signal
+from pda_state import remove_state
+
+
+def create_app():
+    """The app configured for production; prefork workers call this too"""
+    from app import app
+
+    # Configure for production
+    app.config.update(
+        ENV='production',
+        DEBUG=False,
+        TESTING=False
+    )
+
+    # Create upload folder
+    os.makedirs(app.config.get('UPLOAD_FOLDER', 'uploads'), exist_ok=True)
+
+    # Reload rules.json on SIGHUP without restarting
+    install_reload_signal()
+    return app
+
+
+def __getattr__(name):
+    """``wsgi:app`` for WSGI servers, created on first use so that the
+    prefork supervisor, which only imports this module, never loads the app"""
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == "__main__":
     # Get port from Railway
     port = int(os.environ.get("PORT", 5000))
-    
+    workers = int(os.environ.get("PDA_WEB_WORKERS", 1))  # Server processes, 0 = one per CPU
+    threads = int(os.environ.get("PDA_WEB_THREADS", DEFAULT_THREADS))  # Request threads per process
+    connection_limit = int(os.environ.get("PDA_WEB_CONNECTION_LIMIT", DEFAULT_CONNECTION_LIMIT))  # Open connections per process
+    backlog = int(os.environ.get("PDA_WEB_BACKLOG", DEFAULT_BACKLOG))  # Connections queued before accept
+    graceful_timeout = float(os.environ.get("PDA_WEB_GRACEFUL_TIMEOUT", DEFAULT_GRACEFUL_TIMEOUT))  # Seconds to finish requests on SIGTERM
+    reuse_port = os.environ.get("PDA_WEB_REUSE_PORT", "").lower() in ("1", "true", "yes")  # A socket per process
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    if workers > 1 and not prefork_supported():
+        print("⚠️  Several workers need a POSIX system, starting one")
+        workers = 1
+    if reuse_port and not reuse_port_supported():
+        print("⚠️  SO_REUSEPORT is not available, sharing one socket")
+        reuse_port = False
+
     print("=" * 60)
     print("🚀 PDA SIMULATOR - Production Server (Waitress)")
     print("=" * 60)
     print(f"🌐 Host: 0.0.0.0:{port}")
     print(f"🐍 Python: {sys.version}")
+    print(f"👷 Workers: {workers} x {threads} threads")
     print("=" * 60)
-    
-    # Configure for production
-    app.config.update(
-        ENV='production',
-        DEBUG=False,
-        TESTING=False
-    )
-    
-    # Create upload folder
-    upload_folder = app.config.get('UPLOAD_FOLDER', 'uploads')
-    os.makedirs(upload_folder, exist_ok=True)
-    print(f"📁 Upload folder: {upload_folder}")
-    
-    # Start Waitress production server
-    print("⚙️  Starting Waitress production server...")
-    serve(app, host='0.0.0.0', port=port, threads=4)
\ No newline at end of file
+
+    if workers > 1:
+        # Each worker has its own memory: uploads go to disk so any worker can
+        # validate them, traces, edit sessions and jobs to a shared SQLite
+        # file, and metrics are merged from a shared directory
+        os.environ.setdefault("PDA_UPLOAD_MEMORY_BYTES", "0")
+        state_path = os.environ.setdefault("PDA_STATE_PATH", os.path.join(tempfile.gettempdir(), f"pda-state-{port}.sqlite3"))
+        remove_state(state_path)
+        metrics_dir = os.environ.setdefault("PDA_METRICS_DIR", os.path.join(tempfile.gettempdir(), f"pda-metrics-{port}"))
+        os.makedirs(metrics_dir, exist_ok=True)
+        clear_directory(metrics_dir)
+        print(f"🗄️  Shared state: {state_path}")
+        print(f"📊 Metrics: {metrics_dir}")
+
+        rules = get_rules()
+        print(f"📜 Rules: {rules.source} (version {rules.version}, reload with SIGHUP)")
+        print(f"⚙️  Starting {workers} Waitress workers...")
+        configure_logging()
+        Supervisor(
+            'wsgi:create_app', '0.0.0.0', port, workers,
+            threads=threads,
+            connection_limit=connection_limit,
+            backlog=backlog,
+            graceful_timeout=graceful_timeout,
+            reuse_port=reuse_port
+        ).run()
+    else:
+        app = create_app()
+        print(f"📁 Upload folder: {app.config.get('UPLOAD_FOLDER', 'uploads')}")
+        rules = get_rules()
+        print(f"📜 Rules: {rules.source} (version {rules.version}, reload with SIGHUP)")
+
+        # Start Waitress production server
+        print("⚙️  Starting Waitress production server...")
+        serve(app, host='0.0.0.0', port=port, threads=threads,
+              connection_limit=connection_limit, backlog=backlog)